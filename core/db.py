@@ -0,0 +1,80 @@
+"""
+Database tuning shared by the settings profiles and the benchmark commands.
+"""
+import os
+
+# Applied on every new SQLite connection through OPTIONS['init_command'].
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',      # Readers no longer block the writer (and vice versa)
+    'synchronous': 'NORMAL',    # Safe with WAL: fsync at checkpoints instead of every commit
+    'busy_timeout': 5000,       # ms to wait for a lock before raising "database is locked"
+    'mmap_size': 134217728,     # 128 MiB of memory-mapped reads
+    'cache_size': -20000,       # Page cache per connection; negative means KiB (~20 MB)
+    'temp_store': 'MEMORY',     # Sorts/temp B-trees for ORDER BY and GROUP BY stay in RAM
+}
+
+
+def sqlite_init_command(pragmas=None):
+    """The PRAGMAs as a ';'-separated init_command for DATABASES OPTIONS."""
+    pragmas = SQLITE_PRODUCTION_PRAGMAS if pragmas is None else pragmas
+    return ';'.join(f"PRAGMA {name}={value}" for name, value in pragmas.items())
+
+
+def sqlite_production_options():
+    """
+    OPTIONS for the sqlite3 backend in production. BEGIN IMMEDIATE takes the
+    write lock up front, so a transaction that reads and then writes waits
+    for busy_timeout instead of failing on the lock upgrade.
+    """
+    return {
+        'init_command': sqlite_init_command(),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 5,
+    }
+
+
+def database_config(base_dir):
+    """
+    DATABASES['default'] from the environment. DATABASE_ENGINE=postgresql
+    switches to PostgreSQL with a psycopg connection pool (needs
+    psycopg[pool]); anything else keeps the SQLite file next to manage.py.
+    """
+    engine = os.environ.get('DATABASE_ENGINE', 'sqlite').lower()
+    if engine in ('postgres', 'postgresql'):
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'invoicing'),
+            'USER': os.environ.get('POSTGRES_USER', 'invoicing'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Django's built-in pool; CONN_MAX_AGE must stay 0 when it is on
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX', 10)),
+                    'timeout': int(os.environ.get('POSTGRES_POOL_TIMEOUT', 10)),
+                },
+            },
+        }
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': base_dir / 'db.sqlite3',
+    }
+
+
+def replica_configs(default):
+    """
+    Read-replica aliases ('replica_1', ...) from the environment: for SQLite,
+    DATABASE_REPLICA_PATHS lists replica files; for PostgreSQL,
+    POSTGRES_REPLICA_HOSTS lists replica hosts sharing the primary's
+    credentials. Tests use the primary's test database for every replica.
+    """
+    if default['ENGINE'] == 'django.db.backends.sqlite3':
+        targets = [('NAME', value) for value in os.environ.get('DATABASE_REPLICA_PATHS', '').split(',') if value]
+    else:
+        targets = [('HOST', value) for value in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',') if value]
+    return {
+        f'replica_{number}': {**default, key: value, 'TEST': {'MIRROR': 'default'}}
+        for number, (key, value) in enumerate(targets, start=1)
+    }
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
+from .db import database_config, replica_configs
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -58,6 +60,10 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'documents.middleware.PrimaryPinMiddleware', # Needs the session
+    'documents.middleware.RequestProfilingMiddleware', # Needs request.user, so after AuthenticationMiddleware
+    # Keep last so its 'view' timing covers little beyond the view itself
+    'documents.middleware.QueryInstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -84,15 +90,44 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'core.wsgi.application'
 
+# Keeps the metrics and prep list cache files of the test suite out of the working tree
+TEST_RUNNER = 'core.test_runner.TempDirTestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite by default; set DATABASE_ENGINE=postgresql (and POSTGRES_*) for PostgreSQL. See core/db.py
 DATABASES = {
+    'default': database_config(BASE_DIR),
+}
+# Optional read replicas (DATABASE_REPLICA_PATHS / POSTGRES_REPLICA_HOSTS), used by documents.routers
+DATABASES.update(replica_configs(DATABASES['default']))
+DATABASE_ROUTERS = ['documents.routers.ReplicaRouter']
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/ref/settings/#caches
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered list rows (documents.caching). Keys carry a version, so entries never go stale;
+    # LocMemCache evicts the least recently used once MAX_ENTRIES is reached.
+    'document_rows': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'document-rows',
+        'TIMEOUT': 7 * 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Kitchen prep lists (documents.production). Files are shared by every worker on the host,
+    # so an order change invalidates the lists all of them serve; LocMemCache would not.
+    'prep_lists': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'prep_lists',
+        'TIMEOUT': 3600,
+    },
 }
 
 
@@ -172,4 +207,73 @@ ACCOUNT_LOGOUT_REDIRECT_URL = '/'
 # ACCOUNT_AUTHENTICATION_METHOD = 'email'
 # ACCOUNT_EMAIL_REQUIRED = True
 # ACCOUNT_USERNAME_REQUIRED = False
-# ACCOUNT_SIGNUP_PASSWORD_ENTER_TWICE = True
\ No newline at end of file
+# ACCOUNT_SIGNUP_PASSWORD_ENTER_TWICE = True
+
+
+# Request instrumentation (documents.middleware.QueryInstrumentationMiddleware)
+# -------------------------------------------------------------------------
+DOCUMENTS_INSTRUMENTATION = True
+DOCUMENTS_INSTRUMENTATION_PATHS = ['/docs/', '/admin/documents/']
+DOCUMENTS_DUPLICATE_QUERY_THRESHOLD = 10 # Same query this many times in one request = likely N+1
+DOCUMENTS_SLOW_QUERY_MS = 100 # Log the call site of any single query slower than this
+
+# On-demand profiling (documents.middleware.RequestProfilingMiddleware)
+# -------------------------------------------------------------------------
+DOCUMENTS_PROFILE_PARAM = '_profile' # e.g. /docs/invoice/12/pdf/?_profile=1 (staff only)
+DOCUMENTS_PROFILE_DIR = BASE_DIR / 'profiles'
+DOCUMENTS_PROFILE_KEEP = 50 # Older profiles are deleted
+DOCUMENTS_PROFILE_SAMPLE_INTERVAL = 0.005 # Seconds between stack samples for the .collapsed file
+
+# Metrics (documents.metrics, served at /metrics)
+# -------------------------------------------------------------------------
+DOCUMENTS_METRICS_DIR = BASE_DIR / 'metrics' # One file per worker process, pruned once it exits; None writes none (tests: a temp dir)
+DOCUMENTS_METRICS_FLUSH_INTERVAL = 5 # Seconds between writes of a worker's file
+DOCUMENTS_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# Behind a reverse proxy every request comes from an allowed address: set a token for the
+# scraper (Authorization: Bearer <token>; staff users need none) or block /metrics at the proxy
+DOCUMENTS_METRICS_TOKEN = None
+
+# Read replicas (documents.routers; views opt in with @use_read_replica)
+# -------------------------------------------------------------------------
+DOCUMENTS_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DOCUMENTS_REPLICA_PIN_SECONDS = 10 # After a write, the user's reads stay on the primary this long
+
+# Backups (manage.py backup_db)
+# -------------------------------------------------------------------------
+DOCUMENTS_BACKUP_DIR = BASE_DIR / 'backups'
+DOCUMENTS_BACKUP_KEEP = 14 # Snapshots kept; older ones are deleted after each backup
+
+# List row caching (documents.caching)
+# -------------------------------------------------------------------------
+DOCUMENTS_ROW_CACHE = 'document_rows' # Alias in CACHES; point it at DummyCache to render every row
+
+# Template preloading (documents.templates_preload)
+# -------------------------------------------------------------------------
+DOCUMENTS_PRELOAD_TEMPLATES = False # Compile the documents templates at startup; on in settings_production
+
+# Kitchen prep and purchasing lists (documents.production)
+# -------------------------------------------------------------------------
+DOCUMENTS_PREP_LIST_CACHE = 'prep_lists' # Alias in CACHES; must be shared between workers (not LocMemCache) for invalidation to reach all
+DOCUMENTS_PREP_LIST_TIMEOUT = 3600 # Seconds; signals invalidate on change, this only bounds memory use
+DOCUMENTS_PREP_LIST_MAX_DAYS = 62 # Longest date range one prep or purchasing list may cover
+
+# Bank statement reconciliation (documents.reconciliation)
+# -------------------------------------------------------------------------
+DOCUMENTS_RECONCILE_TOLERANCE = '1.00' # RM; a payer's amount this close to one open balance matches it (bank charges)
+
+# Bulk finalize PDFs (documents.bulk)
+# -------------------------------------------------------------------------
+DOCUMENTS_PDF_DIR = None # e.g. BASE_DIR / 'pdfs'; where "Finalize and render PDFs" writes; None turns it off
+DOCUMENTS_PDF_WORKERS = 1 # Worker processes rendering them, started by each web process on first use
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # INFO logs one JSON line per instrumented request; WARNING only the N+1/slow query call sites
+        'documents.performance': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
@@ -0,0 +1,54 @@
+"""
+Production profile. Tunes SQLite for a single-server deployment.
+
+Use with DJANGO_SETTINGS_MODULE=core.settings_production. Everything not
+overridden here comes from core/settings.py.
+"""
+import os
+
+from .db import sqlite_production_options
+from .settings import *  # noqa: F401,F403
+
+
+DEBUG = os.environ.get('DJANGO_DEBUG', '') == '1'
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+# Requests reach /metrics through the proxy, so the allowed addresses alone do not restrict it
+DOCUMENTS_METRICS_TOKEN = os.environ.get('DOCUMENTS_METRICS_TOKEN') or None
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].update({
+        'OPTIONS': sqlite_production_options(),
+        # Keep connections open between requests so the PRAGMAs and page cache are
+        # paid for once per worker, not once per request.
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+    })
+# PostgreSQL uses the connection pool configured in core.db.database_config instead.
+
+# Share rendered list rows between workers when Redis is available. Configure it with
+# maxmemory-policy allkeys-lru so the least recently used rows are evicted.
+if os.environ.get('DOCUMENTS_ROW_CACHE_URL'):
+    CACHES['document_rows'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['DOCUMENTS_ROW_CACHE_URL'],
+        'TIMEOUT': 7 * 24 * 3600,
+        'KEY_PREFIX': 'rows',
+    }
+    # Prep list invalidation has to reach every worker
+    DOCUMENTS_PREP_LIST_CACHE = 'document_rows'
+
+# Templates are read and compiled once per worker and kept (django.template.loaders.cached),
+# and the documents/ and documents/pdf/ templates are compiled at startup rather than on
+# their first request. Measure the effect with manage.py benchmark_templates.
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS'].update({
+    'debug': False,
+    'loaders': [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ],
+})
+DOCUMENTS_PRELOAD_TEMPLATES = True
@@ -0,0 +1,30 @@
+"""
+Test runner keeping what the suite writes out of the working tree: the
+metrics files go to a temporary directory, removed when the run ends, and
+prep lists are cached in memory rather than in files.
+"""
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TempDirTestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.tmpdir = tempfile.mkdtemp(prefix='invoicing-tests-')
+        caches = {**settings.CACHES,
+                  'prep_lists': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'prep-lists'}}
+        self.overrides = override_settings(DOCUMENTS_METRICS_DIR=Path(self.tmpdir) / 'metrics', CACHES=caches)
+        self.overrides.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.overrides.disable()
+        # Nothing more to write, including the metrics flush at exit
+        override_settings(DOCUMENTS_METRICS_DIR=None).enable()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
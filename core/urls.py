@@ -20,11 +20,17 @@ from django.views.generic import TemplateView
 from django.contrib import admin
 from django.urls import path, include
 
+from documents import views as documents_views
+
 urlpatterns = [
     path('', TemplateView.as_view(template_name='home.html'), name='home'),
+    # Must come before admin.site.urls, which would treat 'profiles' as a model name
+    path('admin/documents/profiles/', documents_views.profile_list_view, name='profile_list'),
+    path('admin/documents/profiles/<str:name>.<str:kind>', documents_views.profile_download_view, name='profile_download'),
     path('admin/', admin.site.urls),
     path('docs/', include('documents.urls', namespace='documents')),
     path('accounts/', include('allauth.urls')),
+    path('metrics', documents_views.metrics_view, name='metrics'),
 ]
 
 # Serve media files during development
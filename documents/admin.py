@@ -1,32 +1,122 @@
 from django.utils.html import format_html, mark_safe
 from solo.admin import SingletonModelAdmin # Import SoloAdmin
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
 from django.urls import reverse
 from django.apps import apps
 
 # Register your models here.
 from .models import (
-    Client, MenuItem, Quotation, QuotationItem, Invoice, InvoiceItem, 
-    Setting, Payment, Order, OrderItem, 
+    Client, MenuItem, Ingredient, RecipeLine, Quotation, QuotationItem, Invoice, InvoiceItem, 
+    Setting, Payment, PaymentReceipt, Order, OrderItem, 
     DeliveryOrder, DeliveryOrderItem, DeliveryOrderStatus,
     CreditNote, CreditNoteItem, CreditNoteStatus
 )
-from .forms import DeliveryOrderItemForm
+from .bulk import cancel_documents, finalize_documents, queue_pdfs, revert_documents
+from .forms import BaseDeliveryOrderItemFormSet, DeliveryOrderItemForm
+from .fulfillment import create_delivery_orders
+from .receipts import allocate_receipt
+from .reports import annotate_totals
+
+
+class ListProjectionChangeList(ChangeList):
+    """Loads the page's rows with the model's for_list() projection."""
+
+    def get_results(self, request):
+        self.queryset = self.queryset.for_list()
+        super().get_results(request)
+
+
+class ListProjectionAdmin(admin.ModelAdmin):
+    """
+    Changelist rows skip the large text fields (see ListQuerySet.for_list).
+    Actions and the change form still work on full rows.
+    """
+
+    def get_changelist(self, request, **kwargs):
+        return ListProjectionChangeList
+
+
+class BulkLifecycleActionsMixin:
+    """
+    Finalize, revert and cancel the selected quotations or invoices in one
+    transaction (see documents.bulk). Documents in the wrong status are
+    skipped and counted in the message.
+    """
+    actions = ['finalize_selected', 'finalize_selected_with_pdfs', 'revert_selected', 'cancel_selected']
+
+    def _report(self, request, verb, done, skipped, reason):
+        name = self.model._meta.verbose_name
+        self.message_user(request, f"{verb} {done} {name}(s).", messages.SUCCESS if done else messages.INFO)
+        if skipped:
+            self.message_user(request, f"Skipped {skipped} {name}(s) {reason}.", messages.WARNING)
+
+    def _finalize(self, request, queryset, with_pdfs):
+        finalized, skipped = finalize_documents(self.model, queryset.values_list('pk', flat=True))
+        self._report(request, "Finalized", len(finalized), skipped, "not in Draft")
+        if with_pdfs:
+            queued = queue_pdfs(self.model, finalized)
+            if queued:
+                self.message_user(request, f"Rendering {queued} PDF(s) in the background.", messages.INFO)
+            elif finalized:
+                self.message_user(request, "PDFs not queued: set DOCUMENTS_PDF_DIR and install WeasyPrint.",
+                                  messages.WARNING)
+
+    @admin.action(description="Finalize selected drafts")
+    def finalize_selected(self, request, queryset):
+        self._finalize(request, queryset, with_pdfs=False)
+
+    @admin.action(description="Finalize selected drafts and render their PDFs")
+    def finalize_selected_with_pdfs(self, request, queryset):
+        self._finalize(request, queryset, with_pdfs=True)
+
+    @admin.action(description="Revert selected sent documents to draft")
+    def revert_selected(self, request, queryset):
+        reverted, skipped = revert_documents(self.model, queryset.values_list('pk', flat=True))
+        self._report(request, "Reverted", reverted, skipped, "not in Sent")
+
+    @admin.action(description="Cancel selected")
+    def cancel_selected(self, request, queryset):
+        cancelled, skipped = cancel_documents(self.model, queryset.values_list('pk', flat=True))
+        reason = "already settled, paid or credited, or not open" if self.model is Invoice else "not in Draft or Sent"
+        self._report(request, "Cancelled", cancelled, skipped, reason)
 
 
 @admin.register(Client)
-class ClientAdmin(admin.ModelAdmin):
+class ClientAdmin(ListProjectionAdmin):
     """Configuration for the Client model in the Django admin interface"""
     list_display = ("name", "email", "phone", "created_at")
     search_fields = ("name", "email")
     list_filter = ("created_at",)
 
 
+class RecipeLineInline(admin.TabularInline):
+    """The menu item's recipe: ingredients per unit of the menu item."""
+    model = RecipeLine
+    extra = 1
+    fields = ('ingredient', 'quantity', 'ingredient_unit')
+    readonly_fields = ('ingredient_unit',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
+    @admin.display(description="Unit")
+    def ingredient_unit(self, obj):
+        return obj.ingredient.unit if obj.ingredient_id else "-"
+
+
+@admin.register(Ingredient)
+class IngredientAdmin(admin.ModelAdmin):
+    list_display = ('name', 'unit', 'updated_at')
+    search_fields = ('name', 'notes')
+
+
 @admin.register(MenuItem)
-class MenuItemAdmin(admin.ModelAdmin):
+class MenuItemAdmin(ListProjectionAdmin):
     """
     Configuration for the MenuItem model in the Django admin interface.
     """
+    inlines = [RecipeLineInline]
     list_display = ('name', 'unit_price', 'unit', 'is_active', 'updated_at')
     list_filter = ('is_active', 'created_at', 'updated_at')
     search_fields = ('name', 'description', 'unit')
@@ -47,13 +137,14 @@ class QuotationItemInline(admin.TabularInline): # Or use admin.StackedInline for
 
 
 @admin.register(Quotation)
-class QuotationAdmin(admin.ModelAdmin):
+class QuotationAdmin(BulkLifecycleActionsMixin, ListProjectionAdmin):
     """
     Configuration for the Quotation model in the Django admin interface.
     """
     list_display = ('quotation_number', 'client', 'title', 'status', 'version', 'issue_date', 'valid_until', 'display_total') # Removed placeholder 'total_amount' for now
     list_filter = ('status', 'client', 'issue_date', 'created_at')
     search_fields = ('quotation_number', 'client__name', 'title', 'items__menu_item__name')
+    list_select_related = ('client',)
     # Make auto-generated/timestamp fields read-only
     readonly_fields = (
         'quotation_number', 'version', 'created_at', 'updated_at', ''
@@ -109,13 +200,17 @@ class QuotationAdmin(admin.ModelAdmin):
     # Embed the item editor within the quote page
     inlines = [QuotationItemInline]
 
+    def get_queryset(self, request):
+        # Totals for every row in the same query (see documents.reports)
+        return annotate_totals(super().get_queryset(request))
+
     def display_total(self, obj):
-         # Call the 'total' property from the Quotation model
+         # The db_grand_total annotation from get_queryset()
          # Format it nicely for display (optional, but good)
          if not obj.pk: return "-"
          try:
              # Format as currency, you might need locale settings or a formatting library later
-             return f"RM {obj.grand_total:,.2f}"
+             return f"RM {obj.db_grand_total:,.2f}"
          except Exception:
              return "Error" # Handle potential calculation errors gracefully
     display_total.short_description = 'Total Amount' # Column header
@@ -142,7 +237,7 @@ class QuotationAdmin(admin.ModelAdmin):
         Only show if the quotation exists and is in a state that can be revised (e.g., Sent, Accepted).
         """
         allowed_statuses = [
-            Quotation.Status.SENT, Quotation.Status.ACCEPTED, Quotation.Status.REJECTED
+            Quotation.Status.SENT, Quotation.Status.ACCEPTED, Quotation.Status.REJECTED, Quotation.Status.EXPIRED
         ]
 
         # Check if the object has been saved (has a PK) and its status allows revision
@@ -171,6 +266,7 @@ class QuotationAdmin(admin.ModelAdmin):
             Quotation.Status.ACCEPTED,
             Quotation.Status.REJECTED,
             Quotation.Status.SUPERSEDED,
+            Quotation.Status.EXPIRED,
             # Exclude DRAFT
         ]
         if obj.pk and obj.status in final_statuses:
@@ -226,14 +322,15 @@ class InvoiceItemInline(admin.TabularInline):
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(BulkLifecycleActionsMixin, ListProjectionAdmin):
     list_display = ('invoice_number', 'client', 'status', 'issue_date', 'due_date', 'display_grand_total', 'display_balance_due')
     list_filter = ('status', 'client', 'issue_date')
     search_fields = ('invoice_number', 'client__name', 'items__menu_item__name')
+    list_select_related = ('client',)
     # Make auto-generated fields read-only
     readonly_fields = (
         'invoice_number', 'created_at', 'updated_at', 
-        'display_amount_paid', 'display_balance_due', 'display_grand_total_detail',
+        'display_amount_paid', 'display_amount_credited', 'display_balance_due', 'display_grand_total_detail',
         'related_order',
         'finalize_invoice_link',
         'revert_to_draft_link',
@@ -250,7 +347,7 @@ class InvoiceAdmin(admin.ModelAdmin):
             'view_final_pdf_link',
             )}),
         ('Dates', {'fields': ('issue_date', 'due_date')}),
-        ('Payment Status', {'fields': ('display_grand_total_detail', 'display_amount_paid', 'display_balance_due')}),
+        ('Payment Status', {'fields': ('display_grand_total_detail', 'display_amount_paid', 'display_amount_credited', 'display_balance_due')}),
         # --- Add Discount Section ---
         ('Discount', {'fields': ('discount_type', 'discount_value')}),
         ('Content', {'fields': ('terms_and_conditions', 'payment_details', 'notes')}),
@@ -263,11 +360,14 @@ class InvoiceAdmin(admin.ModelAdmin):
     # Embed the InvoiceItem editor
     inlines = [InvoiceItemInline]
 
-    
+    def get_queryset(self, request):
+        # Totals, payments and credits for every row in the same query (see documents.reports)
+        return annotate_totals(super().get_queryset(request))
+
     def display_grand_total(self, obj): # Renamed for list view
          """Formats grand_total for list display."""
          if not obj.pk: return "-"
-         try: return f"RM {obj.grand_total:,.2f}"
+         try: return f"RM {obj.db_grand_total:,.2f}"
          except Exception: return "Error"
     display_grand_total.short_description = 'Total Amount'
 
@@ -286,10 +386,17 @@ class InvoiceAdmin(admin.ModelAdmin):
          except Exception: return "Error"
     display_amount_paid.short_description = 'Amount Paid'
 
+    def display_amount_credited(self, obj):
+         """Formats amount_credited (issued and applied credit notes) for detail view."""
+         if not obj.pk: return "-"
+         try: return f"RM {obj.amount_credited:,.2f}"
+         except Exception: return "Error"
+    display_amount_credited.short_description = 'Credited'
+
     def display_balance_due(self, obj):
          """Formats balance_due for list and detail view."""
          if not obj.pk: return "-"
-         try: return f"RM {obj.balance_due:,.2f}"
+         try: return f"RM {obj.db_balance:,.2f}"
          except Exception: return "Error"
     display_balance_due.short_description = 'Balance Due'
 
@@ -322,6 +429,7 @@ class InvoiceAdmin(admin.ModelAdmin):
             Invoice.Status.SENT.value,
             Invoice.Status.PAID.value,
             Invoice.Status.PARTIALLY_PAID.value,
+            Invoice.Status.OVERDUE.value,
             # Exclude DRAFT, CANCELLED
         ]
         if obj.pk and obj.status in final_statuses:
@@ -362,14 +470,14 @@ class SettingAdmin(SingletonModelAdmin):
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ListProjectionAdmin):
     """Admin interface for the Payment model."""
     list_display = ('get_invoice_number', 'payment_date', 'amount_display', 'payment_method', 'reference_number', 'created_at')
     list_filter = ('payment_date', 'payment_method', 'invoice__client')
     search_fields = ('invoice__invoice_number', 'invoice__client__name', 'reference_number', 'notes')
-    list_select_related = ('invoice', 'invoice__client') # Performance optimization
+    list_select_related = ('invoice',) # Performance optimization
     date_hierarchy = 'payment_date' # Adds date navigation
-    readonly_fields = ('created_at', 'updated_at') # Timestamps shouldn't be editable
+    readonly_fields = ('receipt', 'created_at', 'updated_at') # Timestamps shouldn't be editable
     list_per_page = 25 # Show more items per page if desired
 
     # Use methods to display related fields nicely and format currency
@@ -400,6 +508,65 @@ class PaymentAdmin(admin.ModelAdmin):
     # fieldsets = ( ... )
 
 
+class ReceiptAllocationInline(admin.TabularInline):
+    """The payments a receipt was split into. Created by allocation, not edited here."""
+    model = Payment
+    fk_name = 'receipt'
+    fields = ('invoice', 'amount', 'payment_date')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('invoice')
+
+
+@admin.register(PaymentReceipt)
+class PaymentReceiptAdmin(admin.ModelAdmin):
+    """
+    A receipt is allocated to the client's open invoices, oldest due date
+    first, when it is created. The action allocates what is left over after
+    more invoices have been raised.
+    """
+    list_display = ('receipt_date', 'client', 'amount', 'payment_method', 'reference_number', 'created_at')
+    list_filter = ('receipt_date', 'payment_method')
+    search_fields = ('client__name', 'reference_number', 'notes')
+    list_select_related = ('client',)
+    date_hierarchy = 'receipt_date'
+    readonly_fields = ('display_unallocated', 'created_at', 'updated_at')
+    inlines = [ReceiptAllocationInline]
+    actions = ['allocate_selected']
+
+    @admin.display(description="Unallocated")
+    def display_unallocated(self, obj):
+        if not obj.pk:
+            return "-"
+        return f"RM {obj.unallocated:,.2f}"
+
+    def _allocate(self, request, receipt):
+        payments = allocate_receipt(receipt)
+        if payments:
+            self.message_user(request, f"Receipt of RM {receipt.amount:,.2f} allocated to {len(payments)} invoice(s).",
+                              messages.SUCCESS)
+        unallocated = receipt.unallocated
+        if unallocated > 0:
+            self.message_user(request, f"RM {unallocated:,.2f} of the receipt from {receipt.client.name} "
+                                       "is unallocated: no open invoice balance is left.", messages.WARNING)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if not change:
+            self._allocate(request, form.instance)
+
+    @admin.action(description="Allocate unallocated amounts to open invoices")
+    def allocate_selected(self, request, queryset):
+        for receipt in queryset.select_related('client'):
+            self._allocate(request, receipt)
+
+
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 1 # Show one empty row for adding items
@@ -414,7 +581,7 @@ class OrderItemInline(admin.TabularInline):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ListProjectionAdmin):
     list_display = ('order_number', 'client', 'title', 'status', 'event_date', 'display_grand_total', 'created_at') # Added total display
     list_filter = ('status', 'client', 'event_date')
     search_fields = ('order_number', 'client__name', 'title', 'items__menu_item__name')
@@ -447,11 +614,29 @@ class OrderAdmin(admin.ModelAdmin):
     )
 
     inlines = [OrderItemInline]
+    actions = ['create_delivery_orders_for_selected']
+
+    @admin.action(description="Create delivery orders for undelivered quantities")
+    def create_delivery_orders_for_selected(self, request, queryset):
+        """One delivery order per selected order, for everything not yet delivered (see documents.fulfillment)."""
+        created, skipped = create_delivery_orders(queryset.values_list('pk', flat=True))
+        if created:
+            numbers = ", ".join(delivery_order.do_number for delivery_order in created[:10])
+            more = f" and {len(created) - 10} more" if len(created) > 10 else ""
+            self.message_user(request, f"Created {len(created)} delivery order(s): {numbers}{more}.", messages.SUCCESS)
+        if skipped:
+            self.message_user(
+                request, f"Skipped {len(skipped)} order(s) that are not confirmed/in progress or have nothing left to deliver.",
+                messages.WARNING)
+
+    def get_queryset(self, request):
+        # Totals for every row in the same query (see documents.reports)
+        return annotate_totals(super().get_queryset(request))
 
     def display_grand_total(self, obj):
          """Formats grand_total for list display."""
          if not obj.pk: return "-"
-         try: return f"RM {obj.grand_total:,.2f}"
+         try: return f"RM {obj.db_grand_total:,.2f}"
          except Exception: return "Error"
     display_grand_total.short_description = 'Total Amount' # Header for list view
 
@@ -525,15 +710,30 @@ class OrderAdmin(admin.ModelAdmin):
 class DeliveryOrderItemInline(admin.TabularInline):
     model = DeliveryOrderItem
     form = DeliveryOrderItemForm
+    formset = BaseDeliveryOrderItemFormSet # Validates quantities against the order's other deliveries
     extra = 1 # Show one empty row for adding items by default
-    fields = ('order_item', 'quantity_delivered', 'notes')
+    fields = ('order_item', 'quantity_delivered', 'remaining_quantity', 'notes')
+    readonly_fields = ('remaining_quantity',)
     # autocomplete_fields = ['order_item'] # We can consider this later for usability
-    # Note: The 'order_item' dropdown will currently show ALL OrderItems from ALL Orders.
-    # We will address filtering this dropdown or adding validation in a future step.
+
+    def remaining_quantity(self, obj):
+        """Left to deliver of the order line once this delivery order is counted (set by the formset)."""
+        line = getattr(obj, 'fulfillment', None)
+        if line is None or obj.quantity_delivered is None:
+            return "-"
+        left = line.remaining - obj.quantity_delivered
+        if left < 0:
+            return f"{-left} over"
+        return f"{left} of {line.ordered}"
+    remaining_quantity.short_description = 'Remaining'
+
+    def get_queryset(self, request):
+        # Each row shows str(item), which reads the delivery order and the menu item
+        return super().get_queryset(request).select_related('delivery_order', 'order_item__menu_item')
 
 
 @admin.register(DeliveryOrder)
-class DeliveryOrderAdmin(admin.ModelAdmin):
+class DeliveryOrderAdmin(ListProjectionAdmin):
     list_display = ('do_number', 'order_link', 'delivery_date', 'status', 'recipient_name', 'created_at')
     list_filter = ('status', 'delivery_date', 'order__client')
     search_fields = ('do_number', 'order__order_number', 'order__client__name', 'recipient_name', 'notes')
@@ -615,17 +815,18 @@ class CreditNoteItemInline(admin.TabularInline):
 
 
 @admin.register(CreditNote)
-class CreditNoteAdmin(admin.ModelAdmin):
-    list_display = ('cn_number', 'client_link', 'related_invoice_link', 'issue_date', 'status', 'created_at')
+class CreditNoteAdmin(ListProjectionAdmin):
+    list_display = ('cn_number', 'client_link', 'related_invoice_link', 'issue_date', 'status', 'display_grand_total', 'created_at')
     list_filter = ('status', 'issue_date', 'client')
     search_fields = ('cn_number', 'client__name', 'related_invoice__invoice_number', 'reason')
     list_select_related = ('client', 'related_invoice') # Performance for list view
     date_hierarchy = 'issue_date'
-    readonly_fields = ('cn_number', 'created_at', 'updated_at') # cn_number will be auto-generated
+    readonly_fields = ('cn_number', 'created_at', 'updated_at', 'display_grand_total') # cn_number will be auto-generated
 
     fieldsets = (
         (None, {'fields': ('client', 'related_invoice', 'issue_date', 'status')}),
         ('Details', {'fields': ('reason',)}),
+        ('Totals', {'fields': ('display_grand_total',)}),
         ('System Info', {
             'fields': ('cn_number', 'created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -633,6 +834,15 @@ class CreditNoteAdmin(admin.ModelAdmin):
     )
     inlines = [CreditNoteItemInline]
 
+    def get_queryset(self, request):
+        return annotate_totals(super().get_queryset(request))
+
+    @admin.display(description='Total Credit', ordering='db_grand_total')
+    def display_grand_total(self, obj):
+        if not obj.pk:
+            return "-"
+        return f"RM {obj.db_grand_total:,.2f}"
+
     def client_link(self, obj):
         if obj.client:
             link = reverse("admin:documents_client_change", args=[obj.client.pk])
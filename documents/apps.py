@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class DocumentsConfig(AppConfig):
@@ -6,4 +7,8 @@ class DocumentsConfig(AppConfig):
     name = 'documents'
 
     def ready(self):
-        import documents.signals # Import signals module
\ No newline at end of file
+        import documents.signals # Import signals module
+
+        if getattr(settings, 'DOCUMENTS_PRELOAD_TEMPLATES', False):
+            from .templates_preload import preload_on_startup
+            preload_on_startup()
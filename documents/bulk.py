@@ -0,0 +1,173 @@
+"""
+Bulk lifecycle changes for quotations and invoices: the finalize, revert
+and cancel actions of QuotationAdmin and InvoiceAdmin.
+
+Each function changes any number of selected documents in one
+transaction, by the same rules as the per-document finalize() and
+revert_to_draft(). Eligibility is decided by status in the WHERE clause,
+not per instance, and documents in other statuses are skipped and
+counted. Setting is read once.
+
+- finalize_documents() loads the DRAFT rows with their items in three
+  queries, because each frozen render snapshot is built from them, and
+  writes status, dates and snapshots back with one bulk UPDATE per batch.
+- revert_documents() and cancel_documents() are a single UPDATE each.
+
+update() and bulk_update() bypass auto_now, so updated_at is set here
+and cached list rows are refreshed.
+
+queue_pdfs() renders the PDFs of just-finalized documents into
+DOCUMENTS_PDF_DIR on the PDF worker processes (documents.pdfs) after the
+transaction commits, ready to print or send. It is best effort: jobs
+still queued when the process exits are lost, failed jobs are logged and
+counted in documents_pdf_failures_total, and the PDF views render on
+demand as before.
+"""
+import logging
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings as django_settings
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .metrics import PDF_FAILURES
+from .models import CreditNoteStatus, Invoice, Quotation, Setting
+from .pdfs import submit_pdfs
+from .snapshots import FROZEN_FIELDS, freeze, frozen_render_context
+
+
+logger = logging.getLogger(__name__)
+
+# Rows written per UPDATE by finalize_documents()
+BATCH_SIZE = 200
+
+# Per model: the date finalize() defaults from a Setting, related rows its snapshot reads, PDF template
+_FINALIZE = {
+    Quotation: {
+        'date_field': 'valid_until', 'days_setting': 'default_validity_days',
+        'related': ['client', 'previous_version'], 'prefetch': ['items__menu_item'],
+        'template': 'documents/pdf/quotation_pdf.html', 'context_name': 'quotation', 'number_field': 'quotation_number',
+    },
+    Invoice: {
+        'date_field': 'due_date', 'days_setting': 'default_payment_terms_days',
+        'related': ['client', 'related_order', 'related_quotation'], 'prefetch': ['items__menu_item', 'payments'],
+        'template': 'documents/pdf/invoice_pdf.html', 'context_name': 'invoice', 'number_field': 'invoice_number',
+    },
+}
+
+# Statuses a document can be cancelled from
+CANCELLABLE_STATUSES = {
+    Quotation: [Quotation.Status.DRAFT, Quotation.Status.SENT],
+    Invoice: [Invoice.Status.DRAFT, Invoice.Status.SENT, Invoice.Status.OVERDUE],
+}
+
+
+@transaction.atomic
+def finalize_documents(model, pks, settings=None):
+    """
+    Finalize the DRAFT quotations or invoices among pks: issue_date defaults
+    to today, valid_until/due_date to issue_date plus the validity or
+    payment terms days from Setting, the status becomes SENT and the render
+    snapshot is frozen. Returns (finalized documents, skipped count).
+    """
+    pks = list(pks)
+    if settings is None:
+        settings = Setting.get_solo()
+    config = _FINALIZE[model]
+    documents = list(
+        model.objects.select_for_update(of=('self',)) # Two admins finalizing the same rows run one after the other
+        .filter(pk__in=pks, status=model.Status.DRAFT)
+        .select_related(*config['related'])
+        .prefetch_related(*config['prefetch'])
+        .order_by('pk')
+    )
+    today, now = timezone.localdate(), timezone.now()
+    days = getattr(settings, config['days_setting'], 0) or 0
+    for document in documents:
+        document.issue_date = document.issue_date or today
+        if not getattr(document, config['date_field']) and days > 0:
+            setattr(document, config['date_field'], document.issue_date + timedelta(days=days))
+        document.status = model.Status.SENT
+        freeze(document, settings)
+        document.updated_at = now
+    model.objects.bulk_update(
+        documents, ['status', 'issue_date', config['date_field'], *FROZEN_FIELDS, 'updated_at'],
+        batch_size=BATCH_SIZE,
+    )
+    return documents, len(pks) - len(documents)
+
+
+@transaction.atomic
+def revert_documents(model, pks):
+    """
+    Return the SENT quotations or invoices among pks to DRAFT, clearing
+    their dates and snapshots. Returns (reverted, skipped).
+    """
+    pks = list(pks)
+    reverted = model.objects.filter(pk__in=pks, status=model.Status.SENT).update(
+        status=model.Status.DRAFT,
+        issue_date=None,
+        **{_FINALIZE[model]['date_field']: None},
+        **dict.fromkeys(FROZEN_FIELDS),
+        updated_at=timezone.now(),
+    )
+    return reverted, len(pks) - reverted
+
+
+@transaction.atomic
+def cancel_documents(model, pks):
+    """
+    Cancel the quotations or invoices among pks that are in one of
+    CANCELLABLE_STATUSES. Invoices with payments or issued/applied credit
+    notes are skipped: they need a credit note instead. Returns (cancelled, skipped).
+    """
+    pks = list(pks)
+    queryset = model.objects.filter(pk__in=pks, status__in=CANCELLABLE_STATUSES[model])
+    if model is Invoice:
+        queryset = queryset.exclude(payments__isnull=False).exclude(
+            credit_notes__status__in=[CreditNoteStatus.ISSUED, CreditNoteStatus.APPLIED])
+    cancelled = queryset.update(status=model.Status.CANCELLED, updated_at=timezone.now())
+    return cancelled, len(pks) - cancelled
+
+
+def queue_pdfs(model, documents):
+    """
+    Once the current transaction commits, render the PDFs of finalized
+    documents (as returned by finalize_documents()) to DOCUMENTS_PDF_DIR,
+    named like their downloads. The HTML is rendered from the frozen
+    snapshots in this process; WeasyPrint runs in the PDF worker processes.
+    Returns the number queued: 0 when DOCUMENTS_PDF_DIR is not set or
+    WeasyPrint is not installed.
+    """
+    from . import views
+
+    directory = getattr(django_settings, 'DOCUMENTS_PDF_DIR', None)
+    if not directory or views.weasyprint is None or not documents:
+        return 0
+    config = _FINALIZE[model]
+    base_url = Path(django_settings.BASE_DIR).as_uri() + '/'
+
+    def submit():
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        jobs = []
+        for document in documents:
+            frozen, items, frozen_settings = frozen_render_context(document)
+            context = {config['context_name']: frozen, 'items': items, 'settings': frozen_settings, 'is_draft': False}
+            number = getattr(document, config['number_field']) or document.pk
+            path = Path(directory) / f"{model.__name__}-{number}.pdf"
+            jobs.append((render_to_string(config['template'], context), base_url, str(path)))
+        for (_, _, path), future in zip(jobs, submit_pdfs(jobs)):
+            future.add_done_callback(lambda future, path=path: _pdf_done(future, model._meta.model_name, path))
+
+    transaction.on_commit(submit)
+    return len(documents)
+
+
+def _pdf_done(future, document, path):
+    """Log and count a queued PDF that failed to render; nobody waits on its future."""
+    exception = None if future.cancelled() else future.exception()
+    if exception is not None:
+        PDF_FAILURES.inc(document=document)
+        logger.error("Could not write %s", path, exc_info=exception)
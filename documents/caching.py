@@ -0,0 +1,130 @@
+"""
+HTTP and fragment caching for documents.
+
+Conditional GET for document detail pages and PDFs.
+
+@conditional_document(Model) gives a view an ETag and a Last-Modified
+header computed by a single query: the document's row, its client,
+aggregates over its items and (for invoices) payments, (for orders)
+deliveries and invoices, (for quotations) orders or (for delivery orders)
+the parent order, the newest menu item change and Setting.updated_at. A
+browser repeating the request gets a 304 without the view running, so no
+template is rendered and WeasyPrint is not called. Responses are marked
+private, no-cache: browsers keep them but revalidate each time.
+
+List rows are cached as rendered HTML by {% cache %} tags in the list
+templates, in the DOCUMENTS_ROW_CACHE cache. A row's key holds its pk and
+the updated_at of the document, its client and Setting. Item and payment
+signals bump the document's updated_at, so a changed row gets a new key
+and the old entry is left for the cache to evict. An unchanged row costs
+no totals queries.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Subquery, Sum
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import DeliveryOrder, DeliveryOrderItem, Invoice, Order, Payment, Quotation, Setting
+
+
+def _document_subqueries(model):
+    """Annotations capturing changes to a document's items, payments, linked documents, menu items and the settings."""
+    items = model._meta.get_field('items').related_model
+    parent = model._meta.get_field('items').field.name
+    rows = items.objects.filter(**{parent: OuterRef('pk')}).order_by().values(parent)
+    if items is DeliveryOrderItem:
+        amount, menu_item = F('quantity_delivered'), 'order_item__menu_item__updated_at'
+    else:
+        amount, menu_item = F('quantity') * F('unit_price'), 'menu_item__updated_at'
+
+    annotations = {
+        'v_items': Subquery(rows.annotate(v=Count('pk')).values('v')),
+        'v_last_item': Subquery(rows.annotate(v=Max('pk')).values('v')),
+        'v_items_total': Subquery(rows.annotate(
+            v=Sum(amount, output_field=DecimalField())).values('v')),
+        'v_menu_items': Subquery(rows.annotate(v=Max(menu_item)).values('v')),
+        'v_client': F('order__client__updated_at' if model is DeliveryOrder else 'client__updated_at'),
+        'v_settings': Subquery(Setting.objects.values('updated_at')[:1]),
+    }
+    if model is Order:
+        # Deliveries change the delivered/remaining columns
+        deliveries = DeliveryOrderItem.objects.filter(order_item__order=OuterRef('pk')).order_by().values('order_item__order')
+        annotations.update({
+            'v_deliveries': Subquery(deliveries.annotate(v=Count('pk')).values('v')),
+            'v_delivered': Subquery(deliveries.annotate(
+                v=Sum('quantity_delivered', output_field=DecimalField())).values('v')),
+            'v_last_delivery': Subquery(deliveries.annotate(v=Max('delivery_order__updated_at')).values('v')),
+        })
+        # create_invoice() replaces the "Create Invoice" button with the invoice
+        invoices = Invoice.objects.filter(related_order=OuterRef('pk')).order_by().values('related_order')
+        annotations.update({
+            'v_invoices': Subquery(invoices.annotate(v=Count('pk')).values('v')),
+            'v_last_invoice': Subquery(invoices.annotate(v=Max('pk')).values('v')),
+        })
+    if model is DeliveryOrder:
+        # The page shows the parent order's number, address and quotation
+        annotations['v_order'] = F('order__updated_at')
+    if model is Quotation:
+        # Orders created from the quotation, with their status and totals (item changes bump updated_at)
+        orders = Order.objects.filter(related_quotation=OuterRef('pk')).order_by().values('related_quotation')
+        annotations.update({
+            'v_orders': Subquery(orders.annotate(v=Count('pk')).values('v')),
+            'v_last_order': Subquery(orders.annotate(v=Max('updated_at')).values('v')),
+        })
+    if model is Invoice:
+        payments = Payment.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice')
+        annotations.update({
+            'v_payments': Subquery(payments.annotate(v=Count('pk')).values('v')),
+            'v_paid': Subquery(payments.annotate(v=Sum('amount')).values('v')),
+            'v_last_payment': Subquery(payments.annotate(v=Max('updated_at')).values('v')),
+        })
+    return annotations
+
+
+def document_version(request, model, pk):
+    """
+    (etag, last_modified) of the document as this user would see it,
+    from one query and memoized on the request; (None, None) if missing.
+    """
+    cache = request.__dict__.setdefault('_document_versions', {})
+    key = (model, pk)
+    if key not in cache:
+        row = model.objects.filter(pk=pk).annotate(**_document_subqueries(model)).order_by().values().first()
+        if row is None:
+            cache[key] = (None, None)
+        else:
+            user = request.user
+            # Pages differ for staff (action buttons), so the user is part of the version
+            source = repr((sorted(row.items()), user.pk, user.is_staff))
+            etag = hashlib.sha1(source.encode()).hexdigest()
+            stamps = [row[name] for name in ('updated_at', 'v_client', 'v_settings', 'v_menu_items', 'v_last_payment',
+                                             'v_last_delivery', 'v_last_order', 'v_order') if row.get(name)]
+            cache[key] = (etag, max(stamps) if stamps else None)
+    return cache[key]
+
+
+def conditional_document(model):
+    """Answer If-None-Match / If-Modified-Since for a view taking the document's pk."""
+    def decorator(view):
+        @condition(
+            etag_func=lambda request, pk, **kwargs: document_version(request, model, pk)[0],
+            last_modified_func=lambda request, pk, **kwargs: document_version(request, model, pk)[1],
+        )
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def row_cache_context():
+    """Context for the {% cache %} tags around list rows: the cache alias and its timeout."""
+    alias = getattr(settings, 'DOCUMENTS_ROW_CACHE', 'document_rows')
+    return {'row_cache': alias, 'row_cache_timeout': caches[alias].default_timeout}
@@ -1,11 +1,13 @@
 from decimal import Decimal
 from django import forms
+from django.utils.functional import cached_property
 
 from .models import (
     Quotation, QuotationItem, Client, MenuItem, DiscountType, 
     Invoice, InvoiceItem, Order, OrderItem,
-    Client, DeliveryOrderItem, OrderItem, Order
+    Client, DeliveryOrder, DeliveryOrderItem, OrderItem, Order
     )
+from .fulfillment import fulfillment_ledger
 
 class QuotationForm(forms.ModelForm):
     # Add custom DateInput widgets to get nice date pickers in most browsers
@@ -272,16 +274,117 @@ class DeliveryOrderItemForm(forms.ModelForm):
                      field.widget.attrs['class'] = 'form-select form-select-sm'
 
         # Filter the 'order_item' queryset if a parent_order is provided
+        order_items = OrderItem.objects.select_related('order', 'menu_item') # For the choice labels
         if parent_order:
-            self.fields['order_item'].queryset = OrderItem.objects.filter(order=parent_order)
+            self.fields['order_item'].queryset = order_items.filter(order=parent_order)
         elif self.instance and self.instance.pk and hasattr(self.instance, 'delivery_order') and self.instance.delivery_order:
             # If editing an existing item, parent_order might not be passed explicitly,
             # but we can infer it from the instance.
-            self.fields['order_item'].queryset = OrderItem.objects.filter(order=self.instance.delivery_order.order)
+            self.fields['order_item'].queryset = order_items.filter(order=self.instance.delivery_order.order_id)
         else:
             # For new, unbound forms (e.g., initial load of "add" page before parent DO is saved),
             # show no items or items from a sensible default if possible.
             # Showing none is safer to prevent selection before parent Order is known.
             self.fields['order_item'].queryset = OrderItem.objects.none()
 
-                     
\ No newline at end of file
+                     
+
+
+class BaseDeliveryOrderItemFormSet(forms.BaseInlineFormSet):
+    """
+    Delivery order lines checked together against what is left to deliver
+    of each order line, counting deliveries on the order's other (not
+    cancelled) delivery orders. One ledger query serves the validation, the
+    order line choices of every form and the admin's remaining column.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.ledger:
+            return
+        # Every form offers the same order lines: build the choices once, labelled with what is left
+        field = self.forms[0].fields['order_item'] if self.forms else self.empty_form.fields['order_item']
+        choices = [('', field.empty_label)] + [
+            (item.pk, self._choice_label(item)) for item in field.queryset
+        ]
+        for form in self.forms:
+            form.fields['order_item'].choices = choices
+            # Read by DeliveryOrderItemInline.remaining_quantity
+            form.instance.fulfillment = self.ledger.get(form.instance.order_item_id)
+
+    @cached_property
+    def ledger(self):
+        """fulfillment_ledger() of the parent order, leaving out this delivery order's own lines."""
+        if not self.instance.order_id:
+            return {}
+        return fulfillment_ledger([self.instance.order_id], exclude_delivery_order=self.instance.pk)
+
+    def _choice_label(self, item):
+        line = self.ledger.get(item.pk)
+        if line is None:
+            return str(item)
+        return f"{item.menu_item.name} ({line.remaining} of {line.ordered} left)"
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+        totals, forms_by_item = {}, {}
+        for form in self.forms:
+            if self._should_delete_form(form):
+                continue
+            order_item = form.cleaned_data.get('order_item')
+            quantity = form.cleaned_data.get('quantity_delivered')
+            if order_item is None or quantity is None:
+                continue
+            totals[order_item.pk] = totals.get(order_item.pk, Decimal('0.00')) + quantity
+            forms_by_item.setdefault(order_item.pk, []).append(form)
+
+        for order_item_id, total in totals.items():
+            line = self.ledger.get(order_item_id)
+            if line is None or total <= line.remaining:
+                continue
+            message = (f"Only {line.remaining} of {line.ordered} left to deliver "
+                       f"({line.delivered} already on other delivery orders); this delivery order has {total}.")
+            for form in forms_by_item[order_item_id]:
+                form.add_error('quantity_delivered', message)
+
+
+class DateRangeForm(forms.Form):
+    """Start and end dates (inclusive) of a report, at most max_days apart."""
+    start = forms.DateField(widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+    end = forms.DateField(widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control form-control-sm'}))
+
+    def __init__(self, *args, max_days=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_days = max_days
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end:
+            if end < start:
+                raise forms.ValidationError("The end date is before the start date.")
+            if self.max_days and (end - start).days + 1 > self.max_days:
+                raise forms.ValidationError(f"Choose a range of at most {self.max_days} days.")
+        return cleaned_data
+
+
+class StatementUploadForm(forms.Form):
+    """A bank statement CSV; cleaned to its StatementLines (see documents.reconciliation)."""
+    statement = forms.FileField(
+        help_text="CSV with a header row: date and amount columns, and optionally description, reference and payer.",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control form-control-sm', 'accept': '.csv,text/csv'}),
+    )
+
+    def clean_statement(self):
+        from .reconciliation import parse_statement
+        try:
+            lines = parse_statement(self.cleaned_data['statement'].read())
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The statement is not a UTF-8 CSV file.")
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        if not lines:
+            raise forms.ValidationError("The statement has no lines.")
+        return lines
@@ -0,0 +1,122 @@
+"""
+Delivery fulfillment: how much of each OrderItem has gone out on
+delivery orders.
+
+fulfillment_ledger() reads it for every line of one or many orders with a
+single grouped query: each OrderItem row joined to its DeliveryOrderItems
+and summed. Cancelled delivery orders do not count. The delivery order
+inline formset validates against it, and the order detail page and the
+delivery order admin show remaining quantities from it.
+
+create_delivery_orders() uses it to raise delivery orders for everything
+still undelivered on many orders at once (the OrderAdmin action and
+manage.py create_delivery_orders).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DeliveryOrder, DeliveryOrderItem, DeliveryOrderStatus, Order, OrderItem
+
+
+# Orders that can still be delivered
+DELIVERABLE_ORDER_STATUSES = [Order.OrderStatus.CONFIRMED, Order.OrderStatus.IN_PROGRESS]
+
+
+class LineFulfillment:
+    """Ordered and delivered quantities of one OrderItem."""
+
+    def __init__(self, order_id, ordered, delivered):
+        self.order_id = order_id
+        self.ordered = ordered
+        self.delivered = delivered
+
+    @property
+    def remaining(self):
+        return max(self.ordered - self.delivered, Decimal('0.00'))
+
+    @property
+    def over_delivered(self):
+        return max(self.delivered - self.ordered, Decimal('0.00'))
+
+    @property
+    def is_complete(self):
+        return self.delivered >= self.ordered
+
+    def __repr__(self):
+        return f"<LineFulfillment ordered={self.ordered} delivered={self.delivered}>"
+
+
+def fulfillment_ledger(order_ids, exclude_delivery_order=None):
+    """
+    {order_item_id: LineFulfillment} for every item of the given orders.
+    Deliveries on exclude_delivery_order (a pk) are left out, so a form
+    editing that delivery order can add its own quantities.
+    """
+    counted = ~Q(delivered_items__delivery_order__status=DeliveryOrderStatus.CANCELLED)
+    if exclude_delivery_order is not None:
+        counted &= ~Q(delivered_items__delivery_order=exclude_delivery_order)
+    rows = (
+        OrderItem.objects.filter(order_id__in=list(order_ids))
+        .order_by()
+        .values('pk', 'order_id', 'quantity')
+        .annotate(delivered=Coalesce(
+            Sum('delivered_items__quantity_delivered', filter=counted),
+            Value(Decimal('0.00')), output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+    )
+    return {
+        row['pk']: LineFulfillment(row['order_id'], row['quantity'], Decimal(row['delivered']).quantize(Decimal('0.01')))
+        for row in rows
+    }
+
+
+@transaction.atomic
+def create_delivery_orders(order_ids, delivery_date=None):
+    """
+    Create one PLANNED delivery order per deliverable order, holding every
+    quantity not yet delivered, for the given orders. Orders that are not
+    CONFIRMED/IN_PROGRESS or have nothing left are skipped. The delivery
+    date is delivery_date, else the order's event_date, else today.
+
+    Takes five queries however many orders there are: the orders, the
+    ledger, one insert of delivery orders, one update giving them their
+    DO-YYYY-ID numbers and one insert of their items. post_save does not
+    fire for bulk inserts, so the numbers are assigned here.
+    Returns (created delivery orders, skipped order ids).
+    """
+    order_ids = list(order_ids)
+    orders = list(
+        Order.objects.select_for_update() # Two batches for the same orders run one after the other
+        .filter(pk__in=order_ids, status__in=DELIVERABLE_ORDER_STATUSES)
+        .only('pk', 'event_date').order_by('pk')
+    )
+    ledger = fulfillment_ledger([order.pk for order in orders])
+    lines_by_order = {}
+    for order_item_id, line in sorted(ledger.items()):
+        if line.remaining > 0:
+            lines_by_order.setdefault(line.order_id, []).append((order_item_id, line.remaining))
+
+    today = timezone.localdate()
+    delivery_orders = [
+        DeliveryOrder(order=order, delivery_date=delivery_date or order.event_date or today)
+        for order in orders if order.pk in lines_by_order
+    ]
+    if not delivery_orders:
+        return [], order_ids
+
+    DeliveryOrder.objects.bulk_create(delivery_orders)
+    for delivery_order in delivery_orders:
+        delivery_order.do_number = f"DO-{delivery_order.created_at.year}-{delivery_order.pk}"
+    DeliveryOrder.objects.bulk_update(delivery_orders, ['do_number'])
+
+    DeliveryOrderItem.objects.bulk_create([
+        DeliveryOrderItem(delivery_order=delivery_order, order_item_id=order_item_id, quantity_delivered=quantity)
+        for delivery_order in delivery_orders
+        for order_item_id, quantity in lines_by_order[delivery_order.order_id]
+    ])
+    created_for = {delivery_order.order_id for delivery_order in delivery_orders}
+    return delivery_orders, [pk for pk in order_ids if pk not in created_for]
@@ -0,0 +1,197 @@
+import gzip
+import hashlib
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+
+SNAPSHOT_GLOB = 'db-*.sqlite3.gz'
+
+
+def backup_dir():
+    return Path(getattr(settings, 'DOCUMENTS_BACKUP_DIR', Path(settings.BASE_DIR) / 'backups'))
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _checksum_path(path):
+    return path.with_name(path.name + '.sha256')
+
+
+def create_snapshot(source, directory, pages=256, sleep=0.05, progress=None):
+    """
+    Copy the open sqlite3 connection source with the online backup API, pages
+    at a time and sleeping between steps so writers are never blocked for
+    long. The copy is checked, gzipped to directory/db-<timestamp>.sqlite3.gz
+    and a sha256sum-style .sha256 file is written next to it.
+    Returns the snapshot path.
+    """
+    if source.in_transaction:
+        # The backup would wait forever on this connection's own write lock
+        raise CommandError("Cannot back up from a connection with an open transaction.")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"db-{timezone.now():%Y%m%d-%H%M%S-%f}.sqlite3.gz"
+
+    with tempfile.TemporaryDirectory(dir=directory) as tmpdir:
+        copy_path = Path(tmpdir) / 'snapshot.sqlite3'
+        target = sqlite3.connect(copy_path)
+        try:
+            source.backup(target, pages=pages, sleep=sleep, progress=progress)
+            _check_integrity(target)
+        finally:
+            target.close()
+        partial = path.with_name(path.name + '.partial')
+        with open(copy_path, 'rb') as src, gzip.open(partial, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        partial.replace(path)
+
+    _checksum_path(path).write_text(f"{_sha256(path)}  {path.name}\n")
+    return path
+
+
+def _check_integrity(conn):
+    result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if result != 'ok':
+        raise CommandError(f"Integrity check failed: {result}")
+
+
+def verify_snapshot(path):
+    """Check the snapshot's checksum, then that it decompresses to a sound SQLite database."""
+    path = Path(path)
+    checksum_file = _checksum_path(path)
+    if not path.is_file() or not checksum_file.is_file():
+        raise CommandError(f"{path} or its .sha256 file is missing.")
+    expected = checksum_file.read_text().split()[0]
+    if _sha256(path) != expected:
+        raise CommandError(f"Checksum mismatch for {path.name}.")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        copy_path = _decompress(path, tmpdir)
+        conn = sqlite3.connect(copy_path)
+        try:
+            _check_integrity(conn)
+            tables = conn.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        finally:
+            conn.close()
+    return tables
+
+
+def _decompress(path, tmpdir):
+    copy_path = Path(tmpdir) / 'restore.sqlite3'
+    try:
+        with gzip.open(path, 'rb') as src, open(copy_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    except (OSError, EOFError) as exc:
+        raise CommandError(f"{path.name} is not a readable snapshot: {exc}")
+    return copy_path
+
+
+def restore_snapshot(path, target, pages=256, sleep=0.0, progress=None):
+    """
+    Verify the snapshot, then copy it over the open sqlite3 connection target
+    with the backup API. Other connections see either the old or the
+    restored database, never a half-written file.
+    """
+    path = Path(path)
+    if target.in_transaction:
+        raise CommandError("Cannot restore into a connection with an open transaction.")
+    verify_snapshot(path)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = sqlite3.connect(_decompress(path, tmpdir))
+        try:
+            source.backup(target, pages=pages, sleep=sleep, progress=progress)
+        finally:
+            source.close()
+
+
+def rotate(directory, keep):
+    """Delete all but the newest keep snapshots. Returns the deleted paths."""
+    snapshots = sorted(Path(directory).glob(SNAPSHOT_GLOB))
+    removed = snapshots[:-keep] if keep > 0 else []
+    for path in removed:
+        path.unlink()
+        _checksum_path(path).unlink(missing_ok=True)
+    return removed
+
+
+class Command(BaseCommand):
+    help = (
+        "Takes a consistent snapshot of the live SQLite database with the online backup API, "
+        "copying a few pages at a time so the site stays responsive, then compresses, checksums "
+        "and rotates it. --verify checks a snapshot; --restore loads one back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--dir', help="Snapshot directory (default: DOCUMENTS_BACKUP_DIR).")
+        parser.add_argument('--keep', type=int, default=getattr(settings, 'DOCUMENTS_BACKUP_KEEP', 14),
+                            help="Number of snapshots to keep; older ones are deleted.")
+        parser.add_argument('--pages', type=int, default=256, help="Database pages copied per step.")
+        parser.add_argument('--sleep', type=float, default=0.05,
+                            help="Seconds to pause between steps, letting other connections write.")
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('--list', action='store_true', help="List the snapshots.")
+        mode.add_argument('--verify', metavar='SNAPSHOT', help="Check a snapshot's checksum and integrity.")
+        mode.add_argument('--restore', metavar='SNAPSHOT', help="Replace the database with a snapshot.")
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help="Do not ask for confirmation before --restore.")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError("backup_db only supports SQLite; use pg_dump for PostgreSQL.")
+        directory = Path(options['dir']) if options['dir'] else backup_dir()
+
+        if options['list']:
+            for path in sorted(directory.glob(SNAPSHOT_GLOB), reverse=True):
+                self.stdout.write(f"{path.name}  {path.stat().st_size / 1024:.0f} KiB")
+            return
+
+        if options['verify']:
+            tables = verify_snapshot(self._snapshot_path(options['verify'], directory))
+            self.stdout.write(self.style.SUCCESS(f"Snapshot OK ({tables} tables)."))
+            return
+
+        connection.ensure_connection()
+        if options['restore']:
+            path = self._snapshot_path(options['restore'], directory)
+            if options['interactive']:
+                answer = input(f"This replaces database '{options['database']}' with {path.name}. "
+                               "Type 'yes' to continue: ")
+                if answer != 'yes':
+                    raise CommandError("Restore cancelled.")
+            started = time.perf_counter()
+            restore_snapshot(path, connection.connection, pages=options['pages'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Restored {path.name} in {time.perf_counter() - started:.1f}s."))
+            return
+
+        started = time.perf_counter()
+        path = create_snapshot(connection.connection, directory, pages=options['pages'],
+                               sleep=options['sleep'], progress=self._progress)
+        removed = rotate(directory, options['keep'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {path} ({path.stat().st_size / 1024:.0f} KiB) in {time.perf_counter() - started:.1f}s; "
+            f"removed {len(removed)} old snapshot(s)."))
+
+    def _snapshot_path(self, value, directory):
+        path = Path(value)
+        return path if path.exists() else directory / value
+
+    def _progress(self, status, remaining, total):
+        if self.verbosity > 1 and total:
+            self.stdout.write(f"  {total - remaining}/{total} pages")
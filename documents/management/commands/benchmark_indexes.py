@@ -0,0 +1,125 @@
+import json
+import statistics
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from documents.models import Client, Invoice, MenuItem, Order, Payment, Quotation, DeliveryOrder
+from documents.seeding import seed_dataset
+
+
+def access_paths(sample_client_id, sample_invoice_id):
+    """
+    The list/filter queries issued by the views and admin changelists.
+    Each entry is (name, queryset factory).
+    """
+    today = timezone.now().date()
+    return [
+        ('quotation list', lambda: Quotation.objects.select_related('client')[:50]),
+        ('quotation by status', lambda: Quotation.objects.filter(status=Quotation.Status.SENT)[:50]),
+        ('client quotations', lambda: Quotation.objects.filter(client_id=sample_client_id).order_by('-issue_date', '-created_at')[:10]),
+        ('order list', lambda: Order.objects.select_related('client').order_by('-event_date', '-created_at')[:50]),
+        ('orders by status + event date', lambda: Order.objects.filter(
+            status=Order.OrderStatus.CONFIRMED, event_date__gte=today).order_by('event_date')[:50]),
+        ('client orders', lambda: Order.objects.filter(client_id=sample_client_id).order_by('-event_date', '-created_at')[:10]),
+        ('invoice list', lambda: Invoice.objects.select_related('client')[:50]),
+        ('invoice by status', lambda: Invoice.objects.filter(status=Invoice.Status.PAID)[:50]),
+        ('open invoices by due date', lambda: Invoice.objects.open_due_before(today)[:50]),
+        ('client invoices', lambda: Invoice.objects.filter(client_id=sample_client_id).order_by('-issue_date', '-created_at')[:10]),
+        ('invoice payments', lambda: Payment.objects.filter(invoice_id=sample_invoice_id).order_by('-payment_date')),
+        ('payment changelist', lambda: Payment.objects.select_related('invoice', 'invoice__client')[:25]),
+        ('delivery order list', lambda: DeliveryOrder.objects.select_related('order', 'order__client')
+            .order_by('-delivery_date', '-created_at')[:10]),
+        ('active menu items', lambda: MenuItem.objects.filter(is_active=True).order_by('name')),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database with a large dataset and reports query plans and "
+        "timings for the list/filter access paths, without and with the Meta.indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument('--quotations', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per query (median is reported).")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file.")
+        parser.add_argument('--plans', action='store_true', help="Print the full query plan for every path.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        # Never touch the configured database: build a scratch copy of the schema instead.
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
+
+    def _run(self, options):
+        self.stdout.write("Seeding benchmark data...")
+        started = time.perf_counter()
+        counts = seed_dataset(clients=options['clients'], quotations=options['quotations'], stdout=self.stdout)
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        sample_client_id = Client.objects.values_list('pk', flat=True).order_by('?').first()
+        sample_invoice_id = Payment.objects.values_list('invoice_id', flat=True).first()
+        paths = access_paths(sample_client_id, sample_invoice_id)
+        indexed_models = [m for m in apps.get_app_config('documents').get_models() if m._meta.indexes]
+
+        self._set_indexes(indexed_models, present=False)
+        before = self._measure(paths, options['repeat'])
+        self._set_indexes(indexed_models, present=True)
+        after = self._measure(paths, options['repeat'])
+
+        self.stdout.write("")
+        self.stdout.write(f"{'access path':<32} {'before ms':>10} {'after ms':>10} {'speedup':>8}  plan (after)")
+        rows = []
+        for name, _ in paths:
+            b, a = before[name], after[name]
+            speedup = b['ms'] / a['ms'] if a['ms'] else float('inf')
+            plan_summary = self._summarize_plan(a['plan'])
+            self.stdout.write(f"{name:<32} {b['ms']:>10.2f} {a['ms']:>10.2f} {speedup:>7.1f}x  {plan_summary}")
+            if options['plans']:
+                self.stdout.write(self.style.NOTICE(f"  before:\n{b['plan']}\n  after:\n{a['plan']}"))
+            rows.append({'path': name, 'before': b, 'after': a})
+
+        return {'vendor': connection.vendor, 'counts': counts, 'paths': rows}
+
+    def _summarize_plan(self, plan):
+        """Keep only the access-method lines (SCAN/SEARCH/Index Scan/...) of a plan."""
+        keywords = ('SCAN', 'SEARCH', 'TEMP B-TREE', 'Index', 'Seq Scan', 'Sort')
+        lines = [line.split(None, 3)[-1] if line[:1].isdigit() else line.strip()
+                 for line in plan.splitlines() if any(k in line for k in keywords)]
+        return '; '.join(lines)
+
+    def _set_indexes(self, models, present):
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    if present:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def _measure(self, paths, repeat):
+        measured = {}
+        for name, make_queryset in paths:
+            plan = make_queryset().explain()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(make_queryset())
+                timings.append((time.perf_counter() - started) * 1000)
+            measured[name] = {'ms': statistics.median(timings), 'plan': plan}
+        return measured
@@ -0,0 +1,111 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from documents.models import Client, CreditNote, DeliveryOrder, Invoice, MenuItem, Order, Payment, Quotation
+from documents.seeding import seed_dataset
+
+
+def list_querysets():
+    """(name, full-row queryset, for_list() queryset) for each list and changelist."""
+    pairs = [
+        ('quotations', Quotation.objects.select_related('client'), Quotation.objects.for_list()),
+        ('invoices', Invoice.objects.select_related('client'), Invoice.objects.for_list()),
+        ('orders', Order.objects.select_related('client'), Order.objects.for_list()),
+        ('clients', Client.objects.all(), Client.objects.for_list()),
+        ('delivery orders', DeliveryOrder.objects.select_related('order', 'order__client'), DeliveryOrder.objects.for_list()),
+        ('payments', Payment.objects.select_related('invoice'), Payment.objects.for_list()),
+        ('credit notes', CreditNote.objects.select_related('client', 'related_invoice'), CreditNote.objects.for_list()),
+        ('menu items', MenuItem.objects.all(), MenuItem.objects.for_list()),
+    ]
+    return [(name, full.order_by('pk'), slim.order_by('pk')) for name, full, slim in pairs]
+
+
+def transferred_bytes(queryset):
+    """Bytes of column data the database returns for queryset (text as UTF-8, other values as their text form)."""
+    sql, params = queryset.query.sql_with_params()
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            total += sum(len(value if isinstance(value, bytes) else str(value).encode())
+                         for value in row if value is not None)
+    return total
+
+
+def materialize(queryset):
+    """(median ms over 3 runs, peak KiB of one run) for loading every row of queryset."""
+    timings = []
+    for _ in range(3):
+        started = time.perf_counter()
+        list(queryset.all())
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    rows = list(queryset.all())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    return statistics.median(timings), peak / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database and compares, for each list and admin changelist, loading full "
+        "rows with loading the for_list() projection: bytes returned by the database, time and peak "
+        "memory to build the model instances."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument('--quotations', type=int, default=5000)
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write("Seeding benchmark data...")
+            seed_dataset(clients=options['clients'], quotations=options['quotations'], seed=1)
+            self._add_text(options)
+            results = self._run()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['json_path']}"))
+
+    def _add_text(self, options):
+        # Seeded rows have short text; give them the size of real terms, notes and addresses.
+        terms = "Payment is due within 30 days of the invoice date. " * 20
+        Client.objects.update(address="Lot 12, Jalan Example 3/4\nTaman Contoh\n47300 Petaling Jaya\nSelangor")
+        Quotation.objects.update(terms_and_conditions=terms, notes="Client prefers less spicy food. " * 5)
+        Order.objects.update(notes="Set up 1 hour before the event. " * 5, delivery_address="Hall A, Level 3")
+        Invoice.objects.update(terms_and_conditions=terms, payment_details="Maybank 1234567890 " * 5)
+        DeliveryOrder.objects.update(notes="Use the loading bay at the back. " * 5)
+
+    def _run(self):
+        self.stdout.write("")
+        self.stdout.write(f"{'list':<18} {'rows':>7} {'KiB full':>9} {'KiB slim':>9} {'saved':>6} "
+                          f"{'ms full':>8} {'ms slim':>8} {'peak full':>10} {'peak slim':>10}")
+        results = {}
+        for name, full, slim in list_querysets():
+            bytes_full, bytes_slim = transferred_bytes(full), transferred_bytes(slim)
+            ms_full, peak_full = materialize(full)
+            ms_slim, peak_slim = materialize(slim)
+            saved = (bytes_full - bytes_slim) / bytes_full * 100 if bytes_full else 0
+            results[name] = {
+                'rows': full.count(),
+                'bytes_full': bytes_full, 'bytes_slim': bytes_slim,
+                'ms_full': ms_full, 'ms_slim': ms_slim,
+                'peak_kib_full': peak_full, 'peak_kib_slim': peak_slim,
+            }
+            self.stdout.write(
+                f"{name:<18} {results[name]['rows']:>7} {bytes_full / 1024:>9.0f} {bytes_slim / 1024:>9.0f} "
+                f"{saved:>5.0f}% {ms_full:>8.1f} {ms_slim:>8.1f} {peak_full:>10.0f} {peak_slim:>10.0f}")
+        return results
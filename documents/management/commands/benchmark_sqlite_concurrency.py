@@ -0,0 +1,168 @@
+import json
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.db import SQLITE_PRODUCTION_PRAGMAS
+from documents.seeding import seed_dataset
+
+
+# What an invoice list page reads.
+READ_SQL = """
+    SELECT i.id, i.invoice_number, c.name, i.status, SUM(ii.quantity * ii.unit_price)
+    FROM documents_invoice i
+    JOIN documents_client c ON c.id = i.client_id
+    LEFT JOIN documents_invoiceitem ii ON ii.invoice_id = i.id
+    GROUP BY i.id
+    ORDER BY i.issue_date DESC, i.created_at DESC
+    LIMIT 50
+"""
+
+# What recording a payment does: read the paid total, insert, update the invoice status.
+PAID_SQL = "SELECT COALESCE(SUM(amount), 0) FROM documents_payment WHERE invoice_id = ?"
+INSERT_SQL = """
+    INSERT INTO documents_payment
+        (invoice_id, payment_date, amount, payment_method, reference_number, notes, created_at, updated_at)
+    VALUES (?, date('now'), '1.00', 'BANK', 'BENCH', '', datetime('now'), datetime('now'))
+"""
+UPDATE_SQL = "UPDATE documents_invoice SET status = 'PART_PAID', updated_at = datetime('now') WHERE id = ?"
+
+MODES = {
+    # Django's defaults: rollback journal, deferred transactions, 5s busy timeout.
+    'default': {'pragmas': {'journal_mode': 'DELETE'}, 'begin': 'BEGIN'},
+    # core.settings_production: the PRAGMAs from core.db and BEGIN IMMEDIATE.
+    'production': {'pragmas': SQLITE_PRODUCTION_PRAGMAS, 'begin': 'BEGIN IMMEDIATE'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a scratch SQLite file, then runs simultaneous readers (invoice list query) and "
+        "writers (payment recording) against it with Django's default SQLite setup and with the "
+        "production profile (WAL, synchronous=NORMAL, busy_timeout, mmap, BEGIN IMMEDIATE), "
+        "and reports throughput, latency and 'database is locked' errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100)
+        parser.add_argument('--quotations', type=int, default=1000)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds per mode.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write("This benchmark only applies to SQLite.")
+            return
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = str(Path(tmpdir) / 'concurrency.sqlite3')
+            old_name = connection.settings_dict['NAME']
+            connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}), 'NAME': db_path}
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.stdout.write("Seeding benchmark data...")
+                seed_dataset(clients=options['clients'], quotations=options['quotations'], stdout=self.stdout)
+                invoice_ids = list(connection.cursor().execute("SELECT id FROM documents_invoice").fetchall())
+                invoice_ids = [row[0] for row in invoice_ids]
+                connection.close()
+
+                results = {mode: self._run_mode(db_path, mode, invoice_ids, options) for mode in MODES}
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write("")
+        self.stdout.write(f"{'mode':<12} {'reads/s':>9} {'writes/s':>9} {'read p95 ms':>12} "
+                          f"{'write p95 ms':>13} {'locked errors':>14}")
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:<12} {result['reads_per_s']:>9.1f} {result['writes_per_s']:>9.1f} "
+                f"{result['read_p95_ms']:>12.2f} {result['write_p95_ms']:>13.2f} {result['locked_errors']:>14}"
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump({'options': {k: options[k] for k in ('readers', 'writers', 'duration')},
+                           'results': results}, fh, indent=2)
+            self.stdout.write(f"Results written to {options['json_path']}")
+
+    def _connect(self, db_path, mode):
+        conn = sqlite3.connect(db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        for name, value in MODES[mode]['pragmas'].items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def _run_mode(self, db_path, mode, invoice_ids, options):
+        # journal_mode is stored in the file, so switch it with no other connection open.
+        self._connect(db_path, mode).close()
+
+        deadline = time.perf_counter() + options['duration']
+        read_times, write_times, errors = [], [], []
+        lock = threading.Lock()
+
+        def reader():
+            conn = self._connect(db_path, mode)
+            local = []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    conn.execute(READ_SQL).fetchall()
+                    local.append(time.perf_counter() - started)
+                except sqlite3.OperationalError as exc:
+                    with lock:
+                        errors.append(str(exc))
+            conn.close()
+            with lock:
+                read_times.extend(local)
+
+        def writer(seed):
+            rng = random.Random(seed)
+            conn = self._connect(db_path, mode)
+            local = []
+            while time.perf_counter() < deadline:
+                invoice_id = rng.choice(invoice_ids)
+                started = time.perf_counter()
+                try:
+                    conn.execute(MODES[mode]['begin'])
+                    conn.execute(PAID_SQL, [invoice_id]).fetchone()
+                    conn.execute(INSERT_SQL, [invoice_id])
+                    conn.execute(UPDATE_SQL, [invoice_id])
+                    conn.execute("COMMIT")
+                    local.append(time.perf_counter() - started)
+                except sqlite3.OperationalError as exc:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    with lock:
+                        errors.append(str(exc))
+            conn.close()
+            with lock:
+                write_times.extend(local)
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        def p95(values):
+            return statistics.quantiles(values, n=20)[-1] * 1000 if len(values) >= 2 else 0.0
+
+        return {
+            'reads': len(read_times),
+            'writes': len(write_times),
+            'reads_per_s': len(read_times) / options['duration'],
+            'writes_per_s': len(write_times) / options['duration'],
+            'read_p95_ms': p95(read_times),
+            'write_p95_ms': p95(write_times),
+            'locked_errors': sum('locked' in error for error in errors),
+            'other_errors': sum('locked' not in error for error in errors),
+        }
@@ -0,0 +1,114 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template import Context, engines
+from django.template.engine import Engine
+
+from documents.models import DeliveryOrder, Invoice, Order, Quotation, Setting
+from documents.seeding import seed_dataset
+from documents.templates_preload import document_template_names, preload_templates
+from documents.views import _document_for_render
+
+
+SOURCE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+def build_engine(cached):
+    """An engine like the project's, with (cached=True) or without the cached loader."""
+    base = engines['django'].engine
+    loaders = [('django.template.loaders.cached.Loader', SOURCE_LOADERS)] if cached else SOURCE_LOADERS
+    return Engine(dirs=base.dirs, app_dirs=False, libraries=base.libraries, loaders=loaders, debug=False)
+
+
+def pdf_contexts():
+    """(template name, context) for each PDF, built from seeded documents the way the PDF views build them."""
+    quotation, quotation_items, settings = _document_for_render(
+        Quotation, Quotation.objects.order_by('-pk').values_list('pk', flat=True).first(),
+        ['client', 'previous_version'], ['items__menu_item'])
+    invoice, invoice_items, _ = _document_for_render(
+        Invoice, Invoice.objects.filter(payments__isnull=False).order_by('-pk').values_list('pk', flat=True).first(),
+        ['client', 'related_order', 'related_quotation'], ['items__menu_item', 'payments'])
+    settings = Setting.get_solo()
+    order = Order.objects.select_related('client', 'related_quotation').prefetch_related(
+        'items__menu_item').filter(items__isnull=False).order_by('-pk').first()
+    order.get_totals(settings)
+    delivery_order = DeliveryOrder.objects.select_related('order', 'order__client').order_by('-pk').first()
+    return [
+        ('documents/pdf/quotation_pdf.html', {'quotation': quotation, 'items': list(quotation_items),
+                                              'settings': settings, 'is_draft': False}),
+        ('documents/pdf/invoice_pdf.html', {'invoice': invoice, 'items': list(invoice_items),
+                                            'settings': settings, 'is_draft': False}),
+        ('documents/pdf/order_pdf.html', {'order': order, 'items': list(order.items.all()), 'settings': settings}),
+        ('documents/pdf/delivery_order_pdf.html', {
+            'delivery_order': delivery_order, 'settings': settings,
+            'items': list(delivery_order.items.select_related('order_item__menu_item')),
+        }),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures template costs with and without the cached loader: the one-off startup cost "
+        "of compiling every documents/ and documents/pdf/ template, and the per-render time of "
+        "each PDF template when it is recompiled on every render versus compiled once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50, help="Renders per PDF template (median is reported).")
+        parser.add_argument('--quotations', type=int, default=200, help="Size of the seeded dataset.")
+        parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        results = {'startup': self._startup()}
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_dataset(clients=20, quotations=options['quotations'], seed=1)
+            results['renders'] = self._renders(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['json_path']}"))
+
+    def _startup(self):
+        timings = preload_templates(engine=build_engine(cached=True))
+        self.stdout.write(f"{'startup: compile template':<48} {'ms':>8}")
+        for name, seconds in timings.items():
+            self.stdout.write(f"{name:<48} {seconds * 1000:>8.2f}")
+        total = sum(timings.values()) * 1000
+        self.stdout.write(self.style.SUCCESS(f"{'total (' + str(len(timings)) + ' templates)':<48} {total:>8.2f}"))
+        self.stdout.write("")
+        return {'templates': {name: seconds * 1000 for name, seconds in timings.items()}, 'total_ms': total}
+
+    def _renders(self, repeat):
+        uncached, cached = build_engine(cached=False), build_engine(cached=True)
+        preload_templates(document_template_names(), engine=cached)
+
+        self.stdout.write(f"{'per render (median ms)':<40} {'uncached':>9} {'cached':>9} {'saved':>7}")
+        results = {}
+        for name, context in pdf_contexts():
+            before = self._median(lambda: uncached.get_template(name).render(Context(context)), repeat)
+            after = self._median(lambda: cached.get_template(name).render(Context(context)), repeat)
+            saved = (before - after) / before * 100 if before else 0
+            results[name] = {'uncached_ms': before, 'cached_ms': after}
+            self.stdout.write(f"{name:<40} {before:>9.2f} {after:>9.2f} {saved:>6.0f}%")
+        return results
+
+    def _median(self, run, repeat):
+        run() # Warm up the database rows and totals the context reads
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,82 @@
+import os
+import time
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings as django_settings
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+
+from documents import views
+from documents.fulfillment import DELIVERABLE_ORDER_STATUSES, create_delivery_orders
+from documents.models import DeliveryOrder, Order, Setting
+from documents.pdfs import write_pdfs
+
+
+def delivery_order_pages(pks):
+    """(delivery order, PDF HTML) for each delivery order, read with three queries in all."""
+    settings = Setting.get_solo()
+    delivery_orders = (
+        DeliveryOrder.objects.filter(pk__in=pks)
+        .select_related('order', 'order__client')
+        .prefetch_related('items__order_item__menu_item')
+        .order_by('pk')
+    )
+    for delivery_order in delivery_orders:
+        context = {'delivery_order': delivery_order, 'items': delivery_order.items.all(), 'settings': settings}
+        yield delivery_order, render_to_string('documents/pdf/delivery_order_pdf.html', context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates a delivery order for everything not yet delivered on the CONFIRMED/IN_PROGRESS "
+        "orders of an event date (or the orders given with --order), in a handful of queries. "
+        "With --pdf-dir the delivery order PDFs are rendered too, in parallel worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help="Event date of the orders (YYYY-MM-DD).")
+        parser.add_argument('--order', type=int, action='append', dest='orders', default=[],
+                            help="Order id; may be repeated. Used instead of --date.")
+        parser.add_argument('--delivery-date', type=date.fromisoformat,
+                            help="Delivery date of the new delivery orders (default: each order's event date).")
+        parser.add_argument('--pdf-dir', help="Write DO-<number>.pdf files for the new delivery orders here.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Processes rendering PDFs in parallel.")
+        parser.add_argument('--base-url', default=Path(django_settings.BASE_DIR).as_uri() + '/',
+                            help="Base URL for images and stylesheets in the PDFs (default: the project directory).")
+
+    def handle(self, *args, **options):
+        if options['orders']:
+            order_ids = options['orders']
+        elif options['date']:
+            order_ids = list(Order.objects.filter(
+                event_date=options['date'], status__in=DELIVERABLE_ORDER_STATUSES,
+            ).values_list('pk', flat=True))
+        else:
+            raise CommandError("Give --date or at least one --order.")
+        if options['pdf_dir'] and views.weasyprint is None:
+            raise CommandError("WeasyPrint is not installed, so --pdf-dir cannot be used.")
+
+        started = time.perf_counter()
+        created, skipped = create_delivery_orders(order_ids, delivery_date=options['delivery_date'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(created)} delivery order(s) in {time.perf_counter() - started:.2f}s; "
+            f"skipped {len(skipped)} order(s) with nothing to deliver or not deliverable."))
+        for delivery_order in created:
+            self.stdout.write(f"  {delivery_order.do_number} for order {delivery_order.order_id}")
+
+        if options['pdf_dir'] and created:
+            self._render_pdfs([delivery_order.pk for delivery_order in created], options)
+
+    def _render_pdfs(self, pks, options):
+        directory = Path(options['pdf_dir'])
+        directory.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        # Pages are rendered here, where the database is; only the HTML goes to the workers
+        jobs = [(html, options['base_url'], str(directory / f"{delivery_order.do_number}.pdf"))
+                for delivery_order, html in delivery_order_pages(pks)]
+        paths = write_pdfs(jobs, options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(paths)} PDF(s) to {directory} in {time.perf_counter() - started:.2f}s "
+            f"with {options['workers']} worker(s)."))
@@ -0,0 +1,198 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client as HttpClient
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from documents import views
+from documents.models import (
+    Client, Quotation, Order, Invoice, DeliveryOrder, Setting,
+)
+from documents.seeding import seed_dataset
+
+
+def rolled_back(operation):
+    """Wrap a state-changing operation so every run starts from the same data."""
+    def run():
+        with transaction.atomic():
+            result = operation()
+            transaction.set_rollback(True)
+        return result
+    return run
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database and times list views, detail views, PDF renders, "
+        "finalize/convert operations and admin changelists. Query counts, wall time and "
+        "peak memory are written to a JSON file so runs can be compared."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100)
+        parser.add_argument('--quotations', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per scenario (median is reported).")
+        parser.add_argument('--only', help="Only run scenarios whose name contains this text.")
+        parser.add_argument('--output', default='bench_output.json', help="Where to write the JSON results.")
+        parser.add_argument('--compare', help="A previous results file to compare against.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                results = self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as fh:
+            json.dump(results, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as fh:
+                self._print_comparison(json.load(fh), results)
+
+    def _run(self, options):
+        self.stdout.write("Seeding benchmark data...")
+        counts = seed_dataset(clients=options['clients'], quotations=options['quotations'],
+                              seed=options['seed'], stdout=self.stdout)
+        Setting.get_solo()
+
+        scenarios = self._scenarios()
+        if options['only']:
+            scenarios = [s for s in scenarios if options['only'] in s[0]]
+
+        self.stdout.write("")
+        self.stdout.write(f"{'scenario':<34} {'median ms':>10} {'min ms':>9} {'queries':>8} {'peak KiB':>9}")
+        measured = {}
+        for name, run in scenarios:
+            if run is None:
+                measured[name] = {'skipped': True}
+                self.stdout.write(f"{name:<34} {'skipped':>10}")
+                continue
+            result = self._measure(run, options['repeat'])
+            measured[name] = result
+            flag = '' if result['ok'] else self.style.ERROR(f"  (status {result['status']})")
+            self.stdout.write(
+                f"{name:<34} {result['median_ms']:>10.2f} {result['min_ms']:>9.2f} "
+                f"{result['queries']:>8} {result['peak_kib']:>9.0f}{flag}"
+            )
+
+        return {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'vendor': connection.vendor,
+                'repeat': options['repeat'],
+                'counts': counts,
+            },
+            'scenarios': measured,
+        }
+
+    def _scenarios(self):
+        user = get_user_model().objects.create_superuser('bench', 'bench@example.com', 'bench')
+        http = HttpClient()
+        http.force_login(user)
+
+        def get(url):
+            return lambda: http.get(url)
+
+        # Pick representative documents: the newest ones with the related rows their pages show,
+        # and for the operations the first document in the state each one starts from.
+        client = Client.objects.order_by('-invoices__id').first()
+        quotation = Quotation.objects.exclude(status=Quotation.Status.DRAFT).order_by('-pk').first()
+        order = Order.objects.filter(items__isnull=False).order_by('-pk').first()
+        invoice = Invoice.objects.filter(payments__isnull=False).order_by('-pk').first()
+        delivery_order = DeliveryOrder.objects.order_by('-pk').first()
+        draft_invoice = Invoice.objects.filter(status=Invoice.Status.DRAFT).first()
+        draft_quotation = Quotation.objects.filter(status=Quotation.Status.DRAFT).first()
+        sent_quotation = Quotation.objects.filter(status=Quotation.Status.SENT).first()
+        unconverted = Quotation.objects.filter(status=Quotation.Status.ACCEPTED, orders__isnull=True).first()
+        confirmed_order = Order.objects.filter(status=Order.OrderStatus.CONFIRMED).first()
+
+        pdf_enabled = views.weasyprint is not None
+
+        def pdf(url_name, obj):
+            return get(reverse(url_name, args=[obj.pk])) if pdf_enabled and obj else None
+
+        def operation(fn, obj):
+            return rolled_back(fn) if obj else None
+
+        return [
+            ('list: quotations', get(reverse('documents:quotation_list'))),
+            ('list: invoices', get(reverse('documents:invoice_list'))),
+            ('list: orders', get(reverse('documents:order_list'))),
+            ('list: clients', get(reverse('documents:client_list'))),
+            ('list: delivery orders', get(reverse('documents:delivery_order_list'))),
+            ('detail: client', get(reverse('documents:client_detail', args=[client.pk]))),
+            ('detail: quotation', get(reverse('documents:quotation_detail', args=[quotation.pk]))),
+            ('detail: order', get(reverse('documents:order_detail', args=[order.pk]))),
+            ('detail: invoice', get(reverse('documents:invoice_detail', args=[invoice.pk]))),
+            ('detail: delivery order', get(reverse('documents:delivery_order_detail', args=[delivery_order.pk]))),
+            ('pdf: quotation', pdf('documents:quotation_pdf', quotation)),
+            ('pdf: order', pdf('documents:order_pdf', order)),
+            ('pdf: invoice', pdf('documents:invoice_pdf', invoice)),
+            ('pdf: delivery order', pdf('documents:delivery_order_pdf', delivery_order)),
+            ('op: invoice finalize', operation(lambda: Invoice.objects.get(pk=draft_invoice.pk).finalize(), draft_invoice)),
+            ('op: quotation finalize', operation(lambda: Quotation.objects.get(pk=draft_quotation.pk).finalize(), draft_quotation)),
+            ('op: quotation revise', operation(lambda: Quotation.objects.get(pk=sent_quotation.pk).create_revision(), sent_quotation)),
+            ('op: quotation to order', operation(lambda: Quotation.objects.get(pk=unconverted.pk).create_order(), unconverted)),
+            ('op: order to invoice', operation(lambda: Order.objects.get(pk=confirmed_order.pk).create_invoice(), confirmed_order)),
+            ('admin: quotations', get(reverse('admin:documents_quotation_changelist'))),
+            ('admin: invoices', get(reverse('admin:documents_invoice_changelist'))),
+            ('admin: orders', get(reverse('admin:documents_order_changelist'))),
+            ('admin: payments', get(reverse('admin:documents_payment_changelist'))),
+            ('admin: delivery orders', get(reverse('admin:documents_deliveryorder_changelist'))),
+            ('admin: credit notes', get(reverse('admin:documents_creditnote_changelist'))),
+        ]
+
+    def _measure(self, run, repeat):
+        run()  # Warm up caches (templates, URL resolver, settings)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+
+        # Query capture and tracemalloc both slow things down, so they get a run of their own.
+        with CaptureQueriesContext(connection) as captured:
+            tracemalloc.start()
+            result = run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        status = getattr(result, 'status_code', None)
+        return {
+            'median_ms': statistics.median(timings),
+            'min_ms': min(timings),
+            'queries': len(captured),
+            'peak_kib': peak / 1024,
+            'status': status,
+            'ok': status is None or status < 400,
+        }
+
+    def _print_comparison(self, previous, current):
+        self.stdout.write("")
+        self.stdout.write(f"{'scenario':<34} {'ms before':>10} {'ms after':>10} {'change':>8} {'queries':>12}")
+        for name, now in current['scenarios'].items():
+            before = previous.get('scenarios', {}).get(name)
+            if not before or before.get('skipped') or now.get('skipped'):
+                continue
+            change = (now['median_ms'] - before['median_ms']) / before['median_ms'] * 100 if before['median_ms'] else 0
+            queries = f"{before['queries']} -> {now['queries']}"
+            line = f"{name:<34} {before['median_ms']:>10.2f} {now['median_ms']:>10.2f} {change:>+7.0f}% {queries:>12}"
+            if change > 10:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from documents.seeding import seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a large, linked synthetic dataset (clients, quotations with revision chains, "
+        "orders, invoices, payments, delivery orders, credit notes) using bulk inserts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--menu-items', type=int, default=120)
+        parser.add_argument('--quotations', type=int, default=2000)
+        parser.add_argument('--items-per-document', type=int, default=6,
+                            help="Average number of line items per document.")
+        parser.add_argument('--revision-rate', type=float, default=0.2,
+                            help="Fraction of quotations that get revised at least once.")
+        parser.add_argument('--credit-note-rate', type=float, default=0.05,
+                            help="Fraction of issued invoices that get a credit note.")
+        parser.add_argument('--seed', type=int, default=1, help="Random seed, for reproducible datasets.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Seeding benchmark data...")
+        started = time.perf_counter()
+        counts = seed_dataset(
+            clients=options['clients'],
+            menu_items=options['menu_items'],
+            quotations=options['quotations'],
+            items_per_document=options['items_per_document'],
+            revision_rate=options['revision_rate'],
+            credit_note_rate=options['credit_note_rate'],
+            seed=options['seed'],
+            stdout=self.stdout,
+        )
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(f"Created {total} documents/records in {elapsed:.1f}s."))
@@ -0,0 +1,26 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from documents.sweeps import sweep_statuses
+
+
+class Command(BaseCommand):
+    help = (
+        "Marks invoices past their due date with a balance OVERDUE (and clears OVERDUE when the due "
+        "date has moved), and SENT quotations past their valid-until date EXPIRED. One UPDATE per "
+        "sweep; safe to run every few minutes from cron or a scheduler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help="Sweep as of this date (default: today).")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows that would change.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = sweep_statuses(today=options['date'], dry_run=options['dry_run'])
+        verb = "Would mark" if options['dry_run'] else "Marked"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {counts['overdue']} invoice(s) overdue, {counts['reopened']} no longer overdue and "
+            f"{counts['expired']} quotation(s) expired in {time.perf_counter() - started:.2f}s."))
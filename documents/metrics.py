@@ -0,0 +1,249 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Every worker process aggregates observations in memory and periodically
+writes them to its own file (metrics-<pid>.json) in DOCUMENTS_METRICS_DIR.
+The /metrics view merges all files, so any worker can answer a scrape with
+totals for the whole server. Files left by workers that have exited (a
+restart, a recycled worker) are deleted when a scrape finds their process
+gone, so their totals are not counted again. With DOCUMENTS_METRICS_DIR
+set to None nothing is written and /metrics shows this process alone.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import ContextDecorator
+from pathlib import Path
+
+from django.conf import settings
+
+
+DEFAULT_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_registry = {}
+_last_flush = 0.0
+_dirty = False
+
+
+def metrics_dir():
+    directory = getattr(settings, 'DOCUMENTS_METRICS_DIR', Path(settings.BASE_DIR) / 'metrics')
+    return Path(directory) if directory is not None else None
+
+
+def _snapshot():
+    """This process's values as plain data. Call with _lock held."""
+    return {
+        name: dict(metric.values) if metric.kind == 'counter' else {
+            key: {'buckets': list(v['buckets']), 'sum': v['sum'], 'count': v['count']}
+            for key, v in metric.values.items()
+        }
+        for name, metric in _registry.items() if metric.values
+    }
+
+
+def _label_key(labelnames, labels):
+    # The label set rendered as Prometheus text is also the storage key.
+    return ','.join(f'{name}="{labels[name]}"' for name in labelnames)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return _label_key(self.labelnames, labels)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _changed()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_SECONDS_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+        _changed()
+
+    def time(self, **labels):
+        """Context manager/decorator observing the wrapped block's duration in seconds."""
+        return _Timer(self, labels)
+
+
+class _Timer(ContextDecorator):
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def _recreate_cm(self):
+        # A fresh timer per call, so a decorated function is safe across threads.
+        return _Timer(self.histogram, self.labels)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+# --- Metrics collected by the documents app ---
+
+PDF_RENDER_SECONDS = Histogram(
+    'documents_pdf_render_seconds', "Time to render a PDF, template included.", ['document'])
+PDF_TEMPLATE_SECONDS = Histogram(
+    'documents_pdf_template_seconds', "Time to render a PDF's HTML template, before WeasyPrint.", ['document'])
+PDF_BYTES = Histogram(
+    'documents_pdf_bytes', "Size of rendered PDFs in bytes.", ['document'],
+    buckets=(10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000))
+PDF_FAILURES = Counter(
+    'documents_pdf_failures_total', "PDF renders that raised an error.", ['document'])
+OPERATION_SECONDS = Histogram(
+    'documents_operation_seconds',
+    "Duration of document workflow operations (finalize, create_revision, create_order, create_invoice).",
+    ['document', 'operation'])
+PAYMENT_RECOMPUTE_SECONDS = Histogram(
+    'documents_payment_recompute_seconds', "Time spent recomputing an invoice's status after a payment change.")
+VIEW_QUERIES = Histogram(
+    'documents_view_queries', "SQL queries issued per request.", ['view'],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+VIEW_SECONDS = Histogram(
+    'documents_view_seconds', "Request handling time.", ['view'])
+
+
+# --- Persistence and exposition ---
+
+def _changed():
+    global _dirty
+    _dirty = True
+    if time.monotonic() - _last_flush >= getattr(settings, 'DOCUMENTS_METRICS_FLUSH_INTERVAL', 5):
+        flush()
+
+
+def flush(force=False):
+    """Write this process's values to its own file (atomically)."""
+    global _dirty, _last_flush
+    directory = metrics_dir()
+    if directory is None:
+        return
+    with _lock:
+        if not (_dirty or force):
+            return
+        data = _snapshot()
+        _dirty = False
+        _last_flush = time.monotonic()
+    directory.mkdir(parents=True, exist_ok=True)
+    # A temporary file of its own, as a periodic and a forced flush may overlap
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix='metrics-', suffix='.tmp', delete=False) as tmp:
+        tmp.write(json.dumps(data))
+    os.replace(tmp.name, directory / f"metrics-{os.getpid()}.json")
+
+
+atexit.register(flush)
+
+
+def _pid_alive(pid):
+    if os.name != 'posix':
+        return True # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # Alive, owned by another user
+    return True
+
+
+def collect():
+    """
+    Merge the files of all live worker processes into {name: {labels: value}},
+    deleting those of processes that have exited.
+    """
+    merged = {}
+    directory = metrics_dir()
+    if directory is None:
+        with _lock:
+            return _snapshot()
+    if not directory.is_dir():
+        return merged
+    for path in directory.glob('metrics-*.json'):
+        pid = path.stem.removeprefix('metrics-')
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            path.unlink(missing_ok=True)
+            continue
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # Being replaced right now; it will be in the next scrape
+        for name, values in data.items():
+            metric = _registry.get(name)
+            if metric is None:
+                continue
+            target = merged.setdefault(name, {})
+            for key, value in values.items():
+                if metric.kind == 'counter':
+                    target[key] = target.get(key, 0) + value
+                else:
+                    entry = target.setdefault(key, {'buckets': [0] * len(metric.buckets), 'sum': 0, 'count': 0})
+                    entry['buckets'] = [a + b for a, b in zip(entry['buckets'], value['buckets'])]
+                    entry['sum'] += value['sum']
+                    entry['count'] += value['count']
+    return merged
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_text():
+    """Prometheus text exposition format (version 0.0.4)."""
+    flush(force=True)
+    merged = collect()
+    lines = []
+    for name, metric in _registry.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(merged.get(name, {}).items()):
+            if metric.kind == 'counter':
+                lines.append(f"{name}{{{key}}} {_format_value(value)}" if key else f"{name} {_format_value(value)}")
+                continue
+            prefix = f"{key}," if key else ''
+            for bound, count in zip(metric.buckets, value['buckets']):
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {value["count"]}')
+            labels = f"{{{key}}}" if key else ''
+            lines.append(f"{name}_sum{labels} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{labels} {value['count']}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,231 @@
+import json
+import logging
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+from . import metrics
+from .routers import pin_to_primary, read_replicas
+
+
+logger = logging.getLogger('documents.performance')
+
+# Stats for the request currently being handled (None outside instrumented requests).
+_current_stats = ContextVar('documents_request_stats', default=None)
+
+_NUMBER_RE = re.compile(r"\b\d+\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST_RE = re.compile(r"\bIN \((?:\?|%s)(?:, (?:\?|%s))*\)", re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """
+    Normalize a SQL statement so that the same query issued with different
+    values (the typical N+1 loop) produces the same fingerprint.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    return _IN_LIST_RE.sub('IN (...)', sql)
+
+
+def _project_stack():
+    """The current call stack, limited to frames from this project's own code."""
+    base_dir = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir) and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames))
+
+
+class RequestStats:
+    """Counters collected while a single request is handled."""
+
+    def __init__(self, duplicate_threshold, slow_query_ms):
+        self.duplicate_threshold = duplicate_threshold
+        self.slow_query_ms = slow_query_ms
+        self.query_count = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.view_ms = 0.0
+        self.fingerprints = Counter()
+        self.stacks = {}  # fingerprint/slow SQL -> stack trace of the offending call site
+        self._template_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        """Connection execute_wrapper: time every query and track repeats."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.query_count += 1
+            self.sql_ms += elapsed
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            # Stack traces are only captured once a query crosses a threshold, so the
+            # normal path stays cheap.
+            if self.fingerprints[key] == self.duplicate_threshold:
+                self.stacks[key] = _project_stack()
+            elif self.slow_query_ms and elapsed >= self.slow_query_ms and sql not in self.stacks:
+                self.stacks[sql] = _project_stack()
+
+    @property
+    def duplicates(self):
+        """Fingerprints executed at least DOCUMENTS_DUPLICATE_QUERY_THRESHOLD times."""
+        return {sql: count for sql, count in self.fingerprints.items() if count >= self.duplicate_threshold}
+
+    def as_dict(self):
+        return {
+            'queries': self.query_count,
+            'sql_ms': round(self.sql_ms, 2),
+            'template_ms': round(self.template_ms, 2),
+            'view_ms': round(self.view_ms, 2),
+            'duplicates': len(self.duplicates),
+        }
+
+    def server_timing(self):
+        return ', '.join([
+            f'sql;dur={self.sql_ms:.2f};desc="{self.query_count} queries, {len(self.duplicates)} duplicated"',
+            f'tpl;dur={self.template_ms:.2f}',
+            f'view;dur={self.view_ms:.2f}',
+        ])
+
+
+def _timed_render(original):
+    def render(self, context):
+        stats = _current_stats.get()
+        if stats is None:
+            return original(self, context)
+        # Included templates render inside their parent, only time the outermost one.
+        stats._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            stats._template_depth -= 1
+            if stats._template_depth == 0:
+                stats.template_ms += (time.perf_counter() - started) * 1000
+    render._documents_timed = True
+    return render
+
+
+def _install_template_timer():
+    if not getattr(Template.render, '_documents_timed', False):
+        Template.render = _timed_render(Template.render)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records SQL query count, SQL time, duplicated queries (N+1 candidates),
+    view time and template render time for requests under
+    DOCUMENTS_INSTRUMENTATION_PATHS. Results are sent back in a Server-Timing
+    header and logged to the 'documents.performance' logger; requests that
+    repeat a query DOCUMENTS_DUPLICATE_QUERY_THRESHOLD times or run a query
+    slower than DOCUMENTS_SLOW_QUERY_MS also log the offending call sites.
+
+    Should be placed last in MIDDLEWARE so 'view' time is mostly the view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'DOCUMENTS_INSTRUMENTATION', True)
+        self.paths = tuple(getattr(settings, 'DOCUMENTS_INSTRUMENTATION_PATHS', ['/docs/', '/admin/documents/']))
+        self.duplicate_threshold = getattr(settings, 'DOCUMENTS_DUPLICATE_QUERY_THRESHOLD', 10)
+        self.slow_query_ms = getattr(settings, 'DOCUMENTS_SLOW_QUERY_MS', 100)
+        if self.enabled:
+            _install_template_timer()
+
+    def __call__(self, request):
+        if not self.enabled or not request.path.startswith(self.paths):
+            return self.get_response(request)
+
+        stats = RequestStats(self.duplicate_threshold, self.slow_query_ms)
+        request.perf_stats = stats
+        token = _current_stats.set(stats)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats.record_query))
+                started = time.perf_counter()
+                response = self.get_response(request)
+                stats.view_ms = (time.perf_counter() - started) * 1000
+        finally:
+            _current_stats.reset(token)
+
+        response['Server-Timing'] = stats.server_timing()
+        view_name = request.resolver_match.view_name if request.resolver_match else 'unresolved'
+        metrics.VIEW_QUERIES.observe(stats.query_count, view=view_name)
+        metrics.VIEW_SECONDS.observe(stats.view_ms / 1000, view=view_name)
+        self._log(request, response, stats)
+        return response
+
+    def _log(self, request, response, stats):
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **stats.as_dict(),
+            'duplicated_queries': dict(Counter(stats.duplicates).most_common(5)),
+        }
+        logger.info(json.dumps(record))
+
+        for sql, stack in stats.stacks.items():
+            count = stats.fingerprints.get(sql, 1)
+            logger.warning(
+                "%s %s: query ran %d time(s): %s\n%s",
+                request.method, request.path, count, sql, stack,
+            )
+
+
+class RequestProfilingMiddleware:
+    """
+    Staff-only, on-demand profiling of a single request. Add
+    ?<DOCUMENTS_PROFILE_PARAM>=1 to the URL or send the X-Profile-Request
+    header and the rest of the request runs under cProfile with a stack
+    sampler; the results are saved under DOCUMENTS_PROFILE_DIR and listed at
+    /admin/documents/profiles/. Untriggered requests only pay for two
+    dictionary lookups.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.param = getattr(settings, 'DOCUMENTS_PROFILE_PARAM', '_profile')
+
+    def __call__(self, request):
+        if self.param not in request.GET and 'HTTP_X_PROFILE_REQUEST' not in request.META:
+            return self.get_response(request)
+        if not request.user.is_staff:
+            return self.get_response(request)
+
+        from .profiling import profile_call, save_profile
+
+        response, profiler, sampler, seconds = profile_call(lambda: self.get_response(request))
+        name = save_profile(request, response, profiler, sampler, seconds)
+        response['X-Profile-Name'] = name
+        return response
+
+
+class PrimaryPinMiddleware:
+    """
+    Read-after-write consistency for replica reads: after any unsafe request
+    (a save, a finalize, a payment...) the session reads from the primary
+    for DOCUMENTS_REPLICA_PIN_SECONDS. See documents.routers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and read_replicas():
+            pin_to_primary(request)
+        return response
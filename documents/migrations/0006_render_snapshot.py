@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='render_snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='quotation',
+            name='render_snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
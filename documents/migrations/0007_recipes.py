@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-19 07:29
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_render_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('unit', models.CharField(help_text='Purchasing unit, e.g. kg, L, pcs', max_length=20)),
+                ('notes', models.TextField(blank=True, default='', help_text='Supplier, pack size or storage notes.')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=4, help_text="Ingredient quantity, in the ingredient's unit, per unit of the menu item.", max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.0001'))])),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='recipe_lines', to='documents.ingredient')),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_lines', to='documents.menuitem')),
+            ],
+            options={
+                'ordering': ['id'],
+                'constraints': [models.UniqueConstraint(fields=('menu_item', 'ingredient'), name='recipeline_unique_ingredient')],
+            },
+        ),
+    ]
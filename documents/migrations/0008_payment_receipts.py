@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-19 07:39
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_recipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt_date', models.DateField(default=django.utils.timezone.now)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))])),
+                ('payment_method', models.CharField(blank=True, choices=[('BANK', 'Bank Transfer'), ('CASH', 'Cash'), ('CHEQUE', 'Cheque'), ('CARD', 'Credit Card'), ('ONLINE', 'Online Payment Gateway'), ('OTHER', 'Other')], max_length=10, null=True)),
+                ('reference_number', models.CharField(blank=True, default='', help_text='E.g., Transaction ID, Cheque No. Copied to each allocated payment.', max_length=100)),
+                ('notes', models.TextField(blank=True, default='', help_text='Internal notes about the receipt')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='payment_receipts', to='documents.client')),
+            ],
+            options={
+                'verbose_name': 'Payment Receipt',
+                'verbose_name_plural': 'Payment Receipts',
+                'ordering': ['-receipt_date', '-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='receipt',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='documents.paymentreceipt'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentreceipt',
+            index=models.Index(fields=['client', '-receipt_date'], name='receipt_client_date_idx'),
+        ),
+    ]
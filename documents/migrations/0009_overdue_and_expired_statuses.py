@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_payment_receipts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='invoice_open_due_idx',
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='status',
+            field=models.CharField(choices=[('DRAFT', 'Draft'), ('SENT', 'Sent'), ('PAID', 'Paid'), ('PART_PAID', 'Partially Paid'), ('CANCELLED', 'Cancelled'), ('OVERDUE', 'Overdue')], default='DRAFT', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='quotation',
+            name='status',
+            field=models.CharField(choices=[('DRAFT', 'Draft'), ('SENT', 'Sent'), ('ACCEPTED', 'Accepted'), ('REJECTED', 'Rejected'), ('SUPERSEDED', 'Superseded'), ('EXPIRED', 'Expired')], default='DRAFT', max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status__in', ['SENT', 'PART_PAID', 'OVERDUE'])), fields=['due_date'], name='invoice_open_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quotation',
+            index=models.Index(fields=['status', 'valid_until'], name='quotation_status_valid_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_overdue_and_expired_statuses'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quotation',
+            name='status',
+            field=models.CharField(choices=[('DRAFT', 'Draft'), ('SENT', 'Sent'), ('ACCEPTED', 'Accepted'), ('REJECTED', 'Rejected'), ('SUPERSEDED', 'Superseded'), ('EXPIRED', 'Expired'), ('CANCELLED', 'Cancelled')], default='DRAFT', max_length=15),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-19 08:15
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def freeze_existing(apps, schema_editor):
+    """Fill in the frozen grand total and discount of documents finalized before these fields existed."""
+    for name in ('Quotation', 'Invoice'):
+        model = apps.get_model('documents', name)
+        documents = list(model.objects.filter(render_snapshot__isnull=False))
+        for document in documents:
+            document.render_snapshot['discount'] = {
+                'type': document.discount_type, 'value': str(document.discount_value),
+            }
+            document.frozen_grand_total_cents = int(Decimal(document.render_snapshot['totals']['grand_total']) * 100)
+        model.objects.bulk_update(documents, ['render_snapshot', 'frozen_grand_total_cents'], batch_size=200)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_quotation_cancelled_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='frozen_grand_total_cents',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='quotation',
+            name='frozen_grand_total_cents',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(freeze_existing, migrations.RunPython.noop),
+    ]
@@ -4,6 +4,7 @@ from solo.models import SingletonModel
 from django.utils import timezone # For default dates
 from django.db import transaction
 from django.db.models import Sum
+from django.db.models.expressions import RawSQL
 from django.conf import settings # Needed for ForeignKey to User if we add created_by later
 from django.urls import reverse
 from datetime import timedelta # Needed for adding days to a date
@@ -11,7 +12,28 @@ from django.db import models
 from django.apps import apps
 from decimal import Decimal
 
+from .metrics import OPERATION_SECONDS
+from .snapshots import FROZEN_FIELDS, freeze, frozen_totals, snapshot_discount
+
 # Create your models here.
+class ListQuerySet(models.QuerySet):
+    """
+    for_list() is the projection for list pages, the client detail sublists
+    and the admin changelists: it loads list_fields (and the list_related
+    rows they reach) and leaves out the large text fields those pages
+    never show.
+    """
+    list_related = ()
+    list_fields = ()
+
+    def for_list(self):
+        return self.select_related(*self.list_related).only(*self.list_fields)
+
+
+class ClientQuerySet(ListQuerySet):
+    list_fields = ('name', 'email', 'phone', 'created_at', 'updated_at')
+
+
 class Client(models.Model):
     """Represents a client (customer)"""
     name = models.CharField(max_length=255)
@@ -28,6 +50,8 @@ class Client(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ClientQuerySet.as_manager()
+
     def get_admin_url(self):
         """
         Returns the URL to the admin change page for this client instance.
@@ -39,6 +63,10 @@ class Client(models.Model):
         return self.name
     
 
+class MenuItemQuerySet(ListQuerySet):
+    list_fields = ('name', 'unit_price', 'unit', 'is_active', 'updated_at')
+
+
 class MenuItem(models.Model):
     """
     Represents a menu item or service offered.
@@ -71,11 +99,58 @@ class MenuItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MenuItemQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
     class Meta:
         ordering = ['name'] # Order items alphabetically by name by default
+        indexes = [
+            # Item pickers and the admin only ever list active items by name
+            models.Index(fields=['name'], condition=models.Q(is_active=True), name='menuitem_active_name_idx'),
+        ]
+
+
+class Ingredient(models.Model):
+    """
+    Something the kitchen buys, in the unit it is bought and counted in.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    unit = models.CharField(max_length=20, help_text="Purchasing unit, e.g. kg, L, pcs")
+    notes = models.TextField(blank=True, default='', help_text="Supplier, pack size or storage notes.")
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.unit})"
+
+    class Meta:
+        ordering = ['name']
+
+
+class RecipeLine(models.Model):
+    """
+    How much of an ingredient goes into one unit of a menu item (one
+    person, pack, tray, ... as the menu item's unit says).
+    """
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='recipe_lines')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.PROTECT, related_name='recipe_lines')
+    quantity = models.DecimalField(
+        max_digits=12, decimal_places=4,
+        validators=[MinValueValidator(Decimal('0.0001'))],
+        help_text="Ingredient quantity, in the ingredient's unit, per unit of the menu item.")
+
+    def __str__(self):
+        return f"{self.quantity} {self.ingredient.unit} {self.ingredient.name} per {self.menu_item.name}"
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['menu_item', 'ingredient'], name='recipeline_unique_ingredient'),
+        ]
 
 
 class DiscountType(models.TextChoices):
@@ -84,7 +159,161 @@ class DiscountType(models.TextChoices):
     FIXED = 'FIXED', 'Fixed Amount (RM)'
 
 
-class Quotation(models.Model):
+class DocumentTotals:
+    """
+    Subtotal, discount, tax and grand total of a quotation, order, invoice or
+    credit note, computed in a single pass over its line items.
+    """
+    def __init__(self, items, discount_type, discount_value, tax_enabled=False, tax_rate=Decimal("0.00")):
+        cent = Decimal("0.01")
+        self.subtotal = sum((item.line_total for item in items), Decimal('0.00')).quantize(cent)
+
+        if discount_type == DiscountType.PERCENTAGE and discount_value > 0:
+            self.discount_amount = (self.subtotal * (discount_value / Decimal(100))).quantize(cent)
+        elif discount_type == DiscountType.FIXED and discount_value > 0:
+            self.discount_amount = min(self.subtotal, discount_value).quantize(cent)
+        else:
+            self.discount_amount = Decimal("0.00")
+
+        self.total_before_tax = (self.subtotal - self.discount_amount).quantize(cent)
+        if tax_enabled and tax_rate > 0:
+            self.tax_amount = (self.total_before_tax * (tax_rate / Decimal(100))).quantize(cent) # e.g., 6.00 -> 0.06
+        else:
+            self.tax_amount = Decimal("0.00")
+        self.grand_total = (self.total_before_tax + self.tax_amount).quantize(cent)
+
+
+class DocumentTotalsMixin:
+    """
+    Totals for documents whose line items use related_name 'items'.
+    They are computed once per instance and reuse prefetched items when present.
+    The memo is dropped when the discount or the settings change, and by
+    invalidate_totals(), which the item signals call when items change.
+    """
+
+    def get_totals(self, settings=None):
+        """
+        Return the memoized DocumentTotals. Pass the Setting instance when
+        the caller already has it, to save a query.
+        """
+        Setting = apps.get_model('documents', 'Setting')
+        key = (self.discount_type, self.discount_value, Setting.generation)
+        cached = self.__dict__.get('_totals_cache')
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        if settings is None:
+            settings = Setting.get_solo()
+        totals = DocumentTotals(
+            self.items.all(), self.discount_type, self.discount_value,
+            tax_enabled=settings.tax_enabled, tax_rate=settings.tax_rate,
+        )
+        self._totals_cache = (key, totals)
+        return totals
+
+    def invalidate_totals(self):
+        """Forget memoized totals and any prefetched items/payments/credit notes."""
+        self.__dict__.pop('_totals_cache', None)
+        self.__dict__.pop('_amount_paid_cache', None)
+        self.__dict__.pop('_amount_credited_cache', None)
+        self.__dict__.pop('db_credited', None)
+        prefetched = getattr(self, '_prefetched_objects_cache', None)
+        if prefetched:
+            prefetched.pop('items', None)
+            prefetched.pop('payments', None)
+            prefetched.pop('credit_notes', None)
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.invalidate_totals()
+        super().refresh_from_db(*args, **kwargs)
+
+    @property
+    def subtotal(self):
+        """Sum of all line item totals before discounts/taxes."""
+        return self.get_totals().subtotal
+
+    @property
+    def discount_amount(self):
+        """The discount amount based on type and value."""
+        return self.get_totals().discount_amount
+
+    @property
+    def total_before_tax(self):
+        """Total after discount but before tax."""
+        return self.get_totals().total_before_tax
+
+    @property
+    def tax_amount(self):
+        """Tax amount based on settings and total_before_tax."""
+        return self.get_totals().tax_amount
+
+    @property
+    def grand_total(self):
+        """The final total including discounts and tax."""
+        return self.get_totals().grand_total
+
+
+class TouchOnSaveMixin:
+    """
+    Partial saves (update_fields) also write updated_at, so status and number
+    changes bump it too. updated_at versions the document's cached list row.
+    """
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'updated_at' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'updated_at']
+        super().save(*args, **kwargs)
+
+
+class FrozenTotalsMixin:
+    """
+    For quotations and invoices, whose finalize() freezes a render snapshot
+    (see documents.snapshots): while it is set, the totals are the frozen
+    ones rather than recomputed from the items and today's tax rate.
+    Saving a changed discount clears the snapshot, so the document goes
+    back to live totals as it does when an item changes.
+    """
+
+    def get_totals(self, settings=None):
+        snapshot = self.__dict__.get('render_snapshot')
+        if snapshot:
+            return frozen_totals(snapshot)
+        return super().get_totals(settings)
+
+    @property
+    def grand_total(self):
+        """The final total including discounts and tax; the frozen one once finalized."""
+        frozen = self.__dict__.get('frozen_grand_total_cents')
+        if frozen is not None:
+            return (Decimal(frozen) / 100).quantize(Decimal("0.01"))
+        return super().grand_total
+
+    def save(self, *args, **kwargs):
+        snapshot = self.__dict__.get('render_snapshot')
+        update_fields = kwargs.get('update_fields')
+        discount_saved = update_fields is None or bool(set(TOTALS_FIELDS) & set(update_fields))
+        if snapshot and discount_saved and snapshot.get('discount') != snapshot_discount(self):
+            self.render_snapshot = None
+            self.frozen_grand_total_cents = None
+            self.invalidate_totals()
+            if update_fields is not None:
+                kwargs['update_fields'] = [*update_fields, *FROZEN_FIELDS]
+        super().save(*args, **kwargs)
+
+
+# Columns a document's list row needs besides its own: the client's name and
+# the updated_at stamps versioning cached rows (see documents.caching)
+CLIENT_LIST_FIELDS = ('client__name', 'client__updated_at')
+TOTALS_FIELDS = ('discount_type', 'discount_value')
+
+
+class QuotationQuerySet(ListQuerySet):
+    list_related = ('client',)
+    list_fields = ('quotation_number', 'title', 'status', 'version', 'issue_date', 'valid_until',
+                   'updated_at', 'frozen_grand_total_cents', *TOTALS_FIELDS, *CLIENT_LIST_FIELDS)
+
+
+class Quotation(FrozenTotalsMixin, TouchOnSaveMixin, DocumentTotalsMixin, models.Model):
     """
     Represents a quotation document header.
     """
@@ -94,6 +323,8 @@ class Quotation(models.Model):
         ACCEPTED = 'ACCEPTED', 'Accepted'
         REJECTED = 'REJECTED', 'Rejected'
         SUPERSEDED = 'SUPERSEDED', 'Superseded'
+        EXPIRED = 'EXPIRED', 'Expired' # SENT past valid_until; set by manage.py sweep_statuses
+        CANCELLED = 'CANCELLED', 'Cancelled'
 
     quotation_number = models.CharField(
         max_length=50, 
@@ -131,52 +362,17 @@ class Quotation(models.Model):
     terms_and_conditions = models.TextField(blank=True, default='')
     notes = models.TextField(blank=True, default='', help_text="Internal notes, not shown to client")
 
+    # Everything needed to render the finalized document; see documents.snapshots
+    render_snapshot = models.JSONField(null=True, blank=True, editable=False)
+    frozen_grand_total_cents = models.BigIntegerField(null=True, blank=True, editable=False)
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-        
-    @property
-    def subtotal(self):
-        """Calculate sum of all line item totals before discounts/taxes."""
-        return sum((item.line_total for item in self.items.all()), Decimal('0.00')).quantize(Decimal("0.01"))
+    objects = QuotationQuerySet.as_manager()
 
-    @property
-    def discount_amount(self):
-        """Calculate the discount amount based on type and value."""
-        if self.discount_type == DiscountType.NONE or self.discount_value <= 0:
-            return Decimal("0.00")
-
-        sub = self.subtotal # Use the subtotal property
-        if self.discount_type == DiscountType.PERCENTAGE:
-            amount = (sub * (self.discount_value / Decimal(100))).quantize(Decimal("0.01"))
-            return amount
-        elif self.discount_type == DiscountType.FIXED:
-            amount = min(sub, self.discount_value).quantize(Decimal("0.01"))
-            return amount
-        return Decimal("0.00")
-
-    @property
-    def total_before_tax(self):
-        """Calculate total after discount but before tax."""
-        return (self.subtotal - self.discount_amount).quantize(Decimal("0.01"))
-
-    @property
-    def tax_amount(self):
-        """Calculate tax amount based on settings and total_before_tax."""
-        Setting = apps.get_model('documents', 'Setting')
-        settings = Setting.get_solo()
-        if settings.tax_enabled and settings.tax_rate > 0:
-            tax_rate = settings.tax_rate / Decimal(100) # e.g., 6.00 -> 0.06
-            amount = (self.total_before_tax * tax_rate).quantize(Decimal("0.01"))
-            return amount
-        return Decimal("0.00")
-
-    @property
-    def grand_total(self):
-        """Calculate the final total including discounts and tax."""
-        return (self.total_before_tax + self.tax_amount).quantize(Decimal("0.01"))
-    
+        
     def get_admin_url(self):
         """
         Returns the URL to the admin change page for this quotation instance.
@@ -184,6 +380,7 @@ class Quotation(models.Model):
         # Uses the standard admin URL naming convention: admin:<app_label>_<model_name>_change
         return reverse('admin:documents_quotation_change', args=[self.pk])
     
+    @OPERATION_SECONDS.time(document='quotation', operation='finalize')
     @transaction.atomic
     def finalize(self):
         """
@@ -201,11 +398,12 @@ class Quotation(models.Model):
         if not self.issue_date:
             self.issue_date = timezone.now().date()
 
+        Setting = apps.get_model('documents', 'Setting')
+        settings = Setting.get_solo()
+
         # Set valid_until if it's not already set AND issue_date is now available
         if not self.valid_until and self.issue_date:
             try:
-                Setting = apps.get_model('documents', 'Setting')
-                settings = Setting.get_solo()
                 validity_days = getattr(settings, 'default_validity_days', 0)
                 if validity_days > 0:
                     self.valid_until = self.issue_date + timedelta(days=validity_days)
@@ -215,8 +413,9 @@ class Quotation(models.Model):
                 pass
 
         self.status = self.Status.SENT
+        freeze(self, settings)
         # Define which fields to update
-        fields_to_update = ['status']
+        fields_to_update = ['status', *FROZEN_FIELDS]
         if self.issue_date: # Only add to update_fields if it was potentially changed
             fields_to_update.append('issue_date')
         if self.valid_until: # Only add to update_fields if it was potentially changed
@@ -243,9 +442,11 @@ class Quotation(models.Model):
         self.status = self.Status.DRAFT
         self.issue_date = None
         self.valid_until = None
+        self.render_snapshot = None
+        self.frozen_grand_total_cents = None
 
         # Define which fields to update
-        fields_to_update = ['status', 'issue_date', 'valid_until']
+        fields_to_update = ['status', 'issue_date', 'valid_until', *FROZEN_FIELDS]
         self.save(update_fields=fields_to_update)
         return True
 
@@ -254,7 +455,17 @@ class Quotation(models.Model):
     
     class Meta:
         ordering = ['-issue_date', '-created_at'] # Show newest quotes first by default
-
+        indexes = [
+            # Matches the default ordering used by the list view and changelist
+            models.Index(fields=['-issue_date', '-created_at'], name='quotation_issued_idx'),
+            models.Index(fields=['status', '-issue_date'], name='quotation_status_idx'),
+            # The expiry sweep finds SENT quotations past valid_until
+            models.Index(fields=['status', 'valid_until'], name='quotation_status_valid_idx'),
+            # Client detail page: latest quotations for one client
+            models.Index(fields=['client', '-issue_date', '-created_at'], name='quotation_client_issued_idx'),
+        ]
+
+    @OPERATION_SECONDS.time(document='quotation', operation='create_revision')
     @transaction.atomic # Ensure all operations succeed or fail together
     def create_revision(self):
         """
@@ -279,7 +490,7 @@ class Quotation(models.Model):
 
         # Create a new instance (don't save yet)
         # Exclude fields that should not be copied directly
-        excluded_fields = {'id', 'pk', '_state', 'quotation_number', 'status', 'version', 'previous_version', 'created_at', 'updated_at'}
+        excluded_fields = {'id', 'pk', '_state', 'quotation_number', 'status', 'version', 'previous_version', 'created_at', 'updated_at', *FROZEN_FIELDS}
         new_quote_data = {}
         for field in self._meta.get_fields():
             if field.name not in excluded_fields and hasattr(self, field.name):
@@ -319,6 +530,7 @@ class Quotation(models.Model):
 
         return new_quote
     
+    @OPERATION_SECONDS.time(document='quotation', operation='create_order')
     @transaction.atomic
     def create_order(self):
         """
@@ -410,7 +622,13 @@ class QuotationItem(models.Model):
         ordering = ['id'] # Order items by creation order within a quote
 
 
-class Order(models.Model):
+class OrderQuerySet(ListQuerySet):
+    list_related = ('client',)
+    list_fields = ('order_number', 'title', 'status', 'event_date', 'created_at', 'updated_at',
+                   *TOTALS_FIELDS, *CLIENT_LIST_FIELDS)
+
+
+class Order(TouchOnSaveMixin, DocumentTotalsMixin, models.Model):
     """
     Represents a confirmed order or event booking, potentially linked from a Quotation.
     Acts as the source for generating Invoices and Delivery Orders.
@@ -456,64 +674,25 @@ class Order(models.Model):
         help_text="Enter percentage (e.g., 10.00 for 10%) or fixed amount for overall order discount."
     )
 
-    @property
-    def subtotal(self):
-        """Calculate sum of all line item totals before discounts/taxes."""
-        # Use the related_name 'items' from OrderItem's ForeignKey
-        return sum((item.line_total for item in self.items.all()), Decimal('0.00')).quantize(Decimal("0.01"))
-
-    @property
-    def discount_amount(self):
-        """Calculate the discount amount based on type and value."""
-        # Reuse the logic from Quote/Invoice
-        if self.discount_type == DiscountType.NONE or self.discount_value <= 0:
-            return Decimal("0.00")
-
-        sub = self.subtotal # Use the subtotal property we just defined
-        if self.discount_type == DiscountType.PERCENTAGE:
-            amount = (sub * (self.discount_value / Decimal(100))).quantize(Decimal("0.01"))
-            return amount
-        elif self.discount_type == DiscountType.FIXED:
-            amount = min(sub, self.discount_value).quantize(Decimal("0.01"))
-            return amount
-        return Decimal("0.00")
-    
-    @property
-    def total_before_tax(self):
-        """Calculate total after discount but before tax."""
-        return (self.subtotal - self.discount_amount).quantize(Decimal("0.01"))
-
-    @property
-    def tax_amount(self):
-        """Calculate tax amount based on settings and total_before_tax."""
-        # Use dynamic model loading for Setting
-        Setting = apps.get_model('documents', 'Setting')
-        try:
-            settings = Setting.get_solo()
-            if settings.tax_enabled and settings.tax_rate > 0:
-                tax_rate = settings.tax_rate / Decimal(100)
-                amount = (self.total_before_tax * tax_rate).quantize(Decimal("0.01"))
-                return amount
-        except Setting.DoesNotExist:
-            pass # Settings not created yet
-        return Decimal("0.00")
-
-    @property
-    def grand_total(self):
-        """Calculate the final total including discounts and tax."""
-        return (self.total_before_tax + self.tax_amount).quantize(Decimal("0.01"))
-
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OrderQuerySet.as_manager()
+
     def __str__(self):
         num = self.order_number if self.order_number else "Draft Order"
         return f"Order {num} ({self.client.name})"
 
     class Meta:
         ordering = ['-event_date', '-created_at']
+        indexes = [
+            models.Index(fields=['-event_date', '-created_at'], name='order_event_idx'),
+            models.Index(fields=['status', 'event_date'], name='order_status_event_idx'),
+            models.Index(fields=['client', '-event_date', '-created_at'], name='order_client_event_idx'),
+        ]
 
+    @OPERATION_SECONDS.time(document='order', operation='create_invoice')
     @transaction.atomic
     def create_invoice(self):
         """
@@ -635,7 +814,36 @@ class OrderItem(models.Model):
         ordering = ['id'] # Order items by creation order within an order
 
 
-class Invoice(models.Model):
+# Invoice statuses that still expect payment.
+OPEN_INVOICE_STATUSES = ['SENT', 'PART_PAID', 'OVERDUE']
+
+
+class InvoiceQuerySet(ListQuerySet):
+    list_related = ('client',)
+    list_fields = ('invoice_number', 'title', 'status', 'issue_date', 'due_date', 'updated_at',
+                   'frozen_grand_total_cents', *TOTALS_FIELDS, *CLIENT_LIST_FIELDS)
+
+    def open(self):
+        """Invoices still awaiting payment."""
+        return self.filter(status__in=OPEN_INVOICE_STATUSES)
+
+    def open_due_before(self, day):
+        """
+        Open invoices due before day, by due date: the list served by the
+        partial index 'invoice_open_due_idx'. The status condition is
+        emitted as literal SQL (not bound parameters) so that SQLite can
+        match it against the index. It names the invoice table, so use it
+        for a top-level query only, not in a subquery or join; elsewhere
+        use open().
+        """
+        column = f'"{self.model._meta.db_table}"."status"'
+        statuses = ", ".join(f"'{status}'" for status in OPEN_INVOICE_STATUSES)
+        return self.filter(
+            RawSQL(f"{column} IN ({statuses})", [], output_field=models.BooleanField()), due_date__lt=day,
+        ).order_by('due_date')
+
+
+class Invoice(FrozenTotalsMixin, TouchOnSaveMixin, DocumentTotalsMixin, models.Model):
     """
     Represents an invoice document header.
     """
@@ -645,7 +853,7 @@ class Invoice(models.Model):
         PAID = 'PAID', 'Paid'
         PARTIALLY_PAID = 'PART_PAID', 'Partially Paid'
         CANCELLED = 'CANCELLED', 'Cancelled'
-        # OVERDUE = 'OVERDUE', 'Overdue' # Maybe calculated later
+        OVERDUE = 'OVERDUE', 'Overdue' # Past due_date with a balance; set by manage.py sweep_statuses
 
     invoice_number = models.CharField(
         max_length=50,
@@ -690,54 +898,16 @@ class Invoice(models.Model):
     notes = models.TextField(blank=True, default='', help_text="Internal notes")
     payment_details = models.TextField(blank=True, default='', help_text="Info like bank account, payment terms")
 
+    # Everything needed to render the finalized document; see documents.snapshots
+    render_snapshot = models.JSONField(null=True, blank=True, editable=False)
+    frozen_grand_total_cents = models.BigIntegerField(null=True, blank=True, editable=False)
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    @property
-    def subtotal(self):
-        """Calculate sum of all line item totals before discounts/taxes."""
-        #return sum(item.line_total for item in self.items.all()).quantize(Decimal("0.01"))
-        return sum((item.line_total for item in self.items.all()), Decimal('0.00')).quantize(Decimal("0.01"))
+    objects = InvoiceQuerySet.as_manager()
 
-
-    @property
-    def discount_amount(self):
-        """Calculate the discount amount based on type and value."""
-        if self.discount_type == DiscountType.NONE or self.discount_value <= 0:
-            return Decimal("0.00")
-
-        sub = self.subtotal # Use the subtotal property
-        if self.discount_type == DiscountType.PERCENTAGE:
-            amount = (sub * (self.discount_value / Decimal(100))).quantize(Decimal("0.01"))
-            return amount
-        elif self.discount_type == DiscountType.FIXED:
-            amount = min(sub, self.discount_value).quantize(Decimal("0.01"))
-            return amount
-        return Decimal("0.00")
-
-    @property
-    def total_before_tax(self):
-        """Calculate total after discount but before tax."""
-        return (self.subtotal - self.discount_amount).quantize(Decimal("0.01"))
-
-    @property
-    def tax_amount(self):
-        """Calculate tax amount based on settings and total_before_tax."""
-        Setting = apps.get_model('documents', 'Setting')
-
-        settings = Setting.get_solo()
-        if settings.tax_enabled and settings.tax_rate > 0:
-            tax_rate = settings.tax_rate / Decimal(100)
-            amount = (self.total_before_tax * tax_rate).quantize(Decimal("0.01"))
-            return amount
-        return Decimal("0.00")
-
-    @property
-    def grand_total(self):
-        """Calculate the final total including discounts and tax."""
-        return (self.total_before_tax + self.tax_amount).quantize(Decimal("0.01"))
-    
     def get_admin_url(self):
         """
         Returns the URL to the admin change page for this invoice instance.
@@ -752,18 +922,74 @@ class Invoice(models.Model):
     @property
     def amount_paid(self):
         """Calculate the total amount paid towards this invoice."""
-        # Sum the 'amount' field of all related Payment objects
-        # Use aggregate and handle None if no payments exist
-        paid_sum = self.payments.aggregate(total_paid=Sum('amount'))['total_paid']
-        return (paid_sum or Decimal('0.00')).quantize(Decimal("0.01"))
+        cached = self.__dict__.get('_amount_paid_cache')
+        if cached is not None:
+            return cached
+        prefetched = getattr(self, '_prefetched_objects_cache', {}).get('payments')
+        if prefetched is not None:
+            paid_sum = sum((payment.amount for payment in prefetched), Decimal('0.00'))
+        else:
+            # Sum the 'amount' field of all related Payment objects
+            # Use aggregate and handle None if no payments exist
+            paid_sum = self.payments.aggregate(total_paid=Sum('amount'))['total_paid']
+        self._amount_paid_cache = (paid_sum or Decimal('0.00')).quantize(Decimal("0.01"))
+        return self._amount_paid_cache
+
+    @property
+    def amount_credited(self):
+        """
+        Total of the ISSUED and APPLIED credit notes against this invoice.
+        Taken from the db_credited annotation (reports.credited_amount) when
+        the invoice was loaded with it, else computed with one query.
+        """
+        cached = self.__dict__.get('_amount_credited_cache')
+        if cached is not None:
+            return cached
+        credited = self.__dict__.get('db_credited')
+        if credited is None:
+            from .reports import credited_amount # reports imports this module
+            Setting = apps.get_model('documents', 'Setting')
+            credited = type(self).objects.filter(pk=self.pk).annotate(
+                db_credited=credited_amount(Setting.get_solo())).values_list('db_credited', flat=True).first()
+        self._amount_credited_cache = Decimal(credited or 0).quantize(Decimal("0.01"))
+        return self._amount_credited_cache
 
     @property
     def balance_due(self):
-        """Calculate the remaining balance due for this invoice."""
+        """Calculate the remaining balance due for this invoice: grand total less payments and credits."""
         # Use grand_total property we defined earlier
-        balance = self.grand_total - self.amount_paid
+        balance = self.grand_total - self.amount_paid - self.amount_credited
         return balance.quantize(Decimal("0.01"))
 
+    def settlement_status(self):
+        """
+        The status the invoice's payments and credits call for: SENT while
+        nothing is paid or credited, PART_PAID until they cover the grand
+        total, then PAID. DRAFT and CANCELLED invoices keep their status, and
+        OVERDUE invoices until they are paid (the sweep sets and clears it).
+        """
+        if self.status in [self.Status.DRAFT, self.Status.CANCELLED]:
+            return self.status
+        settled = self.amount_paid + self.amount_credited
+        if settled > 0 and settled >= self.grand_total:
+            return self.Status.PAID
+        if self.status == self.Status.OVERDUE:
+            return self.status
+        if settled <= 0:
+            return self.Status.SENT
+        return self.Status.PARTIALLY_PAID
+
+    def update_settlement_status(self):
+        """Save settlement_status() if it differs from the current status. Returns True if it changed."""
+        self.invalidate_totals()
+        new_status = self.settlement_status()
+        if new_status == self.status:
+            return False
+        self.status = new_status
+        self.save(update_fields=['status'])
+        return True
+
+    @OPERATION_SECONDS.time(document='invoice', operation='finalize')
     @transaction.atomic
     def finalize(self):
         """
@@ -781,11 +1007,12 @@ class Invoice(models.Model):
         if not self.issue_date:
             self.issue_date = timezone.now().date()
 
+        Setting = apps.get_model('documents', 'Setting')
+        settings = Setting.get_solo()
+
         # Set due_date if it's not already set AND issue_date is now available
         if not self.due_date and self.issue_date:
             try:
-                Setting = apps.get_model('documents', 'Setting')
-                settings = Setting.get_solo()
                 # Use the new setting for payment terms
                 payment_terms_days = getattr(settings, 'default_payment_terms_days', 0)
                 if payment_terms_days > 0:
@@ -795,8 +1022,9 @@ class Invoice(models.Model):
                 pass # Proceed without default due_date
 
         self.status = self.Status.SENT
+        freeze(self, settings)
         # Define which fields to update
-        fields_to_update = ['status']
+        fields_to_update = ['status', *FROZEN_FIELDS]
         if self.issue_date: # Only add to update_fields if it was potentially changed/set
             fields_to_update.append('issue_date')
         if self.due_date:   # Only add to update_fields if it was potentially changed/set
@@ -823,14 +1051,27 @@ class Invoice(models.Model):
         self.status = self.Status.DRAFT
         self.issue_date = None
         self.due_date = None
+        self.render_snapshot = None
+        self.frozen_grand_total_cents = None
 
         # Define which fields to update
-        fields_to_update = ['status', 'issue_date', 'due_date']
+        fields_to_update = ['status', 'issue_date', 'due_date', *FROZEN_FIELDS]
         self.save(update_fields=fields_to_update)
         return True
     
     class Meta:
         ordering = ['-issue_date', '-created_at']
+        indexes = [
+            models.Index(fields=['-issue_date', '-created_at'], name='invoice_issued_idx'),
+            models.Index(fields=['status', '-issue_date'], name='invoice_status_idx'),
+            models.Index(fields=['client', '-issue_date', '-created_at'], name='invoice_client_issued_idx'),
+            # Only open invoices are ever looked up by due date (aging, overdue checks)
+            models.Index(
+                fields=['due_date'],
+                condition=models.Q(status__in=OPEN_INVOICE_STATUSES),
+                name='invoice_open_due_idx',
+            ),
+        ]
 
 
 class InvoiceItem(models.Model):
@@ -906,6 +1147,10 @@ class Setting(SingletonModel):
     created_at = models.DateTimeField(auto_now_add=True, null=True) # Allow null for initial singleton creation if needed
     updated_at = models.DateTimeField(auto_now=True, null=True)
 
+    # Bumped (per process) whenever settings are saved, so memoized document
+    # totals know their tax figures may be stale. See DocumentTotalsMixin.
+    generation = 0
+
     def __str__(self):
         return "Application Settings"
 
@@ -923,6 +1168,59 @@ class PaymentMethod(models.TextChoices):
     OTHER = 'OTHER', 'Other'
 
 
+class PaymentReceipt(models.Model):
+    """
+    One amount received from a client (e.g. a bank transfer) that pays one
+    or more invoices. Each share is a Payment with receipt set; see
+    documents.receipts for the allocation, oldest due date first.
+    """
+    client = models.ForeignKey(Client, on_delete=models.PROTECT, related_name='payment_receipts')
+    receipt_date = models.DateField(default=timezone.now)
+    amount = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal('0.01'))]
+    )
+    payment_method = models.CharField(max_length=10, choices=PaymentMethod.choices, blank=True, null=True)
+    reference_number = models.CharField(
+        max_length=100, blank=True, default='',
+        help_text="E.g., Transaction ID, Cheque No. Copied to each allocated payment."
+    )
+    notes = models.TextField(blank=True, default='', help_text="Internal notes about the receipt")
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Receipt of RM {self.amount} from {self.client.name} on {self.receipt_date}"
+
+    @property
+    def allocated(self):
+        """Sum of the payments this receipt has been allocated to."""
+        total = self.allocations.aggregate(total=Sum('amount'))['total']
+        return (total or Decimal('0.00')).quantize(Decimal("0.01"))
+
+    @property
+    def unallocated(self):
+        """Part of the amount not yet allocated to any invoice (e.g. an overpayment)."""
+        return (self.amount - self.allocated).quantize(Decimal("0.01"))
+
+    class Meta:
+        ordering = ['-receipt_date', '-created_at']
+        indexes = [
+            models.Index(fields=['client', '-receipt_date'], name='receipt_client_date_idx'),
+        ]
+        verbose_name = "Payment Receipt"
+        verbose_name_plural = "Payment Receipts"
+
+
+class PaymentQuerySet(ListQuerySet):
+    list_related = ('invoice',)
+    list_fields = ('payment_date', 'amount', 'payment_method', 'reference_number', 'created_at',
+                   'invoice__invoice_number')
+
+
 class Payment(models.Model):
     """
     Represents a payment received for an Invoice.
@@ -932,6 +1230,13 @@ class Payment(models.Model):
         on_delete=models.PROTECT, # Prevent deleting invoice if payments exist? Or CASCADE? Let's use PROTECT.
         related_name='payments'
     )
+    # Set when this payment is one invoice's share of a multi-invoice receipt
+    receipt = models.ForeignKey(
+        PaymentReceipt,
+        on_delete=models.CASCADE,
+        null=True, blank=True,
+        related_name='allocations'
+    )
     payment_date = models.DateField(default=timezone.now)
     amount = models.DecimalField(
         max_digits=10,
@@ -953,6 +1258,8 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PaymentQuerySet.as_manager()
+
     def __str__(self):
         # Try to show invoice number, default to PK if number not generated yet (unlikely here)
         inv_num = self.invoice.invoice_number if self.invoice_id and self.invoice.invoice_number else f"Invoice PK {self.invoice_id}"
@@ -966,6 +1273,11 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-payment_date', '-created_at']
+        indexes = [
+            # Payments are always read per invoice (totals, admin inline) in date order
+            models.Index(fields=['invoice', '-payment_date'], name='payment_invoice_date_idx'),
+            models.Index(fields=['-payment_date', '-created_at'], name='payment_date_idx'),
+        ]
 
     def clean(self):
         """
@@ -996,7 +1308,13 @@ class DeliveryOrderStatus(models.TextChoices):
     CANCELLED = 'CANCELLED', 'Cancelled'
 
 
-class DeliveryOrder(models.Model):
+class DeliveryOrderQuerySet(ListQuerySet):
+    list_related = ('order', 'order__client')
+    list_fields = ('do_number', 'delivery_date', 'status', 'recipient_name', 'created_at', 'updated_at',
+                   'order__order_number', 'order__updated_at', 'order__client__name', 'order__client__updated_at')
+
+
+class DeliveryOrder(TouchOnSaveMixin, models.Model):
     """
     Represents a delivery of items for a specific Order.
     An Order can have multiple DeliveryOrders (e.g., for phased delivery).
@@ -1027,12 +1345,18 @@ class DeliveryOrder(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DeliveryOrderQuerySet.as_manager()
+
     def __str__(self):
         num = self.do_number if self.do_number else "Draft DO"
         return f"Delivery Order {num} for Order {self.order.order_number or self.order.pk}"
 
     class Meta:
         ordering = ['-delivery_date', '-created_at']
+        indexes = [
+            models.Index(fields=['-delivery_date', '-created_at'], name='deliveryorder_date_idx'),
+            models.Index(fields=['status', 'delivery_date'], name='deliveryorder_status_idx'),
+        ]
         verbose_name = "Delivery Order"
         verbose_name_plural = "Delivery Orders"
         
@@ -1078,17 +1402,13 @@ class DeliveryOrderItem(models.Model):
         verbose_name = "Delivery Order Item"
         verbose_name_plural = "Delivery Order Items"
 
-    # Potential future validation in clean():
-    # Ensure quantity_delivered <= order_item.quantity - sum(other delivered_items for this order_item)
-
-
     def clean(self):
         """
         Custom validation for DeliveryOrderItem:
         1. Ensure the selected OrderItem belongs to the DeliveryOrder's parent Order.
         2. Ensure quantity_delivered does not exceed the OrderItem's original quantity.
-           (Note: This simple check doesn't account for previous deliveries of the same OrderItem yet.
-            That's a more complex validation we can add later if needed for partial deliveries on multiple DOs.)
+           (Deliveries of the same OrderItem on other DOs are checked for all lines at once
+            by BaseDeliveryOrderItemFormSet, using documents.fulfillment.)
         """
         super().clean() # Call parent's clean method first
 
@@ -1133,9 +1453,16 @@ class CreditNoteStatus(models.TextChoices):
     CANCELLED = 'CANCELLED', 'Cancelled'
 
 
-class CreditNote(models.Model):
+class CreditNoteQuerySet(ListQuerySet):
+    list_related = ('client', 'related_invoice')
+    list_fields = ('cn_number', 'issue_date', 'status', 'created_at', 'client__name',
+                   'related_invoice__invoice_number')
+
+
+class CreditNote(TouchOnSaveMixin, DocumentTotalsMixin, models.Model):
     """
     Represents a Credit Note issued to a client, usually related to a specific invoice.
+    ISSUED and APPLIED credit notes reduce the invoice's balance due.
     """
     cn_number = models.CharField(
         max_length=50, unique=True,
@@ -1163,16 +1490,16 @@ class CreditNote(models.Model):
         default=CreditNoteStatus.DRAFT
     )
     # No direct discount fields on CN; items define the credit amounts.
-    # Calculation properties (subtotal, tax_amount, grand_total) will be added later.
+    # Totals (subtotal, tax_amount, grand_total) come from DocumentTotalsMixin;
+    # tax is credited at the current rate, like the invoice it was charged on.
+    discount_type = DiscountType.NONE
+    discount_value = Decimal("0.00")
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    # Calculation Properties to be added later:
-    # @property def subtotal(self): ...
-    # @property def tax_amount(self): ... (Could be complex, based on original invoice's tax or if tax is credited)
-    # @property def grand_total(self): ... (Total credit amount)
+    objects = CreditNoteQuerySet.as_manager()
 
     def __str__(self):
         num = self.cn_number if self.cn_number else "Draft CN"
@@ -1180,6 +1507,9 @@ class CreditNote(models.Model):
 
     class Meta:
         ordering = ['-issue_date', '-created_at']
+        indexes = [
+            models.Index(fields=['-issue_date', '-created_at'], name='creditnote_issued_idx'),
+        ]
         verbose_name = "Credit Note"
         verbose_name_plural = "Credit Notes"
 
@@ -1213,8 +1543,12 @@ class CreditNoteItem(models.Model):
     )
     # tax_rate on item? Or assume overall CN tax calculation? For now, keep simple.
 
-    # Calculation property to be added later:
-    # @property def line_total(self): return (self.quantity * self.unit_price).quantize(Decimal('0.01'))
+    @property
+    def line_total(self):
+        """Calculate the total for this line item."""
+        if self.quantity is not None and self.unit_price is not None:
+            return (self.quantity * self.unit_price).quantize(Decimal("0.01"))
+        return Decimal("0.00")
 
     def __str__(self):
         cn_num = self.credit_note.cn_number if self.credit_note_id and self.credit_note.cn_number else f"CN PK {self.credit_note_id}"
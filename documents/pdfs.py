@@ -0,0 +1,56 @@
+"""
+PDF files written ahead of time: the delivery order PDFs of
+manage.py create_delivery_orders and the PDFs of the "Finalize and render
+PDFs" admin action (documents.bulk).
+
+WeasyPrint is CPU bound and holds the GIL while it lays out a page, so
+threads would render one PDF at a time. The PDFs are written by worker
+processes instead. The caller renders each page to HTML, where the
+database is, and only (html, base_url, path) jobs go to the workers.
+
+- write_pdfs() writes the jobs and waits for them.
+- submit_pdfs() hands them to a pool of DOCUMENTS_PDF_WORKERS processes
+  kept for the life of the web process, and returns at once.
+
+Workers are spawned rather than forked, as forking a threaded web server
+can copy locks held by other threads.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def write_pdf(job):
+    """Convert one page to a PDF file and return its path. Runs in a worker process."""
+    import weasyprint # Imported here: workers need nothing from Django
+    html, base_url, path = job
+    weasyprint.HTML(string=html, base_url=base_url).write_pdf(path)
+    return path
+
+
+def _executor(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def write_pdfs(jobs, workers=1):
+    """Write the PDFs of jobs with up to workers processes; returns their paths."""
+    jobs = list(jobs)
+    if workers > 1 and len(jobs) > 1:
+        with _executor(min(workers, len(jobs))) as pool:
+            return list(pool.map(write_pdf, jobs))
+    return [write_pdf(job) for job in jobs]
+
+
+def submit_pdfs(jobs):
+    """Queue jobs on the web process's PDF workers; returns their futures."""
+    global _pool
+    with _pool_lock: # Concurrent first requests would each start a pool
+        if _pool is None:
+            _pool = _executor(getattr(settings, 'DOCUMENTS_PDF_WORKERS', 1))
+    return [_pool.submit(write_pdf, job) for job in jobs]
@@ -0,0 +1,181 @@
+"""
+Kitchen production reports.
+
+prep_list() totals what the kitchen has to make: the quantity of each menu
+item (in its unit) across every CONFIRMED/IN_PROGRESS order in a date
+range, per event date and grouping label. It is one grouped query over
+OrderItem joined to its order and menu item; the filter on order status
+and event_date is served by order_status_event_idx.
+
+purchasing_list() explodes the same order lines through the menu items'
+recipes (RecipeLine) into ingredient quantities per event date: one
+grouped query over OrderItem joined to the recipe lines, multiplying and
+summing in the database, however many orders and lines the range holds.
+
+Results are cached per date range in DOCUMENTS_PREP_LIST_CACHE. Every key
+holds a generation token, which the Order, OrderItem, MenuItem, Ingredient
+and RecipeLine signals replace (invalidate_prep_lists()), so a change is
+on the next refresh and stale entries are left for the cache to evict.
+The cache must be shared by all workers, or a change only reaches the
+worker that made it: the default 'prep_lists' alias is file based, and
+production settings use Redis when DOCUMENTS_ROW_CACHE_URL is set.
+"""
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, DecimalField, F, Sum
+
+from .models import MenuItem, Order, OrderItem
+
+
+# Orders the kitchen has to produce
+PRODUCTION_ORDER_STATUSES = [Order.OrderStatus.CONFIRMED, Order.OrderStatus.IN_PROGRESS]
+
+GENERATION_KEY = 'prep_list:generation'
+
+
+def _cache():
+    return caches[getattr(settings, 'DOCUMENTS_PREP_LIST_CACHE', 'prep_lists')]
+
+
+def _generation():
+    cache = _cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # First use, or the token was evicted: start a fresh generation
+        generation = time.time_ns()
+        cache.add(GENERATION_KEY, generation, timeout=None)
+        generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+
+def invalidate_prep_lists():
+    """Make every cached prep list stale."""
+    _cache().set(GENERATION_KEY, time.time_ns(), timeout=None)
+
+
+def _cached(name, start, end, build):
+    """build(start, end), from the cache when nothing has changed since it was built."""
+    cache = _cache()
+    key = f'{name}:{_generation()}:{start.isoformat()}:{end.isoformat()}'
+    result = cache.get(key)
+    if result is None:
+        result = build(start, end)
+        cache.set(key, result, getattr(settings, 'DOCUMENTS_PREP_LIST_TIMEOUT', 3600))
+    return result
+
+
+def production_items(start, end):
+    """OrderItems of the production orders with event_date in [start, end]."""
+    return OrderItem.objects.filter(
+        order__status__in=PRODUCTION_ORDER_STATUSES,
+        order__event_date__range=(start, end),
+    )
+
+
+def prep_list_rows(start, end):
+    """
+    One row per event date, grouping label and menu item of the production
+    orders with event_date in [start, end]: event_date, grouping_label,
+    menu_item_id, name, unit, quantity and orders (how many orders it
+    comes from). Ordered for printing.
+    """
+    return list(
+        production_items(start, end)
+        .order_by()
+        .values('grouping_label', 'menu_item_id',
+                event_date=F('order__event_date'), name=F('menu_item__name'), unit=F('menu_item__unit'))
+        .annotate(quantity=Sum('quantity'), orders=Count('order_id', distinct=True))
+        .order_by('event_date', 'grouping_label', 'name', 'menu_item_id')
+    )
+
+
+def build_prep_list(rows):
+    """
+    Arrange prep_list_rows() for display: {'days': [{'date', 'groups':
+    [{'label', 'lines'}]}], 'totals': quantity per menu item over the
+    whole range}.
+    """
+    units = dict(MenuItem.UnitType.choices)
+    days, totals = [], {}
+    for row in rows:
+        line = dict(row, quantity=Decimal(row['quantity']).quantize(Decimal('0.01')),
+                    unit_label=units.get(row['unit'], row['unit']))
+        if not days or days[-1]['date'] != line['event_date']:
+            days.append({'date': line['event_date'], 'groups': []})
+        groups = days[-1]['groups']
+        if not groups or groups[-1]['label'] != line['grouping_label']:
+            groups.append({'label': line['grouping_label'], 'lines': []})
+        groups[-1]['lines'].append(line)
+
+        total = totals.setdefault(line['menu_item_id'], {
+            key: line[key] for key in ('menu_item_id', 'name', 'unit', 'unit_label')})
+        total['quantity'] = total.get('quantity', Decimal('0.00')) + line['quantity']
+    return {'days': days, 'totals': sorted(totals.values(), key=lambda line: (line['name'], line['menu_item_id']))}
+
+
+def prep_list(start, end):
+    """build_prep_list() for [start, end], cached until an order or menu item changes."""
+    return _cached('prep_list', start, end, lambda start, end: build_prep_list(prep_list_rows(start, end)))
+
+
+def purchasing_rows(start, end):
+    """
+    One row per event date and ingredient: ingredient_id, name, unit and
+    quantity, the sum over the production order lines of that date of line
+    quantity times the recipe's quantity per unit. Lines whose menu item
+    has no recipe are left out (see missing_recipes()).
+    """
+    return list(
+        production_items(start, end)
+        .filter(menu_item__recipe_lines__isnull=False)
+        .order_by()
+        .values(event_date=F('order__event_date'), ingredient_id=F('menu_item__recipe_lines__ingredient_id'),
+                name=F('menu_item__recipe_lines__ingredient__name'),
+                unit=F('menu_item__recipe_lines__ingredient__unit'))
+        .annotate(quantity=Sum(F('quantity') * F('menu_item__recipe_lines__quantity'),
+                               output_field=DecimalField(max_digits=20, decimal_places=4)))
+        .order_by('event_date', 'name', 'ingredient_id')
+    )
+
+
+def missing_recipes(start, end):
+    """Names of the menu items ordered in [start, end] that have no recipe, so no ingredients."""
+    return list(
+        production_items(start, end)
+        .filter(menu_item__recipe_lines__isnull=True)
+        .order_by('menu_item__name')
+        .values_list('menu_item__name', flat=True)
+        .distinct()
+    )
+
+
+def build_purchasing_list(rows, missing=()):
+    """
+    Arrange purchasing_rows() for display: {'days': [{'date', 'lines'}],
+    'totals': quantity per ingredient over the whole range,
+    'missing_recipes': menu item names}.
+    """
+    days, totals = [], {}
+    for row in rows:
+        line = dict(row, quantity=Decimal(row['quantity']).quantize(Decimal('0.001')))
+        if not days or days[-1]['date'] != line['event_date']:
+            days.append({'date': line['event_date'], 'lines': []})
+        days[-1]['lines'].append(line)
+
+        total = totals.setdefault(line['ingredient_id'], {
+            key: line[key] for key in ('ingredient_id', 'name', 'unit')})
+        total['quantity'] = total.get('quantity', Decimal('0.000')) + line['quantity']
+    return {
+        'days': days,
+        'totals': sorted(totals.values(), key=lambda line: (line['name'], line['ingredient_id'])),
+        'missing_recipes': list(missing),
+    }
+
+
+def purchasing_list(start, end):
+    """build_purchasing_list() for [start, end], cached like prep_list()."""
+    return _cached('purchasing', start, end, lambda start, end: build_purchasing_list(
+        purchasing_rows(start, end), missing_recipes(start, end)))
@@ -0,0 +1,115 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import slugify
+
+
+def profile_dir():
+    return Path(getattr(settings, 'DOCUMENTS_PROFILE_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the call stack of one thread at a fixed interval and counts
+    identical stacks, giving flame-graph friendly "collapsed" output
+    (``frame;frame;frame count`` per line).
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_call(func, interval=None):
+    """
+    Run func() under cProfile with a stack sampler alongside it.
+    Returns (result, profiler, sampler, seconds).
+    """
+    if interval is None:
+        interval = getattr(settings, 'DOCUMENTS_PROFILE_SAMPLE_INTERVAL', 0.005)
+    sampler = StackSampler(threading.get_ident(), interval)
+    profiler = cProfile.Profile()
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        result = profiler.runcall(func)
+    finally:
+        seconds = time.perf_counter() - started
+        sampler.stop()
+    return result, profiler, sampler, seconds
+
+
+def save_profile(request, response, profiler, sampler, seconds):
+    """
+    Write <name>.prof (pstats), <name>.collapsed (stack samples) and
+    <name>.json (request metadata) under DOCUMENTS_PROFILE_DIR, then drop
+    the oldest profiles beyond DOCUMENTS_PROFILE_KEEP.
+    """
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    now = timezone.now()
+    name = f"{now:%Y%m%d-%H%M%S-%f}-{slugify(request.path)[:60] or 'root'}"
+
+    profiler.dump_stats(directory / f"{name}.prof")
+    (directory / f"{name}.collapsed").write_text(sampler.collapsed())
+    stats = getattr(request, 'perf_stats', None)
+    metadata = {
+        'name': name,
+        'created': now.isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'user': request.user.get_username(),
+        'status': response.status_code,
+        'duration_ms': round(seconds * 1000, 2),
+        'samples': sum(sampler.stacks.values()),
+        'queries': stats.query_count if stats else None,
+    }
+    (directory / f"{name}.json").write_text(json.dumps(metadata, indent=2))
+
+    for old in recent_profiles()[getattr(settings, 'DOCUMENTS_PROFILE_KEEP', 50):]:
+        for suffix in ('.prof', '.collapsed', '.json'):
+            (directory / f"{old['name']}{suffix}").unlink(missing_ok=True)
+    return name
+
+
+def recent_profiles(limit=None):
+    """Metadata of saved profiles, newest first."""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in sorted(directory.glob('*.json'), reverse=True):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return profiles[:limit] if limit else profiles
@@ -0,0 +1,35 @@
+"""
+Guard rail for the for_list() projections (see ListQuerySet in models.py).
+
+A field left out of a projection is still readable: Django fetches it
+with one extra query per row, so a template or list_display column that
+starts using it quietly turns the list into an N+1. Inside
+forbid_deferred_loads() such a read raises DeferredFieldLoad instead.
+The tests render every list page and changelist under it.
+"""
+from contextlib import contextmanager
+
+from django.db.models.query_utils import DeferredAttribute
+
+
+class DeferredFieldLoad(Exception):
+    pass
+
+
+@contextmanager
+def forbid_deferred_loads():
+    """Raise DeferredFieldLoad when a deferred field is read. Not thread-safe; meant for tests."""
+    original = DeferredAttribute.__get__
+
+    def guarded(self, instance, cls=None):
+        if instance is not None and self.field.attname not in instance.__dict__:
+            raise DeferredFieldLoad(
+                f"{type(instance).__name__}.{self.field.attname} is not in the projection "
+                f"and would be loaded with one query per row")
+        return original(self, instance, cls)
+
+    DeferredAttribute.__get__ = guarded
+    try:
+        yield
+    finally:
+        DeferredAttribute.__get__ = original
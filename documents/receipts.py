@@ -0,0 +1,72 @@
+"""
+Payment receipts: one amount received from a client, spread over several
+of their invoices.
+
+allocate_receipt() pays the client's open invoices oldest due date first
+(then oldest issue date) until the receipt is used up. It reads every
+candidate balance in one query (reports.invoice_balance_cents), creates
+the payments with one bulk insert and sets the paid invoices' statuses
+with one UPDATE (reports.settle_invoices). The receipt row is locked for
+the whole allocation, so it cannot be allocated twice. Bulk inserts send no
+post_save, so the per-payment status signal does not run once per
+invoice.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import Invoice, Payment, PaymentReceipt, Setting
+from .reports import invoice_balance_cents, settle_invoices
+
+
+def _to_cents(amount):
+    return int((amount * 100).to_integral_value())
+
+
+@transaction.atomic
+def allocate_receipt(receipt, invoice_ids=None, settings=None):
+    """
+    Allocate what is left of receipt to the client's open invoices with a
+    balance, oldest due date first; invoice_ids restricts the candidates.
+    Returns the new Payments. Anything left over stays unallocated on the
+    receipt.
+    """
+    if settings is None:
+        settings = Setting.get_solo()
+    # Locked first, so a concurrent allocation of the same receipt waits and then sees these payments
+    locked = PaymentReceipt.objects.select_for_update().get(pk=receipt.pk)
+    allocated = locked.allocations.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    remaining = _to_cents(locked.amount - allocated)
+    if remaining <= 0:
+        return []
+
+    candidates = (
+        Invoice.objects.open().filter(client_id=receipt.client_id)
+        .select_for_update() # Two receipts for the same client do not both pay the same balance
+        .annotate(balance_cents=invoice_balance_cents(settings))
+        .filter(balance_cents__gt=0)
+        .order_by(F('due_date').asc(nulls_last=True), F('issue_date').asc(nulls_last=True), 'pk')
+    )
+    if invoice_ids is not None:
+        candidates = candidates.filter(pk__in=list(invoice_ids))
+
+    payments = []
+    for invoice_id, balance in candidates.values_list('pk', 'balance_cents'):
+        share = min(balance, remaining)
+        payments.append(Payment(
+            invoice_id=invoice_id,
+            receipt=receipt,
+            payment_date=receipt.receipt_date,
+            amount=(Decimal(share) / 100).quantize(Decimal('0.01')),
+            payment_method=receipt.payment_method,
+            reference_number=receipt.reference_number,
+        ))
+        remaining -= share
+        if remaining == 0:
+            break
+
+    if payments:
+        Payment.objects.bulk_create(payments)
+        settle_invoices([payment.invoice_id for payment in payments], settings)
+    return payments
@@ -0,0 +1,293 @@
+"""
+Bank statement reconciliation: match the credit lines of a bank statement
+CSV to open invoices and record them as payments.
+
+reconcile() reads what it matches against with two queries, however long
+the statement is:
+
+- every open invoice with a balance, annotated with that balance in cents
+  (reports.invoice_balance_cents),
+- the references of the payments already recorded over the statement's
+  dates, so a statement uploaded twice is not paid twice.
+
+It then builds dict indexes over the invoices (by invoice number, by
+client and balance, by client, by client name) and matches each line
+with hash lookups, in order:
+
+1. the line's reference is an invoice number,
+2. an invoice number appears in the description,
+3. the payer is a client and the amount is exactly one of their open
+   balances, or within DOCUMENTS_RECONCILE_TOLERANCE of one (bank charges).
+
+A line matching more than one invoice is ambiguous and left for review.
+Each match reduces the invoice's balance in the indexes, so two lines of
+one statement do not settle the same balance. record_matches() inserts
+the payments with one bulk insert and sets the invoices' statuses with
+one UPDATE (reports.settle_invoices) instead of once per payment.
+"""
+import csv
+import io
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings as django_settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Invoice, Payment, PaymentMethod, Setting
+from .reports import invoice_balance_cents, settle_invoices
+
+
+# Header names understood for each column, compared lower-cased
+COLUMNS = {
+    'date': ('date', 'transaction date', 'value date', 'posting date'),
+    'amount': ('amount', 'credit', 'credit amount', 'deposit'),
+    'description': ('description', 'memo', 'narrative', 'details', 'particulars'),
+    'reference': ('reference', 'reference number', 'ref', 'transaction id'),
+    'payer': ('payer', 'name', 'sender', 'from'),
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d %b %Y')
+
+MATCHED = 'matched'
+AMBIGUOUS = 'ambiguous'
+UNMATCHED = 'unmatched'
+DUPLICATE = 'duplicate'
+IGNORED = 'ignored' # Debits and zero amounts
+
+
+def _key(text):
+    """Invoice numbers and tokens compared without case or punctuation: 'inv-2025-7' == 'INV2025 7'."""
+    return re.sub(r'[^A-Z0-9]', '', (text or '').upper())
+
+
+def _name_key(text):
+    return ' '.join(re.sub(r'[^A-Z0-9]+', ' ', (text or '').upper()).split())
+
+
+def _cents(amount):
+    return int((amount * 100).to_integral_value())
+
+
+class StatementLine:
+    """One line of a bank statement and what it was matched to."""
+
+    def __init__(self, row, date, amount, description='', reference='', payer=''):
+        self.row = row
+        self.date = date
+        self.amount = amount
+        self.description = description
+        self.reference = reference
+        self.payer = payer
+        self.status = None
+        self.rule = ''
+        self.invoice = None # Open invoice row (dict) of a match
+        self.candidates = [] # Open invoice rows of an ambiguous line
+
+    def as_dict(self):
+        """The line as JSON-serializable data, e.g. to keep ambiguous lines in the session for review."""
+        return {
+            'row': self.row, 'date': self.date.isoformat(), 'amount': str(self.amount),
+            'description': self.description, 'reference': self.reference, 'payer': self.payer,
+            'candidates': [
+                {'pk': row['pk'], 'invoice_number': row['invoice_number'], 'client_name': row['client_name'],
+                 'balance': str(Decimal(row['balance_cents']) / 100)}
+                for row in self.candidates
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        line = cls(data['row'], date.fromisoformat(data['date']), Decimal(data['amount']),
+                   data['description'], data['reference'], data['payer'])
+        line.candidates = data['candidates']
+        return line
+
+    def __repr__(self):
+        return f"<StatementLine row={self.row} amount={self.amount} status={self.status}>"
+
+
+def _column(fieldnames, name):
+    """The statement's header for one of COLUMNS, or None."""
+    for header in fieldnames:
+        if header and header.strip().lower() in COLUMNS[name]:
+            return header
+    return None
+
+
+def _parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised date {value!r}")
+
+
+def _parse_amount(value):
+    value = (value or '').replace(',', '').replace('RM', '').strip()
+    if not value:
+        return Decimal('0.00')
+    try:
+        return Decimal(value).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"unrecognised amount {value!r}") from None
+
+
+def parse_statement(data):
+    """
+    The lines of a statement CSV (bytes or text) with a header row. Date
+    and amount columns are required; description, reference and payer are
+    optional (see COLUMNS). Raises ValueError naming the first bad row.
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    reader = csv.DictReader(io.StringIO(data))
+    headers = {name: _column(reader.fieldnames or [], name) for name in COLUMNS}
+    missing = [name for name in ('date', 'amount') if headers[name] is None]
+    if missing:
+        raise ValueError(f"The statement has no {' or '.join(missing)} column.")
+
+    lines = []
+    for row_number, row in enumerate(reader, start=2): # Row 1 is the header
+        if not any((value or '').strip() for value in row.values() if isinstance(value, str)):
+            continue
+        try:
+            line_date = _parse_date(row[headers['date']] or '')
+            amount = _parse_amount(row[headers['amount']])
+        except ValueError as e:
+            raise ValueError(f"Row {row_number}: {e}.") from None
+        lines.append(StatementLine(row_number, line_date, amount, *(
+            (row.get(headers[name]) or '').strip() if headers[name] else ''
+            for name in ('description', 'reference', 'payer'))))
+    return lines
+
+
+class _Index:
+    """The open invoices in dicts keyed for matching, kept current as lines are matched."""
+
+    def __init__(self, rows, tolerance_cents):
+        self.tolerance = tolerance_cents
+        self.by_number = {}
+        self.by_amount = {} # (client_id, balance_cents): [rows]
+        self.by_client = {}
+        self.clients_by_name = {}
+        for row in rows:
+            self.by_number[_key(row['invoice_number'])] = row
+            self.by_amount.setdefault((row['client_id'], row['balance_cents']), []).append(row)
+            self.by_client.setdefault(row['client_id'], []).append(row)
+            self.clients_by_name.setdefault(_name_key(row['client_name']), set()).add(row['client_id'])
+
+    def by_description(self, description):
+        """Invoices whose number is a word, or two adjacent words ('INV 2026-7'), of the description."""
+        found = {}
+        tokens = [_key(token) for token in re.split(r'[\s,;:()]+', description or '')]
+        for token in tokens + [a + b for a, b in zip(tokens, tokens[1:])]:
+            row = self.by_number.get(token)
+            if row is not None:
+                found[row['pk']] = row
+        return list(found.values())
+
+    def by_payer_amount(self, payer, cents):
+        """(rule, rows) of the payer's invoices with this balance, else within the tolerance."""
+        clients = self.clients_by_name.get(_name_key(payer), ())
+        exact = [row for client_id in clients for row in self.by_amount.get((client_id, cents), ())]
+        if exact:
+            return 'amount', exact
+        near = [row for client_id in clients for row in self.by_client[client_id]
+                if row['balance_cents'] > 0 and abs(row['balance_cents'] - cents) <= self.tolerance]
+        return 'near amount', near
+
+    def pay(self, row, cents):
+        """Take cents off an invoice's balance so later lines see what is left."""
+        self.by_amount[(row['client_id'], row['balance_cents'])].remove(row)
+        row['balance_cents'] -= cents
+        if row['balance_cents'] > 0:
+            self.by_amount.setdefault((row['client_id'], row['balance_cents']), []).append(row)
+
+
+def open_invoice_rows(settings):
+    """Every open invoice with a balance, as dicts with balance_cents. One query."""
+    return list(
+        Invoice.objects.open()
+        .annotate(balance_cents=invoice_balance_cents(settings))
+        .filter(balance_cents__gt=0)
+        .order_by(F('due_date').asc(nulls_last=True), 'pk')
+        .values('pk', 'invoice_number', 'client_id', 'due_date', 'balance_cents', client_name=F('client__name'))
+    )
+
+
+def reconcile(lines, settings=None):
+    """
+    Match each line (StatementLine) to an open invoice, setting its status
+    (MATCHED, AMBIGUOUS, UNMATCHED, DUPLICATE or IGNORED), rule, invoice and
+    candidates. Records nothing; see record_matches(). Returns lines.
+    """
+    if settings is None:
+        settings = Setting.get_solo()
+    credits = [line for line in lines if line.amount > 0]
+    for line in lines:
+        if line.amount <= 0:
+            line.status = IGNORED
+    if not credits:
+        return lines
+
+    tolerance = Decimal(str(getattr(django_settings, 'DOCUMENTS_RECONCILE_TOLERANCE', '1.00')))
+    index = _Index(open_invoice_rows(settings), _cents(tolerance))
+    seen = set(
+        Payment.objects.filter(payment_date__range=(min(line.date for line in credits),
+                                                    max(line.date for line in credits)))
+        .exclude(reference_number='')
+        .values_list('reference_number', 'amount')
+    )
+
+    for line in credits:
+        if line.reference:
+            if (line.reference, line.amount) in seen:
+                line.status = DUPLICATE
+                continue
+            seen.add((line.reference, line.amount))
+
+        cents = _cents(line.amount)
+        row = index.by_number.get(_key(line.reference)) if line.reference else None
+        if row is not None and row['balance_cents'] > 0:
+            rule, rows = 'reference', [row]
+        else:
+            rule, rows = 'description', [row for row in index.by_description(line.description)
+                                          if row['balance_cents'] > 0]
+            if not rows and line.payer:
+                rule, rows = index.by_payer_amount(line.payer, cents)
+
+        line.rule = rule if rows else ''
+        if len(rows) == 1:
+            line.status, line.invoice = MATCHED, rows[0]
+            index.pay(rows[0], cents)
+        elif rows:
+            line.status, line.candidates = AMBIGUOUS, sorted(rows, key=lambda row: row['pk'])
+        else:
+            line.status = UNMATCHED
+    return lines
+
+
+def _payment(line, invoice_id):
+    return Payment(
+        invoice_id=invoice_id,
+        payment_date=line.date,
+        amount=line.amount,
+        payment_method=PaymentMethod.BANK_TRANSFER,
+        reference_number=line.reference[:100],
+        notes=f"Bank statement: {line.description}".strip(),
+    )
+
+
+@transaction.atomic
+def record_matches(matches, settings=None):
+    """
+    Record (line, invoice id) pairs as bank transfer payments with one bulk
+    insert, then settle the invoices with one UPDATE. Returns the payments.
+    """
+    payments = [_payment(line, invoice_id) for line, invoice_id in matches]
+    if payments:
+        Payment.objects.bulk_create(payments)
+        settle_invoices({payment.invoice_id for payment in payments}, settings)
+    return payments
@@ -0,0 +1,319 @@
+"""
+Set-based totals and reporting queries.
+
+Everything here runs as a handful of SQL statements, whatever the number of
+documents. The queries are written once with the ORM. Where PostgreSQL and
+SQLite differ, the choice is made from the connection's feature flags:
+
+- Aggregates with filter= become "SUM(...) FILTER (WHERE ...)" where the
+  backend supports it, and CASE WHEN elsewhere.
+- Running balances use window functions where supported, and a Python pass
+  otherwise.
+
+PostgreSQLReportTests checks the PostgreSQL forms when the suite is run
+with DATABASE_ENGINE=postgresql (see core.db).
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connections
+from django.db.models import (
+    BigIntegerField, Case, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When, Window,
+)
+from django.db.models.functions import Cast, Coalesce, Least, Mod, Round
+from django.db.models.lookups import Exact, GreaterThan, GreaterThanOrEqual, LessThanOrEqual
+from django.utils import timezone
+
+from .models import CreditNote, CreditNoteStatus, DiscountType, Invoice, Payment, Quotation, Setting
+
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+CENTS = BigIntegerField()
+DISCOUNT_FIELDS = ('discount_type', 'discount_value')
+
+# Credit notes in these statuses reduce their invoice's balance
+CREDITING_STATUSES = [CreditNoteStatus.ISSUED, CreditNoteStatus.APPLIED]
+
+# (label, lower bound in days overdue, upper bound or None)
+AGING_BUCKETS = [
+    ('current', None, 0),
+    ('days_1_30', 1, 30),
+    ('days_31_60', 31, 60),
+    ('days_61_90', 61, 90),
+    ('days_over_90', 91, None),
+]
+
+
+# Money is handled as whole cents in SQL: SQLite stores decimals as floats and
+# SQL ROUND() rounds half away from zero, while DocumentTotals rounds with
+# Decimal.quantize() (half to even). Integer cents plus _div_half_even() give
+# the same figures to the cent on every backend.
+
+def _cents(expression):
+    """A value with 2 decimal places as an exact integer number of cents."""
+    return Cast(Round(expression * Value(100)), output_field=CENTS)
+
+
+def _div_half_even(numerator, divisor):
+    """Non-negative integer numerator / divisor, rounded half to even."""
+    half = divisor // 2
+    # Rounding half up is (n + half) / d in integer division. Ties that should
+    # go down to an even quotient are exactly those where n mod 2d == half.
+    tie_down = Case(
+        When(Exact(Mod(numerator, Value(divisor * 2)), half), then=Value(1)),
+        default=Value(0),
+        output_field=CENTS,
+    )
+    return ExpressionWrapper((numerator + Value(half) - tie_down) / Value(divisor), output_field=CENTS)
+
+
+def _document_cents(parent_field, settings, discounted=True):
+    """
+    Aggregate expressions over a document's items (to be evaluated inside a
+    per-document subquery) for subtotal, discount, tax and grand total in cents.
+    discounted=False is for credit notes, which have no discount fields.
+    """
+    subtotal = Sum(_div_half_even(_cents(F('quantity')) * _cents(F('unit_price')), 100), output_field=CENTS)
+    if discounted:
+        discount_value = _cents(F(f'{parent_field}__discount_value'))
+        discount = Case(
+            When(Exact(F(f'{parent_field}__discount_type'), DiscountType.PERCENTAGE),
+                 then=_div_half_even(subtotal * discount_value, 10000)),
+            When(Exact(F(f'{parent_field}__discount_type'), DiscountType.FIXED),
+                 then=Least(subtotal, discount_value)),
+            default=Value(0),
+            output_field=CENTS,
+        )
+    else:
+        discount = Value(0, output_field=CENTS)
+    if settings.tax_enabled and settings.tax_rate > 0:
+        tax_rate = int(settings.tax_rate * 100)
+        tax = _div_half_even((subtotal - discount) * Value(tax_rate), 10000)
+    else:
+        tax = Value(0, output_field=CENTS)
+    return {
+        'subtotal': subtotal,
+        'discount': discount,
+        'tax': tax,
+        'grand_total': subtotal - discount + tax,
+    }
+
+
+def _per_document(model, parent_field, expression, as_money=True, group_by=()):
+    """
+    Correlated subquery evaluating an aggregate expression over the outer
+    document's rows of model. group_by names the parent's columns the
+    expression reads (grouping by them keeps PostgreSQL happy).
+    """
+    if as_money:
+        expression = ExpressionWrapper(expression * Value(Decimal('0.01')), output_field=MONEY)
+    rows = (
+        model.objects.filter(**{parent_field: OuterRef('pk')})
+        .order_by()
+        .values(parent_field, *(f'{parent_field}__{name}' for name in group_by))
+        .annotate(value=expression)
+        .values('value')
+    )
+    output_field = MONEY if as_money else CENTS
+    return Coalesce(Subquery(rows, output_field=output_field), Value(0), output_field=output_field)
+
+
+def _items_of(model):
+    relation = model._meta.get_field('items')
+    return relation.related_model, relation.field.name
+
+
+def _discount_fields(model):
+    """The discount columns model's totals read; credit notes have none."""
+    return () if model is CreditNote else DISCOUNT_FIELDS
+
+
+def _frozen(model, live_cents):
+    """
+    live_cents, except for finalized quotations and invoices, whose grand
+    total was frozen in cents by finalize() (see documents.snapshots).
+    """
+    if model not in (Quotation, Invoice):
+        return live_cents
+    return Coalesce(F('frozen_grand_total_cents'), live_cents, output_field=CENTS)
+
+
+def annotate_totals(queryset, settings=None):
+    """
+    Annotate a Quotation, Order, Invoice or CreditNote queryset with
+    db_subtotal, db_discount, db_tax and db_grand_total (Decimals matching
+    DocumentTotals; db_grand_total is the frozen grand total of a
+    finalized quotation or invoice). Invoices also get db_paid, db_credited (their ISSUED
+    and APPLIED credit notes) and db_balance.
+    """
+    if settings is None:
+        settings = Setting.get_solo()
+    item_model, parent_field = _items_of(queryset.model)
+    group_by = _discount_fields(queryset.model)
+    cents = _document_cents(parent_field, settings, discounted=bool(group_by))
+    grand_total = cents.pop('grand_total')
+    queryset = queryset.annotate(**{
+        f'db_{name}': _per_document(item_model, parent_field, expression, group_by=group_by)
+        for name, expression in cents.items()
+    }).annotate(db_grand_total=ExpressionWrapper(
+        _frozen(queryset.model, _per_document(item_model, parent_field, grand_total, as_money=False, group_by=group_by))
+        * Value(Decimal('0.01')), output_field=MONEY))
+    if queryset.model is Invoice:
+        queryset = queryset.annotate(
+            db_paid=_per_document(Payment, 'invoice', Sum(_cents(F('amount')), output_field=CENTS)),
+            db_credited=credited_amount(settings),
+        ).annotate(db_balance=ExpressionWrapper(
+            F('db_grand_total') - F('db_paid') - F('db_credited'), output_field=MONEY))
+    return queryset
+
+
+def grand_total_cents(model, settings):
+    """
+    Expression for a Quotation's, Order's, Invoice's or CreditNote's grand
+    total in cents (the frozen one of a finalized quotation or invoice);
+    can be summed in a grouped query.
+    """
+    item_model, parent_field = _items_of(model)
+    group_by = _discount_fields(model)
+    return _frozen(model, _per_document(item_model, parent_field,
+                                        _document_cents(parent_field, settings, discounted=bool(group_by))['grand_total'],
+                                        as_money=False, group_by=group_by))
+
+
+def credited_cents(settings):
+    """Expression for the total of an invoice's ISSUED and APPLIED credit notes, in cents."""
+    credit_notes = (
+        CreditNote.objects.filter(related_invoice=OuterRef('pk'), status__in=CREDITING_STATUSES)
+        .annotate(grand_cents=grand_total_cents(CreditNote, settings))
+        .order_by()
+        .values('related_invoice')
+        .annotate(value=Sum('grand_cents', output_field=CENTS))
+        .values('value')
+    )
+    return Coalesce(Subquery(credit_notes, output_field=CENTS), Value(0), output_field=CENTS)
+
+
+def credited_amount(settings):
+    """credited_cents() as a Decimal amount; annotated as db_credited, Invoice.amount_credited uses it."""
+    return ExpressionWrapper(credited_cents(settings) * Value(Decimal('0.01')), output_field=MONEY)
+
+
+def paid_cents():
+    """Expression for the total of an invoice's payments, in cents."""
+    return _per_document(Payment, 'invoice', Sum(_cents(F('amount')), output_field=CENTS), as_money=False)
+
+
+def invoice_balance_cents(settings):
+    """Expression for an invoice's outstanding balance in cents (grand total - payments - credits)."""
+    grand_total = grand_total_cents(Invoice, settings)
+    return ExpressionWrapper(grand_total - paid_cents() - credited_cents(settings), output_field=CENTS)
+
+
+def settlement_status(settings, keep_overdue=True):
+    """
+    Expression for Invoice.settlement_status() of an invoice that is not
+    DRAFT or CANCELLED. With keep_overdue=False an OVERDUE invoice gets the
+    status it would have if it were not overdue.
+    """
+    settled = ExpressionWrapper(paid_cents() + credited_cents(settings), output_field=CENTS)
+    whens = [When(GreaterThan(settled, 0) & GreaterThanOrEqual(settled, grand_total_cents(Invoice, settings)),
+                  then=Value(Invoice.Status.PAID))]
+    if keep_overdue:
+        whens.append(When(status=Invoice.Status.OVERDUE, then=Value(Invoice.Status.OVERDUE)))
+    whens.append(When(LessThanOrEqual(settled, 0), then=Value(Invoice.Status.SENT)))
+    return Case(*whens, default=Value(Invoice.Status.PARTIALLY_PAID))
+
+
+def settle_invoices(invoice_ids, settings=None):
+    """
+    Give the invoices the status their payments and credits call for, the
+    same as Invoice.settlement_status() does for one invoice, in a single
+    UPDATE. DRAFT and CANCELLED invoices are left alone. updated_at is set,
+    as the balances shown in their list rows changed. Returns the number
+    of invoices updated.
+    """
+    if settings is None:
+        settings = Setting.get_solo()
+    return (
+        Invoice.objects.filter(pk__in=list(invoice_ids))
+        .exclude(status__in=[Invoice.Status.DRAFT, Invoice.Status.CANCELLED])
+        .update(status=settlement_status(settings), updated_at=timezone.now())
+    )
+
+
+def _from_cents(value):
+    return (Decimal(value or 0) / 100).quantize(Decimal('0.01'))
+
+
+def _bucket_filter(as_of, low, high):
+    """Q for invoices whose days overdue (as_of - due_date) fall within [low, high]."""
+    condition = Q()
+    if low is not None:
+        condition &= Q(due_date__lte=as_of - timedelta(days=low))
+    if high is not None:
+        condition &= Q(due_date__gt=as_of - timedelta(days=high + 1))
+    return condition
+
+
+def aging_report(as_of=None, settings=None):
+    """
+    Open invoice balances per client, split into overdue buckets.
+    One grouped query; invoices without a due date count as current.
+    Returns (rows, totals) where every row has client_id, client_name,
+    the AGING_BUCKETS labels and 'total'.
+    """
+    as_of = as_of or timezone.now().date()
+    if settings is None:
+        settings = Setting.get_solo()
+
+    aggregates = {}
+    for label, low, high in AGING_BUCKETS:
+        condition = _bucket_filter(as_of, low, high)
+        if label == 'current':
+            condition |= Q(due_date__isnull=True)
+        aggregates[label] = Sum('balance_cents', filter=condition, output_field=CENTS)
+    aggregates['total'] = Sum('balance_cents', output_field=CENTS)
+
+    rows = list(
+        Invoice.objects.open()
+        .annotate(balance_cents=invoice_balance_cents(settings))
+        .order_by()
+        .values('client_id', client_name=F('client__name'))
+        .annotate(**aggregates)
+        .order_by('client_name')
+    )
+    for row in rows:
+        for label in aggregates:
+            row[label] = _from_cents(row[label])
+    totals = {label: sum((row[label] for row in rows), Decimal('0.00')) for label in aggregates}
+    return rows, totals
+
+
+def client_statement(client, settings=None):
+    """
+    A client's finalized invoices oldest first, with db_* totals and
+    running_balance: the client's outstanding balance after that invoice.
+    """
+    if settings is None:
+        settings = Setting.get_solo()
+    invoices = annotate_totals(
+        Invoice.objects.filter(client=client).exclude(status__in=[Invoice.Status.DRAFT, Invoice.Status.CANCELLED]),
+        settings=settings,
+    ).order_by('due_date', 'pk')
+
+    if connections[invoices.db].features.supports_over_clause:
+        rows = list(invoices.annotate(running_cents=Window(
+            Sum(invoice_balance_cents(settings), output_field=CENTS),
+            order_by=[F('due_date').asc(), F('pk').asc()],
+        )))
+        for invoice in rows:
+            invoice.running_balance = _from_cents(invoice.running_cents)
+        return rows
+
+    rows = list(invoices)
+    running = Decimal('0.00')
+    for invoice in rows:
+        running += invoice.db_balance
+        invoice.running_balance = running
+    return rows
+
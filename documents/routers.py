@@ -0,0 +1,85 @@
+"""
+Read-replica routing for the documents app.
+
+Reads are sent to a replica only while a view decorated with
+@use_read_replica is running, so every other view (and the admin) keeps
+reading from the primary. Writes always go to the primary.
+
+Replicas lag behind the primary, so a user who has just saved something
+is pinned to the primary for DOCUMENTS_REPLICA_PIN_SECONDS: their next
+pages show what they saved. PrimaryPinMiddleware sets the pin after every
+unsafe (POST, PUT, ...) request.
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+PIN_SESSION_KEY = 'documents_primary_until'
+
+_replica_reads = ContextVar('documents_replica_reads', default=False)
+
+
+def read_replicas():
+    return list(getattr(settings, 'DOCUMENTS_READ_REPLICAS', []))
+
+
+def pin_to_primary(request):
+    """Send this session's reads to the primary for DOCUMENTS_REPLICA_PIN_SECONDS."""
+    if hasattr(request, 'session'):
+        request.session[PIN_SESSION_KEY] = time.time() + getattr(settings, 'DOCUMENTS_REPLICA_PIN_SECONDS', 10)
+
+
+def is_pinned(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+def use_read_replica(view):
+    """
+    Opt a read-only view in to replica reads. Falls back to the primary for
+    unsafe methods and for sessions pinned after a recent write.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or is_pinned(request) or not read_replicas():
+            return view(request, *args, **kwargs)
+        token = _replica_reads.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Routes documents reads to DOCUMENTS_READ_REPLICAS inside @use_read_replica views."""
+
+    app_label = 'documents'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != self.app_label or not _replica_reads.get():
+            return None
+        replicas = read_replicas()
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        # Explicit, so saving an object that was read from a replica still writes to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary and are never migrated directly
+        if db in read_replicas():
+            return False
+        return None
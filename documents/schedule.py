@@ -0,0 +1,117 @@
+"""
+Event calendar: orders by event_date and delivery orders by delivery_date.
+
+calendar_window() reads one date window (a month grid or a week) with
+three range queries, each served by the date indexes (order_event_idx,
+deliveryorder_date_idx):
+
+- the orders of the window, annotated with their grand total and headcount,
+- the delivery orders of the window,
+- per-day summaries grouped by event_date: order count, revenue (sum of
+  grand totals) and headcount, summed in SQL.
+
+Revenue and headcount leave out cancelled orders. Headcount is the
+quantity ordered of menu items sold per person.
+
+The calendar page and its JSON feed never read more than one window, so
+they cost the same with a month of events or years of them.
+"""
+import calendar
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import DeliveryOrder, MenuItem, Order, OrderItem, Setting
+from .reports import _from_cents, grand_total_cents
+
+
+HEADCOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+# Longest window the JSON feed serves at once
+MAX_WINDOW_DAYS = 62
+
+
+def month_window(day):
+    """First and last date of the Monday-first grid of the month containing day (whole weeks)."""
+    weeks = calendar.Calendar(firstweekday=0).monthdatescalendar(day.year, day.month)
+    return weeks[0][0], weeks[-1][-1]
+
+
+def week_window(day):
+    """Monday and Sunday of the week containing day."""
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=6)
+
+
+def _headcount():
+    """Per-order subquery: quantity of the order's per-person menu items."""
+    people = (
+        OrderItem.objects.filter(order=OuterRef('pk'), menu_item__unit=MenuItem.UnitType.PERSON)
+        .order_by().values('order').annotate(v=Sum('quantity')).values('v')
+    )
+    return Coalesce(Subquery(people, output_field=HEADCOUNT), Value(Decimal('0.00')), output_field=HEADCOUNT)
+
+
+def order_events(start, end, settings):
+    """The orders with event_date in [start, end] as dicts, with grand_total and headcount."""
+    rows = (
+        Order.objects.filter(event_date__range=(start, end))
+        .annotate(grand_cents=grand_total_cents(Order, settings), headcount=_headcount())
+        .order_by('event_date', 'pk')
+        .values('pk', 'order_number', 'title', 'status', 'event_date', 'grand_cents', 'headcount',
+                client_name=F('client__name'))
+    )
+    return [dict(row, grand_total=_from_cents(row.pop('grand_cents'))) for row in rows]
+
+
+def delivery_events(start, end):
+    """The delivery orders with delivery_date in [start, end] as dicts."""
+    return list(
+        DeliveryOrder.objects.filter(delivery_date__range=(start, end))
+        .order_by('delivery_date', 'pk')
+        .values('pk', 'do_number', 'status', 'delivery_date', 'order_id',
+                order_number=F('order__order_number'), client_name=F('order__client__name'))
+    )
+
+
+def day_summaries(start, end, settings):
+    """{event_date: {'orders', 'revenue', 'headcount'}} for the days in [start, end] that have orders."""
+    rows = (
+        Order.objects.filter(event_date__range=(start, end))
+        .exclude(status=Order.OrderStatus.CANCELLED)
+        .annotate(grand_cents=grand_total_cents(Order, settings), headcount=_headcount())
+        .order_by()
+        .values('event_date')
+        .annotate(orders=Count('pk'), revenue_cents=Sum('grand_cents'), people=Sum('headcount'))
+    )
+    return {
+        row['event_date']: {
+            'orders': row['orders'],
+            'revenue': _from_cents(row['revenue_cents']),
+            'headcount': Decimal(row['people'] or 0).quantize(Decimal('0.01')),
+        }
+        for row in rows
+    }
+
+
+def calendar_window(start, end, settings=None):
+    """
+    Every day of [start, end] in order, as {'date', 'orders', 'deliveries',
+    'summary'}; summary is None on days without orders.
+    """
+    if settings is None:
+        settings = Setting.get_solo()
+    days = {}
+    day = start
+    while day <= end:
+        days[day] = {'date': day, 'orders': [], 'deliveries': [], 'summary': None}
+        day += timedelta(days=1)
+    for order in order_events(start, end, settings):
+        days[order['event_date']]['orders'].append(order)
+    for delivery in delivery_events(start, end):
+        days[delivery['delivery_date']]['deliveries'].append(delivery)
+    for event_date, summary in day_summaries(start, end, settings).items():
+        days[event_date]['summary'] = summary
+    return list(days.values())
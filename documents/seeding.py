@@ -0,0 +1,337 @@
+"""
+Synthetic data generation for benchmarking.
+
+Everything is written with bulk_create so large datasets can be produced in
+seconds. bulk_create skips post_save signals, so document numbers are assigned
+afterwards with a single UPDATE per model using the same formats the
+numbering signals produce (Q-YYYY-ID, ORD-YYYY-ID, ...).
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from .models import (
+    Client, MenuItem, Quotation, QuotationItem,
+    Order, OrderItem, Invoice, InvoiceItem, Payment, PaymentMethod,
+    DeliveryOrder, DeliveryOrderItem, DeliveryOrderStatus,
+    CreditNote, CreditNoteItem, CreditNoteStatus, Setting,
+)
+from .reports import grand_total_cents
+
+
+BATCH_SIZE = 2000
+
+MENU_WORDS = [
+    'Nasi Lemak', 'Rendang', 'Satay', 'Mee Goreng', 'Roti Jala', 'Ayam Percik',
+    'Kuih Platter', 'Teh Tarik', 'Laksa', 'Char Kuey Teow', 'Buffet Set', 'Canopy Rental',
+]
+GROUP_LABELS = ['', '', 'Day 1 - Lunch', 'Day 1 - Dinner', 'Day 2 - Lunch', 'Buffet Station']
+
+
+def _assign_numbers(model, field_name, prefix):
+    """Fill in missing document numbers for bulk-created rows in one UPDATE."""
+    year = str(timezone.now().year)
+    return model.objects.filter(**{f'{field_name}__isnull': True}).update(**{
+        field_name: Concat(
+            Value(f'{prefix}-{year}-'), Cast('pk', output_field=CharField()),
+            output_field=CharField(),
+        )
+    })
+
+
+def _random_date(rng, today, days_back, days_forward=0):
+    return today + timedelta(days=rng.randint(-days_back, days_forward))
+
+
+def _make_items(rng, item_model, parent_field, parents, menu_items, items_per_document):
+    """Build (unsaved) line items for each parent, returning them in one list."""
+    items = []
+    for parent in parents:
+        for _ in range(rng.randint(1, items_per_document * 2 - 1)):
+            menu_item = rng.choice(menu_items)
+            items.append(item_model(**{
+                parent_field: parent,
+                'menu_item': menu_item,
+                'description': menu_item.description,
+                'quantity': Decimal(rng.randint(1, 200)),
+                'unit_price': menu_item.unit_price,
+                'grouping_label': rng.choice(GROUP_LABELS),
+            }))
+    return items
+
+
+def _revise(rng, chains, menu_objs, items_per_document):
+    """
+    Add one more version to each quotation in `chains`, superseding the
+    previous one. Returns the newly created versions.
+    """
+    revisions = Quotation.objects.bulk_create([
+        Quotation(
+            client_id=previous.client_id,
+            title=previous.title,
+            status=previous.status,
+            issue_date=previous.issue_date,
+            valid_until=previous.valid_until,
+            version=previous.version + 1,
+            previous_version=previous,
+            terms_and_conditions=previous.terms_and_conditions,
+            notes=previous.notes,
+        )
+        for previous in chains
+    ], batch_size=BATCH_SIZE)
+    for previous in chains:
+        previous.status = Quotation.Status.SUPERSEDED
+    Quotation.objects.bulk_update(chains, ['status'], batch_size=BATCH_SIZE)
+    QuotationItem.objects.bulk_create(
+        _make_items(rng, QuotationItem, 'quotation', revisions, menu_objs, items_per_document),
+        batch_size=BATCH_SIZE,
+    )
+    return revisions
+
+
+@transaction.atomic
+def seed_dataset(clients=200, menu_items=120, quotations=2000, items_per_document=6,
+                 revision_rate=0.2, max_revisions=3, credit_note_rate=0.05,
+                 seed=1, stdout=None):
+    """
+    Generate a linked dataset: clients, menu items, quotations with items and
+    revision chains, orders from most accepted quotations, invoices from orders,
+    full and partial payments, delivery orders and credit notes.
+    Returns a dict of row counts per model.
+    """
+    rng = random.Random(seed)
+    today = timezone.now().date()
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    client_objs = Client.objects.bulk_create([
+        Client(
+            name=f"Benchmark Client {i}",
+            address=f"{i} Jalan Benchmark\nKuala Lumpur",
+            email=f"client{i}@example.com",
+            phone=f"03-{i:07d}",
+        )
+        for i in range(clients)
+    ], batch_size=BATCH_SIZE)
+
+    menu_objs = MenuItem.objects.bulk_create([
+        MenuItem(
+            name=f"{rng.choice(MENU_WORDS)} #{i}",
+            description=f"Benchmark menu item {i}",
+            unit_price=Decimal(rng.randint(200, 5000)) / 100,
+            unit=rng.choice(MenuItem.UnitType.values),
+            is_active=rng.random() > 0.15,
+        )
+        for i in range(menu_items)
+    ], batch_size=BATCH_SIZE)
+    log(f"  {len(client_objs)} clients, {len(menu_objs)} menu items")
+
+    # --- Quotations ---
+    quote_statuses = [
+        Quotation.Status.DRAFT, Quotation.Status.SENT, Quotation.Status.ACCEPTED,
+        Quotation.Status.ACCEPTED, Quotation.Status.REJECTED,
+    ]
+    quote_objs = []
+    for _ in range(quotations):
+        status = rng.choice(quote_statuses)
+        issue_date = None if status == Quotation.Status.DRAFT else _random_date(rng, today, 720)
+        quote_objs.append(Quotation(
+            client=rng.choice(client_objs),
+            title=f"Event catering {rng.randint(1, 9999)}",
+            status=status,
+            issue_date=issue_date,
+            valid_until=issue_date + timedelta(days=15) if issue_date else None,
+            terms_and_conditions="Standard terms apply. " * 10,
+            notes="Benchmark data",
+        ))
+    quote_objs = Quotation.objects.bulk_create(quote_objs, batch_size=BATCH_SIZE)
+    QuotationItem.objects.bulk_create(
+        _make_items(rng, QuotationItem, 'quotation', quote_objs, menu_objs, items_per_document),
+        batch_size=BATCH_SIZE,
+    )
+
+    # Revision chains: some non-draft quotations get V2, V3, ... with the
+    # earlier versions marked as superseded. Only the latest version stays live.
+    latest = list(quote_objs)
+    revision_count = 0
+    chains = [q for q in quote_objs if q.status != Quotation.Status.DRAFT and rng.random() < revision_rate]
+    for _ in range(max_revisions):
+        if not chains:
+            break
+        revisions = _revise(rng, chains, menu_objs, items_per_document)
+        revision_count += len(revisions)
+        superseded = {q.pk for q in chains}
+        latest = [q for q in latest if q.pk not in superseded] + revisions
+        chains = [q for q in revisions if rng.random() < 0.5]
+    _assign_numbers(Quotation, 'quotation_number', 'Q')
+    log(f"  {len(quote_objs) + revision_count} quotations ({revision_count} revisions)")
+
+    # --- Orders (one per accepted quotation but every tenth, left awaiting conversion) ---
+    accepted = [q for q in latest if q.status == Quotation.Status.ACCEPTED]
+    accepted = [q for i, q in enumerate(accepted) if i % 10]
+    order_statuses = [
+        Order.OrderStatus.CONFIRMED, Order.OrderStatus.CONFIRMED, Order.OrderStatus.IN_PROGRESS,
+        Order.OrderStatus.COMPLETED, Order.OrderStatus.COMPLETED, Order.OrderStatus.CANCELLED,
+    ]
+    order_objs = Order.objects.bulk_create([
+        Order(
+            client_id=q.client_id,
+            related_quotation=q,
+            title=q.title,
+            status=rng.choice(order_statuses),
+            event_date=_random_date(rng, today, 600, 120),
+            delivery_address="Dewan Benchmark\nShah Alam",
+            notes="Benchmark data",
+        )
+        for q in accepted
+    ], batch_size=BATCH_SIZE)
+    order_items = OrderItem.objects.bulk_create(
+        _make_items(rng, OrderItem, 'order', order_objs, menu_objs, items_per_document),
+        batch_size=BATCH_SIZE,
+    )
+    _assign_numbers(Order, 'order_number', 'ORD')
+    log(f"  {len(order_objs)} orders")
+
+    items_by_order = {}
+    for item in order_items:
+        items_by_order.setdefault(item.order_id, []).append(item)
+
+    # --- Invoices (one per non-cancelled order) ---
+    billable = [o for o in order_objs if o.status != Order.OrderStatus.CANCELLED]
+    invoice_objs = []
+    for order in billable:
+        status = rng.choice([Invoice.Status.DRAFT, Invoice.Status.SENT, Invoice.Status.SENT])
+        issue_date = None if status == Invoice.Status.DRAFT else _random_date(rng, today, 540)
+        invoice_objs.append(Invoice(
+            client_id=order.client_id,
+            related_order=order,
+            related_quotation_id=order.related_quotation_id,
+            title=order.title,
+            status=status,
+            issue_date=issue_date,
+            due_date=issue_date + timedelta(days=30) if issue_date else None,
+            terms_and_conditions="Payment due within 30 days. " * 10,
+            payment_details="Maybank 5123 4567 8901",
+        ))
+    invoice_objs = Invoice.objects.bulk_create(invoice_objs, batch_size=BATCH_SIZE)
+    invoice_items = []
+    for invoice in invoice_objs:
+        for order_item in items_by_order.get(invoice.related_order_id, []):
+            invoice_items.append(InvoiceItem(
+                invoice=invoice,
+                menu_item_id=order_item.menu_item_id,
+                description=order_item.description,
+                quantity=order_item.quantity,
+                unit_price=order_item.unit_price,
+                grouping_label=order_item.grouping_label,
+            ))
+    invoice_items = InvoiceItem.objects.bulk_create(invoice_items, batch_size=BATCH_SIZE)
+    _assign_numbers(Invoice, 'invoice_number', 'INV')
+    log(f"  {len(invoice_objs)} invoices")
+
+    # --- Payments: a mix of unpaid, partially paid and fully paid invoices ---
+    # Paid against the grand total, tax included, as computed for the balances and statuses
+    settings = Setting.get_solo()
+    payable = [invoice.pk for invoice in invoice_objs if invoice.status == Invoice.Status.SENT]
+    grand_totals = {}
+    for start in range(0, len(payable), BATCH_SIZE):
+        grand_totals.update(
+            Invoice.objects.filter(pk__in=payable[start:start + BATCH_SIZE]).order_by()
+            .annotate(cents=grand_total_cents(Invoice, settings)).values_list('pk', 'cents')
+        )
+    payment_objs = []
+    paid_updates = []
+    for invoice in invoice_objs:
+        total = Decimal(grand_totals.get(invoice.pk) or 0) / 100
+        if invoice.status != Invoice.Status.SENT or total <= 0:
+            continue
+        roll = rng.random()
+        if roll < 0.3:
+            continue
+        instalments = 1 if roll > 0.65 else rng.randint(1, 3)
+        share = (total / (instalments + (0 if roll > 0.65 else 1))).quantize(Decimal('0.01'))
+        for n in range(instalments):
+            payment_objs.append(Payment(
+                invoice=invoice,
+                payment_date=invoice.issue_date + timedelta(days=7 * (n + 1)),
+                amount=max(share, Decimal('0.01')),
+                payment_method=rng.choice(PaymentMethod.values),
+                reference_number=f"TRX{invoice.pk:06d}{n}",
+            ))
+        invoice.status = Invoice.Status.PAID if roll > 0.65 else Invoice.Status.PARTIALLY_PAID
+        paid_updates.append(invoice)
+    Payment.objects.bulk_create(payment_objs, batch_size=BATCH_SIZE)
+    Invoice.objects.bulk_update(paid_updates, ['status'], batch_size=BATCH_SIZE)
+    log(f"  {len(payment_objs)} payments")
+
+    # --- Delivery orders for confirmed/completed orders ---
+    deliverable = [
+        o for o in order_objs
+        if o.status in (Order.OrderStatus.CONFIRMED, Order.OrderStatus.IN_PROGRESS, Order.OrderStatus.COMPLETED)
+    ]
+    do_objs = DeliveryOrder.objects.bulk_create([
+        DeliveryOrder(
+            order=order,
+            delivery_date=order.event_date,
+            status=DeliveryOrderStatus.DELIVERED if order.status == Order.OrderStatus.COMPLETED else DeliveryOrderStatus.PLANNED,
+            recipient_name=f"Recipient {order.pk}",
+        )
+        for order in deliverable
+    ], batch_size=BATCH_SIZE)
+    DeliveryOrderItem.objects.bulk_create([
+        DeliveryOrderItem(delivery_order=do, order_item=item, quantity_delivered=item.quantity)
+        for do in do_objs
+        for item in items_by_order.get(do.order_id, [])
+    ], batch_size=BATCH_SIZE)
+    _assign_numbers(DeliveryOrder, 'do_number', 'DO')
+    log(f"  {len(do_objs)} delivery orders")
+
+    # --- Credit notes against a sample of issued invoices ---
+    items_by_invoice = {}
+    for item in invoice_items:
+        items_by_invoice.setdefault(item.invoice_id, []).append(item)
+    credited = [
+        inv for inv in invoice_objs
+        if inv.status != Invoice.Status.DRAFT and items_by_invoice.get(inv.pk) and rng.random() < credit_note_rate
+    ]
+    cn_objs = CreditNote.objects.bulk_create([
+        CreditNote(
+            client_id=invoice.client_id,
+            related_invoice=invoice,
+            issue_date=invoice.issue_date + timedelta(days=rng.randint(1, 20)),
+            reason="Short delivery",
+            status=rng.choice([CreditNoteStatus.DRAFT, CreditNoteStatus.ISSUED, CreditNoteStatus.APPLIED]),
+        )
+        for invoice in credited
+    ], batch_size=BATCH_SIZE)
+    cn_items = []
+    for cn in cn_objs:
+        invoice_item = rng.choice(items_by_invoice[cn.related_invoice_id])
+        cn_items.append(CreditNoteItem(
+            credit_note=cn,
+            related_invoice_item=invoice_item,
+            description=f"Credit: {invoice_item.description}",
+            quantity=max(Decimal(1), (invoice_item.quantity / 10).quantize(Decimal('1'))),
+            unit_price=invoice_item.unit_price,
+        ))
+    CreditNoteItem.objects.bulk_create(cn_items, batch_size=BATCH_SIZE)
+    _assign_numbers(CreditNote, 'cn_number', 'CN')
+    log(f"  {len(cn_objs)} credit notes")
+
+    return {
+        'clients': len(client_objs),
+        'menu_items': len(menu_objs),
+        'quotations': len(quote_objs) + revision_count,
+        'orders': len(order_objs),
+        'invoices': len(invoice_objs),
+        'payments': len(payment_objs),
+        'delivery_orders': len(do_objs),
+        'credit_notes': len(cn_objs),
+    }
@@ -5,8 +5,12 @@ from django.apps import apps
 from decimal import Decimal
 
 from .models import (
-    Quotation, Payment, Invoice, Order, DeliveryOrder, CreditNote
+    Quotation, QuotationItem, Payment, Invoice, InvoiceItem, Order, OrderItem,
+    DeliveryOrder, DeliveryOrderItem, CreditNote, CreditNoteItem, CreditNoteStatus, Setting, MenuItem, Ingredient, RecipeLine
 )
+from .metrics import PAYMENT_RECOMPUTE_SECONDS
+from .production import invalidate_prep_lists
+from .snapshots import FROZEN_FIELDS
 
 
 
@@ -48,6 +52,7 @@ def generate_invoice_number(sender, instance, created, **kwargs):
 
 
 @receiver([post_save, post_delete], sender=Payment)
+@PAYMENT_RECOMPUTE_SECONDS.time()
 def update_invoice_status_on_payment_change(sender, instance, **kwargs):
     """
     Update the related Invoice status based on payment changes.
@@ -59,31 +64,9 @@ def update_invoice_status_on_payment_change(sender, instance, **kwargs):
     except Invoice.DoesNotExist:
         return
 
-    InvoiceStatus = apps.get_model('documents', 'Invoice').Status
-
-    # Use the correct member name: PARTIALLY_PAID
-    if invoice.status in [InvoiceStatus.DRAFT, InvoiceStatus.CANCELLED]:
-        return # Do nothing if Draft or Cancelled
-
-    amount_paid = invoice.amount_paid
-    grand_total = invoice.grand_total
-
-    new_status = invoice.status
-
-    # Use the correct member name: PARTIALLY_PAID
-    if amount_paid <= 0:
-        new_status = InvoiceStatus.SENT
-    elif amount_paid < grand_total:
-         new_status = InvoiceStatus.PARTIALLY_PAID # Corrected here
-    # Note: The logic for PAID might need refinement later depending on exact grand_total behavior
-    elif amount_paid >= grand_total and grand_total > 0:
-         new_status = InvoiceStatus.PAID
-    elif grand_total <= 0 and amount_paid >= grand_total:
-         new_status = InvoiceStatus.PAID
-
-    if new_status != invoice.status:
-        invoice.status = new_status
-        invoice.save(update_fields=['status'])
+    # The payment change makes any memoized amount_paid on this instance stale;
+    # payments and issued credits together decide the status
+    invoice.update_settlement_status()
 
 
 @receiver(post_save, sender=Order)
@@ -138,4 +121,86 @@ def generate_cn_number(sender, instance, created, **kwargs):
         instance.save(update_fields=['cn_number'])
 
 
+@receiver([post_save, post_delete], sender=QuotationItem)
+@receiver([post_save, post_delete], sender=OrderItem)
+@receiver([post_save, post_delete], sender=InvoiceItem)
+def invalidate_document_totals(sender, instance, **kwargs):
+    """
+    Drop memoized totals on the parent document instance this item was
+    loaded with (e.g. the instance an inline formset was bound to), and the
+    parent's render snapshot. The parent's updated_at is bumped, which
+    invalidates its cached list row.
+    """
+    parent_field = {QuotationItem: 'quotation', OrderItem: 'order', InvoiceItem: 'invoice'}[sender]
+    field = sender._meta.get_field(parent_field)
+    parent = field.get_cached_value(instance, default=None)
+    changes = {'updated_at': timezone.now()}
+    if sender is not OrderItem:
+        # A frozen render snapshot and grand total no longer match the items
+        changes.update(dict.fromkeys(FROZEN_FIELDS))
+    field.related_model.objects.filter(pk=getattr(instance, field.attname)).update(**changes)
+    if parent is not None:
+        parent.invalidate_totals()
+        for name, value in changes.items():
+            setattr(parent, name, value)
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def touch_invoice_on_payment_change(sender, instance, **kwargs):
+    """The balance shown in the invoice's cached list row changed."""
+    Invoice.objects.filter(pk=instance.invoice_id).update(updated_at=timezone.now())
 
+
+@receiver([post_save, post_delete], sender=DeliveryOrderItem)
+def touch_delivery_order_on_item_change(sender, instance, **kwargs):
+    """The delivery order's page and PDF list its items, notes included."""
+    DeliveryOrder.objects.filter(pk=instance.delivery_order_id).update(updated_at=timezone.now())
+
+
+def _credit_changed(invoice_id):
+    """Credits against the invoice changed: its list row is stale and it may now be (un)settled."""
+    Invoice.objects.filter(pk=invoice_id).update(updated_at=timezone.now())
+    invoice = Invoice.objects.filter(pk=invoice_id).first()
+    if invoice is not None:
+        invoice.update_settlement_status()
+
+
+@receiver([post_save, post_delete], sender=CreditNote)
+def update_invoice_on_credit_note_change(sender, instance, **kwargs):
+    """Issuing, applying, cancelling or deleting a credit note changes its invoice's balance."""
+    instance.invalidate_totals()
+    _credit_changed(instance.related_invoice_id)
+
+
+@receiver([post_save, post_delete], sender=CreditNoteItem)
+def update_invoice_on_credit_note_item_change(sender, instance, **kwargs):
+    """
+    Drop memoized totals on the credit note the item was loaded with and bump
+    its updated_at; an issued or applied credit note also changes its invoice.
+    """
+    field = CreditNoteItem._meta.get_field('credit_note')
+    parent = field.get_cached_value(instance, default=None)
+    if parent is not None:
+        parent.invalidate_totals()
+    credit_notes = CreditNote.objects.filter(pk=instance.credit_note_id)
+    credit_notes.update(updated_at=timezone.now())
+    crediting = credit_notes.filter(status__in=[CreditNoteStatus.ISSUED, CreditNoteStatus.APPLIED])
+    invoice_id = crediting.values_list('related_invoice_id', flat=True).first()
+    if invoice_id is not None:
+        _credit_changed(invoice_id)
+
+
+@receiver(post_save, sender=Setting)
+def bump_settings_generation(sender, instance, **kwargs):
+    """Tax settings may have changed, so memoized document totals are stale."""
+    Setting.generation += 1
+
+
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=OrderItem)
+@receiver([post_save, post_delete], sender=MenuItem)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=RecipeLine)
+def invalidate_prep_lists_on_change(sender, instance, **kwargs):
+    """Orders, their items, menu items and recipes make up the prep and purchasing lists."""
+    invalidate_prep_lists()
@@ -0,0 +1,135 @@
+"""
+Frozen render snapshots for finalized quotations and invoices.
+
+finalize() stores, in the document's render_snapshot JSON field, everything
+the detail page and PDF need beyond the document's own row: client, line
+items, totals, related document numbers and the company settings at the
+time. Rendering a finalized document then reads one row, and a reprint
+matches what was sent even if Setting changes later. revert_to_draft()
+and any later change to the items clear it, and rendering goes back to
+the live models.
+
+The grand total is also stored in cents in frozen_grand_total_cents, so
+statuses, balances and lists computed in SQL (documents.reports) use the
+figure the client was sent rather than one recomputed with today's tax
+rate. Changing a finalized document's discount clears both, like an item
+change does.
+
+Only status, payments and the row's own fields stay live, since they can
+legitimately change after a document is sent.
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+
+
+SNAPSHOT_VERSION = 1
+
+_SETTINGS_FIELDS = ['company_name', 'address', 'email', 'phone', 'tax_id', 'currency_symbol', 'tax_enabled']
+_TOTALS_FIELDS = ['subtotal', 'discount_amount', 'total_before_tax', 'tax_amount', 'grand_total']
+
+# The fields freeze() sets, for update_fields and update()
+FROZEN_FIELDS = ['render_snapshot', 'frozen_grand_total_cents']
+
+
+def build_render_snapshot(document, settings):
+    """Serialize what rendering document needs. Items are read with their menu items in one query."""
+    from .models import DocumentTotals
+
+    if 'items' in getattr(document, '_prefetched_objects_cache', {}):
+        items = list(document.items.all()) # Prefetched with their menu items (documents.bulk)
+    else:
+        items = list(document.items.select_related('menu_item'))
+    totals = DocumentTotals(items, document.discount_type, document.discount_value,
+                            tax_enabled=settings.tax_enabled, tax_rate=settings.tax_rate)
+    client = document.client
+    data = {
+        'v': SNAPSHOT_VERSION,
+        'client': {
+            'name': client.name, 'address': client.address, 'email': client.email,
+            'phone': client.phone, 'tax_id': client.tax_id,
+        },
+        'items': [
+            {
+                'menu_item': item.menu_item.name,
+                'description': item.description,
+                'quantity': str(item.quantity),
+                'unit_price': str(item.unit_price),
+                'line_total': str(item.line_total),
+                'grouping_label': item.grouping_label,
+            }
+            for item in items
+        ],
+        'totals': {name: str(getattr(totals, name)) for name in _TOTALS_FIELDS},
+        'discount': snapshot_discount(document),
+        'settings': {
+            **{name: getattr(settings, name) for name in _SETTINGS_FIELDS},
+            'tax_rate': str(settings.tax_rate),
+            'company_logo': settings.company_logo.url if settings.company_logo else '',
+        },
+        'related': {},
+    }
+    for name, number_field in (('related_quotation', 'quotation_number'), ('related_order', 'order_number'),
+                               ('previous_version', 'quotation_number')):
+        if not hasattr(document, f'{name}_id'):
+            continue
+        related = getattr(document, name)
+        data['related'][name] = {'pk': related.pk, number_field: getattr(related, number_field)} if related else None
+    return data
+
+
+def snapshot_discount(document):
+    """The document's discount as its snapshot records it."""
+    return {'type': document.discount_type, 'value': str(document.discount_value)}
+
+
+def freeze(document, settings):
+    """Set the document's render snapshot and frozen grand total (FROZEN_FIELDS); the caller saves."""
+    document.render_snapshot = build_render_snapshot(document, settings)
+    document.frozen_grand_total_cents = int(Decimal(document.render_snapshot['totals']['grand_total']) * 100)
+
+
+def frozen_totals(data):
+    """The totals of a snapshot as Decimals, with the attributes of DocumentTotals."""
+    return SimpleNamespace(**{name: Decimal(value) for name, value in data['totals'].items()})
+
+
+class FrozenDocument:
+    """
+    A finalized document for the templates: the snapshot provides client,
+    totals and related documents, everything else falls through to the row.
+    """
+
+    def __init__(self, document, data):
+        self._document = document
+        self.client = SimpleNamespace(**data['client'])
+        for name, value in data['totals'].items():
+            setattr(self, name, Decimal(value))
+        for name, value in data['related'].items():
+            setattr(self, name, SimpleNamespace(**value) if value else None)
+
+    def __getattr__(self, name):
+        return getattr(self._document, name)
+
+    @property
+    def balance_due(self):
+        return (self.grand_total - self._document.amount_paid - self._document.amount_credited).quantize(Decimal('0.01'))
+
+
+def frozen_render_context(document):
+    """(document, items, settings) for the templates, built from document.render_snapshot."""
+    data = document.render_snapshot
+    items = [
+        SimpleNamespace(
+            menu_item=SimpleNamespace(name=item['menu_item']),
+            description=item['description'],
+            quantity=Decimal(item['quantity']),
+            unit_price=Decimal(item['unit_price']),
+            line_total=Decimal(item['line_total']),
+            grouping_label=item['grouping_label'],
+        )
+        for item in data['items']
+    ]
+    settings = SimpleNamespace(**data['settings'])
+    settings.tax_rate = Decimal(settings.tax_rate)
+    settings.company_logo = SimpleNamespace(url=settings.company_logo) if settings.company_logo else None
+    return FrozenDocument(document, data), items, settings
@@ -0,0 +1,67 @@
+"""
+Status sweeps, run on a schedule with manage.py sweep_statuses:
+
+- SENT/PART_PAID invoices past their due_date with a balance become OVERDUE,
+- OVERDUE invoices no longer past due (the due date was moved) get their
+  settlement status back,
+- SENT quotations past their valid_until become EXPIRED.
+
+Each is a single UPDATE whose WHERE is served by an index on status
+(invoice_status_idx or the open-invoice partial index invoice_open_due_idx,
+quotation_status_valid_idx); no instances are loaded. Only rows whose
+status changes match, so a second run updates nothing and a run with
+nothing to do costs three index lookups. updated_at is set explicitly:
+update() bypasses auto_now, and list rows are cached on it.
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Invoice, Quotation, Setting
+from .reports import invoice_balance_cents, settlement_status
+
+
+def overdue_invoices(today, settings):
+    """Open invoices not yet OVERDUE with due_date before today and a positive balance."""
+    return (
+        Invoice.objects.open()
+        .filter(due_date__lt=today)
+        .exclude(status=Invoice.Status.OVERDUE)
+        .alias(balance_cents=invoice_balance_cents(settings))
+        .filter(balance_cents__gt=0)
+    )
+
+
+def no_longer_overdue_invoices(today):
+    """OVERDUE invoices whose due date is today or later, or was cleared."""
+    return Invoice.objects.filter(Q(due_date__gte=today) | Q(due_date__isnull=True), status=Invoice.Status.OVERDUE)
+
+
+def expired_quotations(today):
+    """SENT quotations with valid_until before today."""
+    return Quotation.objects.filter(status=Quotation.Status.SENT, valid_until__lt=today)
+
+
+def sweep_statuses(today=None, settings=None, dry_run=False):
+    """
+    Run the three sweeps as of today (default: the local date). Returns
+    {'overdue', 'reopened', 'expired'}: the rows updated, or with dry_run
+    the rows that would be.
+    """
+    if today is None:
+        today = timezone.localdate()
+    if settings is None:
+        settings = Setting.get_solo()
+    querysets = {
+        'overdue': overdue_invoices(today, settings),
+        'reopened': no_longer_overdue_invoices(today),
+        'expired': expired_quotations(today),
+    }
+    if dry_run:
+        return {name: queryset.count() for name, queryset in querysets.items()}
+    now = timezone.now()
+    return {
+        'overdue': querysets['overdue'].update(status=Invoice.Status.OVERDUE, updated_at=now),
+        'reopened': querysets['reopened'].update(status=settlement_status(settings, keep_overdue=False),
+                                                 updated_at=now),
+        'expired': querysets['expired'].update(status=Quotation.Status.EXPIRED, updated_at=now),
+    }
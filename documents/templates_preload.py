@@ -0,0 +1,49 @@
+"""
+Template preloading for production.
+
+With the cached template loader (see core/settings_production.py) a
+template is read and compiled the first time it is used, then kept for
+the life of the worker. preload_templates() compiles the documents/ and
+documents/pdf/ templates up front, so the first request for each page and
+the first PDF of each kind do not pay for it. DocumentsConfig.ready() calls
+it when DOCUMENTS_PRELOAD_TEMPLATES is set.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.template import engines
+
+
+logger = logging.getLogger('documents.performance')
+
+TEMPLATE_DIRS = ['documents', 'documents/pdf']
+
+
+def document_template_names():
+    """Template names of every .html file in the app's documents/ and documents/pdf/ directories."""
+    root = Path(apps.get_app_config('documents').path) / 'templates'
+    return [f'{directory}/{path.name}' for directory in TEMPLATE_DIRS
+            for path in sorted((root / directory).glob('*.html'))]
+
+
+def preload_templates(names=None, engine=None):
+    """
+    Load and compile the templates (default: document_template_names()) and
+    return {name: seconds}. Templates they extend or include are compiled
+    along with them.
+    """
+    engine = engine or engines['django'].engine
+    timings = {}
+    for name in names or document_template_names():
+        started = time.perf_counter()
+        engine.get_template(name)
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def preload_on_startup():
+    timings = preload_templates()
+    logger.info("Preloaded %d templates in %.1f ms", len(timings), sum(timings.values()) * 1000)
+    return timings
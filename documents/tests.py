@@ -1,4 +1,5 @@
-from django.test import TestCase, Client as TestClient
+from django.test import TestCase, TransactionTestCase, Client as TestClient
+from django.db import connections
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
@@ -6,6 +7,7 @@ from datetime import date, timedelta
 from django.utils import timezone
 from django.urls import reverse
 from decimal import Decimal
+from unittest import skipUnless
 from django import forms
 
 
@@ -21,7 +23,8 @@ from .models import (
     Client, MenuItem, Quotation, QuotationItem, Invoice, InvoiceItem,
     Setting, DiscountType, Payment, PaymentMethod, Order, OrderItem,
     DeliveryOrder, DeliveryOrderItem, DeliveryOrderStatus,
-    CreditNote, CreditNoteItem, CreditNoteStatus 
+    CreditNote, CreditNoteItem, CreditNoteStatus,
+    Ingredient, RecipeLine
 )
 
 
@@ -3217,3 +3220,1971 @@ class CreditNoteItemModelTests(TestCase):
 
 
 
+
+
+class InvoiceIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.db_client = Client.objects.create(name="Index Test Client")
+        today = timezone.now().date()
+        for status in [Invoice.Status.DRAFT, Invoice.Status.SENT, Invoice.Status.PARTIALLY_PAID,
+                       Invoice.Status.PAID, Invoice.Status.CANCELLED]:
+            Invoice.objects.create(client=cls.db_client, status=status, issue_date=today, due_date=today)
+
+    def test_open_queryset_returns_unpaid_statuses(self):
+        """Test that open() only returns invoices still awaiting payment."""
+        statuses = set(Invoice.objects.open().values_list('status', flat=True))
+        self.assertEqual(statuses, {Invoice.Status.SENT, Invoice.Status.PARTIALLY_PAID})
+
+    def test_open_queryset_works_in_subqueries(self):
+        """Test that open() can be used where the invoice table is aliased, as in Exists() and self-joins."""
+        from django.db.models import Exists, OuterRef
+        with_open = Client.objects.filter(Exists(Invoice.objects.open().filter(client=OuterRef('pk'))))
+        self.assertEqual(list(with_open), [self.db_client])
+        drafts = Invoice.objects.filter(status=Invoice.Status.DRAFT, client__in=Invoice.objects.open().values('client'))
+        self.assertEqual(drafts.count(), 1)
+
+    def test_open_due_before_repeats_partial_index_condition(self):
+        """Test that open_due_before() emits the partial index condition as literal SQL so the planner can match it."""
+        tomorrow = timezone.now().date() + timedelta(days=1)
+        sql = str(Invoice.objects.open_due_before(tomorrow).query)
+        self.assertIn("\"status\" IN ('SENT', 'PART_PAID', 'OVERDUE')", sql)
+        statuses = set(Invoice.objects.open_due_before(tomorrow).values_list('status', flat=True))
+        self.assertEqual(statuses, {Invoice.Status.SENT, Invoice.Status.PARTIALLY_PAID})
+
+    def test_list_ordering_uses_composite_index(self):
+        """Test that the default invoice list ordering is served by an index, not a sort."""
+        from django.db import connection
+        if connection.vendor != 'sqlite':
+            self.skipTest("Query plan text is SQLite specific.")
+        plan = Invoice.objects.all()[:50].explain()
+        self.assertIn('invoice_issued_idx', plan)
+
+
+class SeedDatasetTests(TestCase):
+
+    def test_seed_dataset_creates_linked_documents(self):
+        """Test that the benchmark seeder builds numbered, linked documents with revision chains."""
+        from .seeding import seed_dataset
+        settings = Setting.get_solo()
+        settings.tax_enabled = True
+        settings.tax_rate = Decimal("6.00")
+        settings.save()
+        counts = seed_dataset(clients=5, menu_items=10, quotations=40, revision_rate=0.5, seed=3)
+
+        self.assertEqual(Quotation.objects.count(), counts['quotations'])
+        self.assertFalse(Quotation.objects.filter(quotation_number__isnull=True).exists())
+        self.assertFalse(Invoice.objects.filter(invoice_number__isnull=True).exists())
+        self.assertTrue(Quotation.objects.filter(previous_version__isnull=False).exists())
+        self.assertTrue(Order.objects.filter(related_quotation__isnull=False).exists())
+        # Left for the "quotation to order" benchmark
+        self.assertTrue(Quotation.objects.filter(status=Quotation.Status.ACCEPTED, orders__isnull=True).exists())
+        self.assertTrue(Invoice.objects.filter(status=Invoice.Status.PAID).exists())
+        for invoice in Invoice.objects.filter(status=Invoice.Status.PAID):
+            self.assertEqual(invoice.balance_due, Decimal('0.00'))
+        # Payments are made against the grand total with tax, so the seeded statuses are the ones they call for
+        paid = Invoice.objects.filter(status__in=[Invoice.Status.PAID, Invoice.Status.PARTIALLY_PAID],
+                                      credit_notes__isnull=True)
+        self.assertTrue(paid.exists())
+        for invoice in paid:
+            self.assertEqual(invoice.settlement_status(), invoice.status, invoice.invoice_number)
+
+
+class QueryInstrumentationMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='perf', email='perf@example.com', password='password123')
+        cls.db_client = Client.objects.create(name="Instrumented Client")
+        for _ in range(3):
+            Invoice.objects.create(client=cls.db_client, status=Invoice.Status.SENT)
+            Quotation.objects.create(client=cls.db_client)
+
+    def setUp(self):
+        self.client = TestClient()
+        self.client.force_login(self.user)
+
+    def test_fingerprint_ignores_literal_values(self):
+        """Test that the same query with different values gets one fingerprint."""
+        from .middleware import fingerprint
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'a'"),
+            fingerprint("SELECT * FROM t WHERE id = 22 AND name = 'bb'"),
+        )
+        self.assertEqual(fingerprint('WHERE id IN (%s, %s)'), fingerprint('WHERE id IN (%s)'))
+
+    def test_server_timing_header_on_documents_views(self):
+        """Test that documents views get a Server-Timing header with SQL, template and view timings."""
+        response = self.client.get(reverse('documents:invoice_list'))
+        self.assertEqual(response.status_code, 200)
+        header = response['Server-Timing']
+        self.assertIn('sql;dur=', header)
+        self.assertIn('tpl;dur=', header)
+        self.assertIn('view;dur=', header)
+        self.assertGreater(response.wsgi_request.perf_stats.query_count, 0)
+        self.assertGreater(response.wsgi_request.perf_stats.template_ms, 0)
+
+    def test_other_paths_are_not_instrumented(self):
+        """Test that requests outside DOCUMENTS_INSTRUMENTATION_PATHS are left alone."""
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_repeated_queries_log_call_site(self):
+        """Test that a query repeated past the threshold is logged with a stack trace."""
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .middleware import QueryInstrumentationMiddleware
+
+        def n_plus_one_view(request):
+            for quotation in Quotation.objects.all():
+                list(quotation.items.all())
+            return HttpResponse()
+
+        with self.settings(DOCUMENTS_DUPLICATE_QUERY_THRESHOLD=3):
+            middleware = QueryInstrumentationMiddleware(n_plus_one_view)
+            with self.assertLogs('documents.performance', level='INFO') as logs:
+                middleware(RequestFactory().get('/docs/quotations/'))
+        warnings = [line for line in logs.output if line.startswith('WARNING')]
+        self.assertTrue(warnings)
+        self.assertIn('documents/', warnings[0])
+        self.assertIn('"duplicates": ', logs.output[-len(warnings) - 1])
+
+
+class RequestProfilingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', email='staff@example.com',
+                                             password='password123', is_staff=True)
+        cls.user = User.objects.create_user(username='plain', email='plain@example.com', password='password123')
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        override = self.settings(DOCUMENTS_PROFILE_DIR=self.tmpdir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = TestClient()
+
+    def test_staff_request_with_param_is_profiled(self):
+        """Test that ?_profile=1 from a staff user saves a cProfile and a collapsed-stack file."""
+        import os
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('documents:invoice_list') + '?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile-Name']
+        files = set(os.listdir(self.tmpdir.name))
+        self.assertEqual(files, {f"{name}.prof", f"{name}.collapsed", f"{name}.json"})
+
+        import pstats
+        stats = pstats.Stats(os.path.join(self.tmpdir.name, f"{name}.prof"))
+        self.assertTrue(any(func[2] == 'invoice_list_view' for func in stats.stats))
+
+    def test_header_triggers_profiling(self):
+        """Test that the X-Profile-Request header also triggers profiling."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('documents:client_list'), HTTP_X_PROFILE_REQUEST='1')
+        self.assertIn('X-Profile-Name', response)
+
+    def test_non_staff_and_untriggered_requests_are_not_profiled(self):
+        """Test that profiling needs both a trigger and a staff user."""
+        import os
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('documents:invoice_list') + '?_profile=1')
+        self.assertNotIn('X-Profile-Name', response)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('documents:invoice_list'))
+        self.assertNotIn('X-Profile-Name', response)
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_profile_list_page(self):
+        """Test that the admin profile page lists saved profiles and serves downloads."""
+        self.client.force_login(self.staff)
+        name = self.client.get(reverse('documents:invoice_list') + '?_profile=1')['X-Profile-Name']
+        response = self.client.get(reverse('profile_list'))
+        self.assertContains(response, '/docs/invoices/?_profile=1')
+        download = self.client.get(reverse('profile_download', args=[name, 'collapsed']))
+        self.assertEqual(download.status_code, 200)
+        bad = self.client.get(reverse('profile_download', args=[name, 'json']))
+        self.assertEqual(bad.status_code, 404)
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        override = self.settings(DOCUMENTS_METRICS_DIR=self.tmpdir.name, DOCUMENTS_METRICS_FLUSH_INTERVAL=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _scrape(self):
+        response = TestClient().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def _sample(self, text, line_start):
+        for line in text.splitlines():
+            if line.startswith(line_start):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_finalize_duration_is_recorded(self):
+        """Test that finalize() shows up in the operation duration histogram."""
+        metric = 'documents_operation_seconds_count{document="invoice",operation="finalize"}'
+        before = self._sample(self._scrape(), metric)
+        invoice = Invoice.objects.create(client=Client.objects.create(name="Metrics Client"))
+        invoice.finalize()
+        self.assertEqual(self._sample(self._scrape(), metric), before + 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test the exposition of a histogram observation."""
+        from . import metrics
+        metrics.PAYMENT_RECOMPUTE_SECONDS.observe(0.02)
+        text = self._scrape()
+        self.assertIn('# TYPE documents_payment_recompute_seconds histogram', text)
+        le_small = self._sample(text, 'documents_payment_recompute_seconds_bucket{le="0.01"}')
+        le_large = self._sample(text, 'documents_payment_recompute_seconds_bucket{le="0.025"}')
+        self.assertGreaterEqual(le_large, le_small + 1)
+
+    def test_counts_from_other_processes_are_merged(self):
+        """Test that files written by other worker processes are added to this process's values."""
+        import json, os
+        metric = 'documents_pdf_failures_total{document="invoice"}'
+        before = self._sample(self._scrape(), metric)
+        # The test runner's parent stands in for another live worker
+        with open(os.path.join(self.tmpdir.name, f'metrics-{os.getppid()}.json'), 'w') as fh:
+            json.dump({'documents_pdf_failures_total': {'document="invoice"': 3}}, fh)
+        self.assertEqual(self._sample(self._scrape(), metric), before + 3)
+
+    def test_files_of_exited_workers_are_dropped(self):
+        """Test that a file left by a worker that has exited is deleted rather than counted."""
+        import json, os, subprocess, sys
+        metric = 'documents_pdf_failures_total{document="order"}'
+        before = self._sample(self._scrape(), metric)
+        exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        path = os.path.join(self.tmpdir.name, f'metrics-{exited}.json')
+        with open(path, 'w') as fh:
+            json.dump({'documents_pdf_failures_total': {'document="order"': 5}}, fh)
+        self.assertEqual(self._sample(self._scrape(), metric), before)
+        self.assertFalse(os.path.exists(path))
+
+    def test_concurrent_flushes(self):
+        """Test that overlapping flushes, and counters gaining labels meanwhile, do not fail."""
+        import threading
+        from . import metrics
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(200):
+                    metrics.PDF_FAILURES.inc(document=f"flush-{n}-{i}")
+                    metrics.flush(force=True)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        metrics.PDF_FAILURES.values = {key: value for key, value in metrics.PDF_FAILURES.values.items()
+                                       if not key.startswith('document="flush-')}
+
+    def test_view_query_counts_are_recorded(self):
+        """Test that instrumented requests record their query count per view."""
+        user = User.objects.create_user(username='metrics', email='metrics@example.com', password='password123')
+        client = TestClient()
+        client.force_login(user)
+        client.get(reverse('documents:client_list'))
+        self.assertGreater(self._sample(self._scrape(), 'documents_view_queries_count{view="documents:client_list"}'), 0)
+
+    def test_metrics_refused_for_remote_clients(self):
+        """Test that /metrics is only served to allowed addresses."""
+        response = TestClient(REMOTE_ADDR='10.0.0.5').get('/metrics')
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics_token_required_when_set(self):
+        """Test that with DOCUMENTS_METRICS_TOKEN set, an allowed address also needs the token or a staff login."""
+        with self.settings(DOCUMENTS_METRICS_TOKEN='s3cret'):
+            self.assertEqual(TestClient().get('/metrics').status_code, 404)
+            self.assertEqual(TestClient().get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            self.assertEqual(TestClient().get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+            staff = TestClient()
+            staff.force_login(User.objects.create_user(username='metrics', password='pw', is_staff=True))
+            self.assertEqual(staff.get('/metrics').status_code, 200)
+
+
+class DocumentTotalsQueryTests(TestCase):
+    """Detail pages and PDFs should issue the same number of queries however many items a document has."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='totals', email='totals@example.com',
+                                            password='password123', is_staff=True)
+        settings = Setting.get_solo()
+        settings.tax_enabled = True
+        settings.save()
+        cls.db_client = Client.objects.create(name="Totals Client")
+        cls.menu_item = MenuItem.objects.create(name="Totals Item", unit_price=Decimal("10.00"))
+
+    def setUp(self):
+        self.client = TestClient()
+        self.client.force_login(self.user)
+
+    def _make_documents(self, item_count):
+        quotation = Quotation.objects.create(client=self.db_client, discount_type=DiscountType.PERCENTAGE,
+                                             discount_value=Decimal("10.00"))
+        order = Order.objects.create(client=self.db_client, related_quotation=quotation)
+        invoice = Invoice.objects.create(client=self.db_client, related_order=order, status=Invoice.Status.SENT)
+        for _ in range(item_count):
+            QuotationItem.objects.create(quotation=quotation, menu_item=self.menu_item, quantity=2, unit_price=Decimal("10.00"))
+            OrderItem.objects.create(order=order, menu_item=self.menu_item, quantity=2, unit_price=Decimal("10.00"))
+            InvoiceItem.objects.create(invoice=invoice, menu_item=self.menu_item, quantity=2, unit_price=Decimal("10.00"))
+        for _ in range(item_count):
+            Payment.objects.create(invoice=invoice, amount=Decimal("1.00"))
+        return {'quotation': quotation, 'order': order, 'invoice': invoice}
+
+    def _query_counts(self, url_names):
+        from unittest import mock
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        counts = []
+        fake_weasyprint = mock.Mock()
+        fake_weasyprint.HTML.return_value.write_pdf.return_value = b'%PDF-1.4'
+        for item_count in (1, 6):
+            documents = self._make_documents(item_count)
+            row = []
+            with mock.patch('documents.views.weasyprint', fake_weasyprint):
+                for url_name, kind in url_names:
+                    with CaptureQueriesContext(connection) as captured:
+                        response = self.client.get(reverse(url_name, args=[documents[kind].pk]))
+                    self.assertEqual(response.status_code, 200)
+                    row.append(len(captured))
+            counts.append(row)
+        return counts
+
+    def test_detail_pages_have_constant_query_count(self):
+        """Test that totals on detail pages do not re-query per item or per property."""
+        few, many = self._query_counts([
+            ('documents:quotation_detail', 'quotation'),
+            ('documents:order_detail', 'order'),
+            ('documents:invoice_detail', 'invoice'),
+        ])
+        self.assertEqual(few, many)
+
+    def test_pdfs_have_constant_query_count(self):
+        """Test that totals in PDF templates do not re-query per item or per property."""
+        few, many = self._query_counts([
+            ('documents:quotation_pdf', 'quotation'),
+            ('documents:order_pdf', 'order'),
+            ('documents:invoice_pdf', 'invoice'),
+        ])
+        self.assertEqual(few, many)
+
+    def test_totals_are_memoized_and_invalidated_by_item_changes(self):
+        """Test that totals are computed once and refreshed when an item is added through the instance."""
+        invoice = Invoice.objects.create(client=self.db_client)
+        InvoiceItem.objects.create(invoice=invoice, menu_item=self.menu_item, quantity=1, unit_price=Decimal("10.00"))
+        self.assertEqual(invoice.subtotal, Decimal("10.00"))
+        with self.assertNumQueries(0):
+            invoice.subtotal, invoice.tax_amount, invoice.grand_total
+        InvoiceItem.objects.create(invoice=invoice, menu_item=self.menu_item, quantity=1, unit_price=Decimal("5.00"))
+        self.assertEqual(invoice.subtotal, Decimal("15.00"))
+
+    def test_totals_follow_discount_and_tax_changes(self):
+        """Test that changing the discount or the tax settings recomputes memoized totals."""
+        invoice = Invoice.objects.create(client=self.db_client)
+        InvoiceItem.objects.create(invoice=invoice, menu_item=self.menu_item, quantity=10, unit_price=Decimal("10.00"))
+        self.assertEqual(invoice.tax_amount, Decimal("6.00"))
+        invoice.discount_type = DiscountType.FIXED
+        invoice.discount_value = Decimal("50.00")
+        self.assertEqual(invoice.total_before_tax, Decimal("50.00"))
+        settings = Setting.get_solo()
+        settings.tax_enabled = False
+        settings.save()
+        self.assertEqual(invoice.grand_total, Decimal("50.00"))
+
+
+class SQLiteProductionProfileTests(TestCase):
+
+    def test_production_options_apply_pragmas_on_connect(self):
+        """Test that the production OPTIONS turn on WAL and the other PRAGMAs for every new connection."""
+        import tempfile, os
+        from django.db import connection
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+        from core.db import sqlite_production_options
+        if connection.vendor != 'sqlite':
+            self.skipTest("SQLite specific.")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settings_dict = {**connection.settings_dict, 'NAME': os.path.join(tmpdir, 'prod.sqlite3'),
+                             'OPTIONS': sqlite_production_options()}
+            wrapper = DatabaseWrapper(settings_dict, alias='production_check')
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store', 'cache_size'):
+                        cursor.execute(f"PRAGMA {name}")
+                        pragmas[name] = cursor.fetchone()[0]
+                self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+            finally:
+                wrapper.close()
+        self.assertEqual(pragmas['journal_mode'], 'wal')
+        self.assertEqual(pragmas['synchronous'], 1) # NORMAL
+        self.assertEqual(pragmas['busy_timeout'], 5000)
+        self.assertEqual(pragmas['temp_store'], 2) # MEMORY
+        self.assertEqual(pragmas['cache_size'], -20000)
+
+
+class ReportQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        settings = Setting.get_solo()
+        settings.tax_enabled = True
+        settings.tax_rate = Decimal("6.00")
+        settings.save()
+        cls.today = date(2025, 6, 30)
+        cls.client_a = Client.objects.create(name="Aging A")
+        cls.client_b = Client.objects.create(name="Aging B")
+        item = MenuItem.objects.create(name="Aging Item", unit_price=Decimal("33.33"))
+
+        def invoice(client, days_overdue, quantity, discount_type=DiscountType.NONE, discount_value=Decimal("0.00"),
+                    status=Invoice.Status.SENT, paid=None):
+            inv = Invoice.objects.create(client=client, status=status, issue_date=cls.today,
+                                         due_date=cls.today - timedelta(days=days_overdue),
+                                         discount_type=discount_type, discount_value=discount_value)
+            InvoiceItem.objects.create(invoice=inv, menu_item=item, quantity=Decimal(quantity), unit_price=Decimal("33.33"))
+            InvoiceItem.objects.create(invoice=inv, menu_item=item, quantity=Decimal("1.50"), unit_price=Decimal("9.99"))
+            if paid:
+                Payment.objects.create(invoice=inv, amount=Decimal(paid))
+            inv.refresh_from_db()
+            return inv
+
+        cls.invoices = [
+            invoice(cls.client_a, -5, 3),
+            invoice(cls.client_a, 10, 7, DiscountType.PERCENTAGE, Decimal("12.50")),
+            invoice(cls.client_a, 45, 2, DiscountType.FIXED, Decimal("20.00"), paid="10.00"),
+            invoice(cls.client_b, 75, 5),
+            invoice(cls.client_b, 200, 1),
+            invoice(cls.client_b, 200, 9, status=Invoice.Status.PAID),
+        ]
+
+    def test_annotated_totals_match_python_totals(self):
+        """Test that the SQL totals agree with DocumentTotals for every discount type."""
+        from .reports import annotate_totals
+        for inv in annotate_totals(Invoice.objects.all()):
+            self.assertEqual(inv.db_subtotal, inv.subtotal)
+            self.assertEqual(inv.db_discount, inv.discount_amount)
+            self.assertEqual(inv.db_tax, inv.tax_amount)
+            self.assertEqual(inv.db_grand_total, inv.grand_total)
+            self.assertEqual(inv.db_balance, inv.balance_due)
+
+    def test_aging_report_buckets_open_balances_in_one_query(self):
+        """Test that the aging report sorts open balances into buckets with a single query."""
+        from .reports import aging_report
+        settings = Setting.get_solo()
+        with self.assertNumQueries(1):
+            rows, totals = aging_report(as_of=self.today, settings=settings)
+        by_client = {row['client_name']: row for row in rows}
+        a, b = by_client["Aging A"], by_client["Aging B"]
+        self.assertEqual(a['current'], self.invoices[0].balance_due)
+        self.assertEqual(a['days_1_30'], self.invoices[1].balance_due)
+        self.assertEqual(a['days_31_60'], self.invoices[2].balance_due)
+        self.assertEqual(b['days_61_90'], self.invoices[3].balance_due)
+        self.assertEqual(b['days_over_90'], self.invoices[4].balance_due) # The PAID invoice is not open
+        self.assertEqual(totals['total'], sum(inv.balance_due for inv in self.invoices[:5]))
+
+    def test_client_statement_running_balance(self):
+        """Test the window-function running balance (and its fallback) on a client statement."""
+        from unittest import mock
+        from django.db import connection
+        from .reports import client_statement
+        expected = [self.invoices[2].balance_due]
+        expected.append(expected[-1] + self.invoices[1].balance_due)
+        expected.append(expected[-1] + self.invoices[0].balance_due)
+        self.assertEqual([inv.running_balance for inv in client_statement(self.client_a)], expected)
+        with mock.patch.object(connection.features, 'supports_over_clause', False):
+            self.assertEqual([inv.running_balance for inv in client_statement(self.client_a)], expected)
+
+    def test_aging_report_view(self):
+        """Test that the aging report page renders for staff."""
+        staff = User.objects.create_user(username='aging', email='aging@example.com', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('documents:aging_report'))
+        self.assertContains(response, "Aging A")
+
+
+@skipUnless(connections['default'].vendor == 'postgresql', "Needs DATABASE_ENGINE=postgresql (see core.db)")
+class PostgreSQLReportTests(ReportQueryTests):
+    """The report tests on PostgreSQL, plus checks that its SQL forms are the ones that ran."""
+
+    def _sql(self, run):
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connections['default']) as captured:
+            run()
+        return ' '.join(query['sql'] for query in captured)
+
+    def test_aging_report_uses_filter_clause(self):
+        """Test that the aging buckets are SUM(...) FILTER (WHERE ...) aggregates."""
+        from .reports import aging_report
+        self.assertIn('FILTER (WHERE', self._sql(lambda: aging_report(as_of=self.today)))
+
+    def test_client_statement_uses_window_function(self):
+        """Test that the running balance is computed by the database."""
+        from .reports import client_statement
+        self.assertIn(' OVER (', self._sql(lambda: client_statement(self.client_a)))
+
+    def test_open_invoices_partial_index_exists(self):
+        """Test that the partial index behind Invoice.objects.open() was created."""
+        with connections['default'].cursor() as cursor:
+            constraints = connections['default'].introspection.get_constraints(cursor, Invoice._meta.db_table)
+        self.assertIn('invoice_open_due_idx', constraints)
+
+
+class ReplicaRoutingTests(TestCase):
+    """
+    Two SQLite databases: the test database as primary, and a file copied
+    from it before any test data exists as the replica. Rows created in a
+    test are therefore only on the primary, which shows where reads went.
+    """
+    @classmethod
+    def setUpClass(cls):
+        import sqlite3
+        import tempfile
+        from django.db import connection
+        from django.test import override_settings
+
+        cls._replica_dir = tempfile.TemporaryDirectory()
+        replica_path = f"{cls._replica_dir.name}/replica.sqlite3"
+        connection.ensure_connection()
+        target = sqlite3.connect(replica_path)
+        connection.connection.backup(target)
+        target.close()
+        super().setUpClass()
+        # Registered after TestCase's class setup, which only knows about configured databases
+        connections.settings['replica_test'] = {**connections.settings['default'], 'NAME': replica_path}
+        cls.databases = {'default', 'replica_test'}
+        cls._override = override_settings(DOCUMENTS_READ_REPLICAS=['replica_test'], DOCUMENTS_REPLICA_PIN_SECONDS=60)
+        cls._override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._override.disable()
+        connections['replica_test'].close()
+        del connections['replica_test']
+        del connections.settings['replica_test']
+        cls.databases = {'default'}
+        cls._replica_dir.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='replica', password='password')
+        self.test_client = TestClient()
+        self.test_client.force_login(self.user)
+        Client.objects.create(name="Only On Primary")
+
+    def test_decorated_view_reads_from_replica(self):
+        """A @use_read_replica list view does not see rows that only exist on the primary."""
+        response = self.test_client.get(reverse('documents:client_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Only On Primary")
+
+    def test_undecorated_view_reads_from_primary(self):
+        """Views that did not opt in keep reading from the primary."""
+        client = Client.objects.get(name="Only On Primary")
+        response = self.test_client.get(reverse('documents:client_detail', args=[client.pk]))
+        self.assertContains(response, "Only On Primary")
+
+    def test_write_pins_session_to_primary(self):
+        """After a POST, the same session reads its own writes from the primary."""
+        response = self.test_client.post(reverse('documents:client_create'), {'name': "Just Saved"})
+        self.assertEqual(response.status_code, 302)
+        response = self.test_client.get(reverse('documents:client_list'))
+        self.assertContains(response, "Just Saved")
+        self.assertContains(response, "Only On Primary")
+
+        other = TestClient()
+        other.force_login(self.user)
+        self.assertNotContains(other.get(reverse('documents:client_list')), "Just Saved")
+
+    def test_router_sends_writes_and_migrations_to_primary(self):
+        """Writes go to the primary and replicas are never migrated."""
+        from .routers import ReplicaRouter, _replica_reads
+        router = ReplicaRouter()
+        token = _replica_reads.set(True)
+        try:
+            self.assertEqual(router.db_for_read(Client), 'replica_test')
+            self.assertIsNone(router.db_for_read(User))
+            self.assertEqual(router.db_for_write(Client), 'default')
+        finally:
+            _replica_reads.reset(token)
+        self.assertIsNone(router.db_for_read(Client))
+        self.assertFalse(router.allow_migrate('replica_test', 'documents'))
+
+
+class BackupDbTests(TransactionTestCase):
+    """TransactionTestCase: the backup API cannot read through an open transaction."""
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        Client.objects.create(name="Backed Up Client")
+
+    def test_backup_writes_checksummed_snapshots_and_rotates(self):
+        """Each run writes a gzipped snapshot with a .sha256 file and keeps only --keep of them."""
+        from io import StringIO
+        from pathlib import Path
+        from django.core.management import call_command
+
+        for _ in range(3):
+            call_command('backup_db', dir=self.tmpdir.name, keep=2, sleep=0, stdout=StringIO())
+        snapshots = sorted(Path(self.tmpdir.name).glob('db-*.sqlite3.gz'))
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(len(list(Path(self.tmpdir.name).glob('*.sha256'))), 2)
+
+        out = StringIO()
+        call_command('backup_db', dir=self.tmpdir.name, verify=snapshots[-1].name, stdout=out)
+        self.assertIn("Snapshot OK", out.getvalue())
+
+    def test_verify_rejects_corrupted_snapshot(self):
+        """A snapshot whose bytes no longer match its checksum fails verification."""
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from .management.commands.backup_db import create_snapshot
+        from django.db import connection
+
+        connection.ensure_connection()
+        path = create_snapshot(connection.connection, self.tmpdir.name, sleep=0)
+        with open(path, 'r+b') as fh:
+            fh.seek(20)
+            fh.write(b'corrupt')
+        with self.assertRaisesMessage(CommandError, "Checksum mismatch"):
+            call_command('backup_db', verify=str(path), stdout=StringIO())
+
+    def test_restore_copies_snapshot_into_target(self):
+        """restore_snapshot brings back the data the snapshot was taken with."""
+        import sqlite3
+        from django.db import connection
+        from .management.commands.backup_db import create_snapshot, restore_snapshot
+
+        connection.ensure_connection()
+        path = create_snapshot(connection.connection, self.tmpdir.name, sleep=0)
+        target = sqlite3.connect(f"{self.tmpdir.name}/restored.sqlite3")
+        try:
+            restore_snapshot(path, target)
+            names = [row[0] for row in target.execute("SELECT name FROM documents_client")]
+        finally:
+            target.close()
+        self.assertIn("Backed Up Client", names)
+
+
+class RenderSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='snapshot', password='password123', is_staff=True)
+        settings = Setting.get_solo()
+        settings.tax_enabled = True
+        settings.tax_rate = Decimal("6.00")
+        settings.company_name = "Original Company"
+        settings.save()
+        cls.db_client = Client.objects.create(name="Snapshot Client", email="snap@example.com")
+        cls.menu_item = MenuItem.objects.create(name="Snapshot Dish", unit_price=Decimal("10.00"))
+
+    def setUp(self):
+        self.client = TestClient()
+        self.client.force_login(self.user)
+        self.invoice = Invoice.objects.create(client=self.db_client, discount_type=DiscountType.PERCENTAGE,
+                                              discount_value=Decimal("10.00"))
+        InvoiceItem.objects.create(invoice=self.invoice, menu_item=self.menu_item, quantity=3, unit_price=Decimal("10.00"))
+        self.invoice.finalize()
+
+    def test_finalize_writes_snapshot_and_revert_clears_it(self):
+        """Test that finalize() freezes client, items, totals and settings, and revert_to_draft() drops them."""
+        self.invoice.refresh_from_db()
+        snapshot = self.invoice.render_snapshot
+        self.assertEqual(snapshot['client']['name'], "Snapshot Client")
+        self.assertEqual(snapshot['items'][0]['menu_item'], "Snapshot Dish")
+        self.assertEqual(snapshot['totals']['grand_total'], str(self.invoice.grand_total))
+        self.assertEqual(snapshot['settings']['company_name'], "Original Company")
+
+        quotation = Quotation.objects.create(client=self.db_client)
+        quotation.finalize()
+        self.assertIsNotNone(quotation.render_snapshot)
+        quotation.revert_to_draft()
+        quotation.refresh_from_db()
+        self.assertIsNone(quotation.render_snapshot)
+
+    def test_detail_page_loads_the_document_once(self):
+        """Test that the invoice row is read once for its detail page, and a finalized one reads no item rows."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        draft = Invoice.objects.create(client=self.db_client)
+        InvoiceItem.objects.create(invoice=draft, menu_item=self.menu_item, quantity=1, unit_price=Decimal("7.00"))
+        for invoice, dish_rows in ((self.invoice, 0), (draft, 1)):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(reverse('documents:invoice_detail', args=[invoice.pk]))
+            self.assertContains(response, "Snapshot Dish")
+            self.assertContains(response, "Snapshot Client")
+            # The conditional GET version query (documents.caching) reads the row too
+            sql = [q['sql'] for q in captured if 'v_items' not in q['sql']]
+            self.assertEqual(len([q for q in sql if q.startswith('SELECT "documents_invoice"."id"')]), 1, sql)
+            self.assertEqual(len([q for q in sql if 'FROM "documents_invoiceitem"' in q]), dish_rows, sql)
+
+    def test_reprint_ignores_later_setting_changes(self):
+        """Test that a finalized invoice keeps the tax rate and company details it was sent with."""
+        from unittest import mock
+        settings = Setting.get_solo()
+        settings.tax_rate = Decimal("10.00")
+        settings.company_name = "Renamed Company"
+        settings.save()
+
+        response = self.client.get(reverse('documents:invoice_detail', args=[self.invoice.pk]))
+        self.assertContains(response, "6.00")
+        self.assertContains(response, "28.62") # 27.00 + 6% tax
+
+        fake_weasyprint = mock.Mock()
+        fake_weasyprint.HTML.return_value.write_pdf.return_value = b'%PDF-1.4'
+        with mock.patch('documents.views.weasyprint', fake_weasyprint):
+            self.client.get(reverse('documents:invoice_pdf', args=[self.invoice.pk]))
+        html = fake_weasyprint.HTML.call_args.kwargs['string']
+        self.assertIn("Original Company", html)
+        self.assertNotIn("Renamed Company", html)
+
+    def test_item_change_clears_snapshot(self):
+        """Test that editing the items of a finalized invoice falls back to live rendering."""
+        InvoiceItem.objects.create(invoice=self.invoice, menu_item=self.menu_item, quantity=1, unit_price=Decimal("5.00"))
+        self.invoice.refresh_from_db()
+        self.assertIsNone(self.invoice.render_snapshot)
+        response = self.client.get(reverse('documents:invoice_detail', args=[self.invoice.pk]))
+        self.assertContains(response, "5.00")
+        self.assertIsNone(self.invoice.frozen_grand_total_cents)
+
+    def test_status_and_balances_use_frozen_total_after_tax_change(self):
+        """Test that payments, list balances and the SQL status agree with the grand total the invoice was sent with."""
+        from documents.reports import annotate_totals, settle_invoices
+        self.assertEqual(self.invoice.frozen_grand_total_cents, 2862)
+        Payment.objects.create(invoice=self.invoice, amount=Decimal("20.00"), payment_date=date.today())
+        settings = Setting.get_solo()
+        settings.tax_rate = Decimal("8.00")
+        settings.save()
+
+        Payment.objects.create(invoice=self.invoice, amount=Decimal("8.62"), payment_date=date.today())
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.PAID)
+        self.assertEqual(self.invoice.balance_due, Decimal("0.00"))
+        row = annotate_totals(Invoice.objects.for_list(), Setting.get_solo()).get(pk=self.invoice.pk)
+        self.assertEqual(row.db_grand_total, Decimal("28.62"))
+        self.assertEqual(row.db_balance, Decimal("0.00"))
+
+        Invoice.objects.filter(pk=self.invoice.pk).update(status=Invoice.Status.SENT)
+        settle_invoices([self.invoice.pk])
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.PAID)
+
+    def test_discount_change_clears_snapshot(self):
+        """Test that saving a finalized invoice with a new discount drops the frozen totals rather than mixing them."""
+        self.invoice.refresh_from_db()
+        self.invoice.notes = "Called the client"
+        self.invoice.save()
+        self.assertIsNotNone(self.invoice.render_snapshot)
+
+        self.invoice.discount_value = Decimal("20.00")
+        self.invoice.save()
+        self.invoice.refresh_from_db()
+        self.assertIsNone(self.invoice.render_snapshot)
+        self.assertIsNone(self.invoice.frozen_grand_total_cents)
+        self.assertEqual(self.invoice.grand_total, Decimal("25.44")) # 24.00 + 6% tax
+        response = self.client.get(reverse('documents:invoice_detail', args=[self.invoice.pk]))
+        self.assertContains(response, "25.44")
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='etag', password='password123')
+        Setting.get_solo()
+        cls.db_client = Client.objects.create(name="ETag Client")
+        cls.menu_item = MenuItem.objects.create(name="ETag Dish", unit_price=Decimal("10.00"))
+
+    def setUp(self):
+        self.client = TestClient()
+        self.client.force_login(self.user)
+        self.invoice = Invoice.objects.create(client=self.db_client, status=Invoice.Status.SENT)
+        InvoiceItem.objects.create(invoice=self.invoice, menu_item=self.menu_item, quantity=2, unit_price=Decimal("10.00"))
+        self.url = reverse('documents:invoice_detail', args=[self.invoice.pk])
+
+    def test_repeat_request_returns_304_without_rendering(self):
+        """Test that a matching If-None-Match gets a 304 after a single query."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+
+        with self.assertNumQueries(3): # session, user, document version
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_to_items_payments_and_settings_change_the_etag(self):
+        """Test that items, payments and settings all feed into the ETag."""
+        etags = [self.client.get(self.url)['ETag']]
+        InvoiceItem.objects.create(invoice=self.invoice, menu_item=self.menu_item, quantity=1, unit_price=Decimal("5.00"))
+        etags.append(self.client.get(self.url)['ETag'])
+        Payment.objects.create(invoice=self.invoice, amount=Decimal("5.00"))
+        etags.append(self.client.get(self.url)['ETag'])
+        settings = Setting.get_solo()
+        settings.currency_symbol = "$"
+        settings.save()
+        etags.append(self.client.get(self.url)['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.status_code, 200)
+
+    def test_conversions_change_the_source_etag(self):
+        """Test that creating an order or an invoice from a document changes the source's ETag."""
+        quotation = Quotation.objects.create(client=self.db_client, status=Quotation.Status.ACCEPTED)
+        QuotationItem.objects.create(quotation=quotation, menu_item=self.menu_item, quantity=1, unit_price=Decimal("10.00"))
+        quotation_url = reverse('documents:quotation_detail', args=[quotation.pk])
+        etag = self.client.get(quotation_url)['ETag']
+        order = quotation.create_order()
+        response = self.client.get(quotation_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        Order.objects.get(pk=order.pk).save(update_fields=['status']) # Linked order changed
+        self.assertNotEqual(self.client.get(quotation_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        order_url = reverse('documents:order_detail', args=[order.pk])
+        etag = self.client.get(order_url)['ETag']
+        order.create_invoice()
+        self.assertEqual(self.client.get(order_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_delivery_order_edits_change_its_etag(self):
+        """Test that editing a delivery order, its items or its parent order changes the delivery order's ETag."""
+        from django.utils.http import http_date
+        order = Order.objects.create(client=self.db_client, status=Order.OrderStatus.CONFIRMED)
+        order_item = OrderItem.objects.create(order=order, menu_item=self.menu_item, quantity=3, unit_price=Decimal("10.00"))
+        delivery_order = DeliveryOrder.objects.create(order=order, delivery_date=date.today())
+        item = DeliveryOrderItem.objects.create(delivery_order=delivery_order, order_item=order_item,
+                                                quantity_delivered=Decimal("1.00"))
+        url = reverse('documents:delivery_order_detail', args=[delivery_order.pk])
+
+        def edit(change):
+            etag = self.client.get(url)['ETag']
+            change()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            return response
+
+        delivery_order.recipient_name = "Front Desk"
+        edit(delivery_order.save)
+        item.notes = "Leave at the door"
+        response = edit(item.save)
+        self.assertContains(response, "Leave at the door")
+        later = timezone.now() + timedelta(hours=1)
+        response = edit(lambda: Order.objects.filter(pk=order.pk).update(delivery_address="Hall B", updated_at=later))
+        self.assertContains(response, "Hall B")
+        self.assertEqual(response['Last-Modified'], http_date(later.timestamp()))
+
+    def test_pdf_304_skips_weasyprint(self):
+        """Test that a revalidated PDF download does not render the PDF again."""
+        from unittest import mock
+        fake_weasyprint = mock.Mock()
+        fake_weasyprint.HTML.return_value.write_pdf.return_value = b'%PDF-1.4'
+        url = reverse('documents:invoice_pdf', args=[self.invoice.pk])
+        with mock.patch('documents.views.weasyprint', fake_weasyprint):
+            etag = self.client.get(url)['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(fake_weasyprint.HTML.call_count, 1)
+
+
+class ListRowCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='rows', password='password123')
+        Setting.get_solo()
+        cls.db_client = Client.objects.create(name="Row Client")
+        cls.menu_item = MenuItem.objects.create(name="Row Dish", unit_price=Decimal("10.00"))
+
+    def setUp(self):
+        from django.core.cache import caches
+        caches['document_rows'].clear()
+        self.client = TestClient()
+        self.client.force_login(self.user)
+        self.invoices = []
+        for _ in range(3):
+            invoice = Invoice.objects.create(client=self.db_client, status=Invoice.Status.SENT)
+            InvoiceItem.objects.create(invoice=invoice, menu_item=self.menu_item, quantity=2, unit_price=Decimal("10.00"))
+            self.invoices.append(invoice)
+        self.url = reverse('documents:invoice_list')
+
+    def test_cached_rows_skip_totals_queries(self):
+        """Test that a repeat list render computes no totals or balances."""
+        first = self.client.get(self.url)
+        with self.assertNumQueries(4): # session, user, settings, invoices
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+
+    def test_payment_and_item_changes_rerender_only_that_row(self):
+        """Test that payments and items bump the invoice's row and leave the others cached."""
+        self.client.get(self.url)
+        invoice = self.invoices[0]
+        Payment.objects.create(invoice=invoice, amount=Decimal("5.00"))
+        with self.assertNumQueries(4): # Totals, payments and credits come with the invoices
+            response = self.client.get(self.url)
+        self.assertContains(response, "15.00")
+        InvoiceItem.objects.create(invoice=invoice, menu_item=self.menu_item, quantity=1, unit_price=Decimal("7.00"))
+        self.assertContains(self.client.get(self.url), "27.00")
+
+    def test_status_change_and_settings_change_rerender_rows(self):
+        """Test that update_fields saves bump updated_at and settings changes reach every row."""
+        invoice = self.invoices[0]
+        before = invoice.updated_at
+        invoice.status = Invoice.Status.CANCELLED
+        invoice.save(update_fields=['status'])
+        invoice.refresh_from_db()
+        self.assertGreater(invoice.updated_at, before)
+
+        self.client.get(self.url)
+        settings = Setting.get_solo()
+        settings.tax_enabled = True
+        settings.tax_rate = Decimal("10.00")
+        settings.save()
+        self.assertContains(self.client.get(self.url), "22.00", count=6) # Total and balance of each row
+
+    def test_other_lists_cache_rows(self):
+        """Test that the quotation, order, client and delivery order lists render with the row cache."""
+        order = Order.objects.create(client=self.db_client)
+        OrderItem.objects.create(order=order, menu_item=self.menu_item, quantity=1, unit_price=Decimal("10.00"))
+        DeliveryOrder.objects.create(order=order, delivery_date=date.today())
+        Quotation.objects.create(client=self.db_client)
+        for name in ('quotation_list', 'order_list', 'client_list', 'delivery_order_list'):
+            url = reverse(f'documents:{name}')
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(self.client.get(url).content, first.content)
+        order.title = "Renamed Order"
+        order.save()
+        self.assertContains(self.client.get(reverse('documents:order_list')), "Renamed Order")
+
+
+class TemplatePreloadTests(TestCase):
+    def test_preload_compiles_document_and_pdf_templates(self):
+        """Test that preloading fills the cached loader with every documents/ and documents/pdf/ template."""
+        from .management.commands.benchmark_templates import build_engine
+        from .templates_preload import document_template_names, preload_templates
+        names = document_template_names()
+        self.assertIn('documents/invoice_list.html', names)
+        self.assertIn('documents/pdf/invoice_pdf.html', names)
+
+        engine = build_engine(cached=True)
+        timings = preload_templates(engine=engine)
+        self.assertEqual(list(timings), names)
+        cache = engine.template_loaders[0].get_template_cache
+        self.assertTrue(set(names) <= set(cache))
+
+    def test_cached_engine_renders_like_the_project_engine(self):
+        """Test that the benchmark's cached engine produces the same HTML as the configured one."""
+        from django.template import Context, engines
+        from .management.commands.benchmark_templates import build_engine
+        context = {'settings': Setting.get_solo(), 'profiles': []}
+        expected = engines['django'].engine.get_template('documents/profile_list.html').render(Context(context))
+        rendered = build_engine(cached=True).get_template('documents/profile_list.html').render(Context(context))
+        self.assertEqual(rendered, expected)
+
+
+class ListProjectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='slim', email='slim@example.com', password='password123')
+        Setting.get_solo()
+        cls.db_client = Client.objects.create(name="Slim Client", address="1 Long Road\n" * 20)
+        menu_item = MenuItem.objects.create(name="Slim Dish", unit_price=Decimal("10.00"), description="x" * 500)
+        for _ in range(3):
+            quotation = Quotation.objects.create(client=cls.db_client, terms_and_conditions="T" * 1000)
+            QuotationItem.objects.create(quotation=quotation, menu_item=menu_item, quantity=1, unit_price=Decimal("10.00"))
+            order = Order.objects.create(client=cls.db_client, notes="N" * 1000)
+            OrderItem.objects.create(order=order, menu_item=menu_item, quantity=2, unit_price=Decimal("10.00"))
+            invoice = Invoice.objects.create(client=cls.db_client, status=Invoice.Status.SENT, payment_details="P" * 1000)
+            InvoiceItem.objects.create(invoice=invoice, menu_item=menu_item, quantity=3, unit_price=Decimal("10.00"))
+            Payment.objects.create(invoice=invoice, amount=Decimal("5.00"), notes="paid")
+            DeliveryOrder.objects.create(order=order, delivery_date=date.today(), notes="D" * 1000)
+            CreditNote.objects.create(client=cls.db_client, related_invoice=invoice, reason="R" * 1000)
+
+    def setUp(self):
+        from django.core.cache import caches
+        caches['document_rows'].clear()
+        self.client = TestClient()
+        self.client.force_login(self.user)
+
+    def test_lists_and_changelists_never_load_deferred_fields(self):
+        """Test that every list page, client sublist and changelist renders from its projection alone."""
+        from .projections import forbid_deferred_loads
+        urls = [reverse(f'documents:{name}') for name in (
+            'quotation_list', 'invoice_list', 'order_list', 'client_list', 'delivery_order_list')]
+        urls.append(reverse('documents:client_detail', args=[self.db_client.pk]))
+        urls += [reverse(f'admin:documents_{model}_changelist') for model in (
+            'client', 'menuitem', 'quotation', 'invoice', 'payment', 'order', 'deliveryorder', 'creditnote')]
+        with forbid_deferred_loads():
+            for url in urls:
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_list_queries_skip_large_text_fields(self):
+        """Test that the list queries select none of the large text columns."""
+        from django.test.utils import CaptureQueriesContext
+        for url, columns in (
+            (reverse('documents:invoice_list'), ('terms_and_conditions', 'payment_details', '"notes"', 'address')),
+            (reverse('documents:delivery_order_list'), ('delivery_address', '"notes"')),
+            (reverse('admin:documents_quotation_changelist'), ('terms_and_conditions', 'address')),
+        ):
+            with self.subTest(url=url), CaptureQueriesContext(connections['default']) as captured:
+                self.client.get(url)
+                listing = [q['sql'] for q in captured if 'FROM "documents_' in q['sql'] and 'INNER JOIN' in q['sql']]
+                self.assertTrue(listing)
+                for sql in listing:
+                    for column in columns:
+                        self.assertNotIn(column, sql.split(' FROM ')[0])
+
+    def _query_counts(self, urls):
+        from django.core.cache import caches
+        from django.test.utils import CaptureQueriesContext
+        counts = []
+        for url in urls:
+            caches['document_rows'].clear() # Every row cold
+            with CaptureQueriesContext(connections['default']) as captured:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            counts.append(len(captured))
+        return counts
+
+    def _add_rows(self):
+        menu_item = MenuItem.objects.first()
+        for _ in range(3):
+            quotation = Quotation.objects.create(client=self.db_client)
+            QuotationItem.objects.create(quotation=quotation, menu_item=menu_item, quantity=1, unit_price=Decimal("10.00"))
+            order = Order.objects.create(client=self.db_client)
+            OrderItem.objects.create(order=order, menu_item=menu_item, quantity=2, unit_price=Decimal("10.00"))
+
+    def test_list_pages_total_rows_in_the_list_query(self):
+        """Test that the quotation and order lists do not query per row when their rows are not cached."""
+        urls = [reverse('documents:quotation_list'), reverse('documents:order_list')]
+        before = self._query_counts(urls)
+        self._add_rows()
+        self.assertEqual(self._query_counts(urls), before)
+
+    def test_changelists_total_rows_in_the_list_query(self):
+        """Test that the quotation and order changelists do not query per row for their totals."""
+        urls = [reverse(f'admin:documents_{model}_changelist') for model in ('quotation', 'order')]
+        before = self._query_counts(urls)
+        self._add_rows()
+        self.assertEqual(self._query_counts(urls), before)
+
+    def test_guard_raises_on_deferred_read(self):
+        """Test that reading a field outside the projection fails under the guard."""
+        from .projections import DeferredFieldLoad, forbid_deferred_loads
+        invoice = Invoice.objects.for_list().first()
+        with forbid_deferred_loads(), self.assertRaises(DeferredFieldLoad):
+            invoice.payment_details
+        self.assertEqual(invoice.payment_details, "P" * 1000)
+
+
+class FulfillmentLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='ledger', email='ledger@example.com', password='password123')
+        Setting.get_solo()
+        db_client = Client.objects.create(name="Ledger Client")
+        menu_item = MenuItem.objects.create(name="Ledger Dish", unit_price=Decimal("10.00"))
+        cls.order = Order.objects.create(client=db_client, status=Order.OrderStatus.CONFIRMED)
+        cls.rice = OrderItem.objects.create(order=cls.order, menu_item=menu_item, quantity=Decimal("10.00"), unit_price=Decimal("10.00"))
+        cls.soup = OrderItem.objects.create(order=cls.order, menu_item=menu_item, quantity=Decimal("4.00"), unit_price=Decimal("5.00"))
+        cls.other_order = Order.objects.create(client=db_client)
+        cls.other_item = OrderItem.objects.create(order=cls.other_order, menu_item=menu_item, quantity=Decimal("2.00"), unit_price=Decimal("1.00"))
+
+        cls.first_do = DeliveryOrder.objects.create(order=cls.order, delivery_date=date.today())
+        DeliveryOrderItem.objects.create(delivery_order=cls.first_do, order_item=cls.rice, quantity_delivered=Decimal("6.00"))
+        cancelled = DeliveryOrder.objects.create(order=cls.order, delivery_date=date.today(), status=DeliveryOrderStatus.CANCELLED)
+        DeliveryOrderItem.objects.create(delivery_order=cancelled, order_item=cls.rice, quantity_delivered=Decimal("3.00"))
+        cls.second_do = DeliveryOrder.objects.create(order=cls.order, delivery_date=date.today())
+        DeliveryOrderItem.objects.create(delivery_order=cls.second_do, order_item=cls.soup, quantity_delivered=Decimal("4.00"))
+
+    def test_ledger_for_many_orders_in_one_query(self):
+        """Test delivered/remaining for every line of several orders, ignoring cancelled delivery orders."""
+        from .fulfillment import fulfillment_ledger
+        with self.assertNumQueries(1):
+            ledger = fulfillment_ledger([self.order.pk, self.other_order.pk])
+        self.assertEqual(set(ledger), {self.rice.pk, self.soup.pk, self.other_item.pk})
+        self.assertEqual(ledger[self.rice.pk].delivered, Decimal("6.00"))
+        self.assertEqual(ledger[self.rice.pk].remaining, Decimal("4.00"))
+        self.assertTrue(ledger[self.soup.pk].is_complete)
+        self.assertEqual(ledger[self.other_item.pk].delivered, Decimal("0.00"))
+
+        DeliveryOrderItem.objects.create(delivery_order=self.second_do, order_item=self.soup, quantity_delivered=Decimal("1.00"))
+        ledger = fulfillment_ledger([self.order.pk], exclude_delivery_order=self.first_do.pk)
+        self.assertEqual(ledger[self.soup.pk].over_delivered, Decimal("1.00"))
+        self.assertEqual(ledger[self.rice.pk].delivered, Decimal("0.00"))
+
+    def _formset(self, delivery_order, lines):
+        """The delivery order admin's item formset, bound to lines of (order item, quantity)."""
+        from django.contrib import admin
+        from django.test import RequestFactory
+        from .admin import DeliveryOrderItemInline
+        request = RequestFactory().post('/')
+        request.user = self.user
+        formset_class = DeliveryOrderItemInline(DeliveryOrder, admin.site).get_formset(request, delivery_order)
+        existing = list(delivery_order.items.all())
+        data = {
+            'items-TOTAL_FORMS': str(len(lines)), 'items-INITIAL_FORMS': str(len(existing)),
+            'items-MIN_NUM_FORMS': '0', 'items-MAX_NUM_FORMS': '1000',
+        }
+        for index, (order_item, quantity) in enumerate(lines):
+            data[f'items-{index}-order_item'] = str(order_item.pk)
+            data[f'items-{index}-quantity_delivered'] = str(quantity)
+            if index < len(existing):
+                data[f'items-{index}-id'] = str(existing[index].pk)
+                data[f'items-{index}-delivery_order'] = str(delivery_order.pk)
+        return formset_class(data, instance=delivery_order, prefix='items',
+                             form_kwargs={'parent_order': delivery_order.order})
+
+    def test_formset_counts_other_deliveries_and_its_own_lines_together(self):
+        """Test that the formset rejects lines that together exceed what is left to deliver."""
+        new_do = DeliveryOrder.objects.create(order=self.order, delivery_date=date.today())
+        self.assertTrue(self._formset(new_do, [(self.rice, "4.00")]).is_valid())
+
+        formset = self._formset(new_do, [(self.rice, "3.00"), (self.rice, "2.00")])
+        self.assertFalse(formset.is_valid())
+        self.assertIn("Only 4.00 of 10.00 left to deliver", formset.forms[1].errors['quantity_delivered'][0])
+
+        # Editing a delivery order does not count its own saved lines twice
+        self.assertTrue(self._formset(self.first_do, [(self.rice, "10.00")]).is_valid())
+        self.assertFalse(self._formset(self.first_do, [(self.rice, "10.01")]).is_valid())
+
+    def test_order_detail_shows_remaining_quantities(self):
+        """Test the delivered and remaining columns on the order detail page."""
+        client = TestClient()
+        client.force_login(self.user)
+        response = client.get(reverse('documents:order_detail', args=[self.order.pk]))
+        self.assertContains(response, '<th class="text-end">Remaining</th>', html=True)
+        rice = response.context['items'][0]
+        self.assertEqual((rice.fulfillment.delivered, rice.fulfillment.remaining), (Decimal("6.00"), Decimal("4.00")))
+
+    def test_admin_inline_shows_remaining_without_per_line_queries(self):
+        """Test that the DO change page's query count does not grow with its lines."""
+        from django.test.utils import CaptureQueriesContext
+        client = TestClient()
+        client.force_login(self.user)
+        url = reverse('admin:documents_deliveryorder_change', args=[self.first_do.pk])
+        with CaptureQueriesContext(connections['default']) as before:
+            response = client.get(url)
+        self.assertContains(response, "4.00 of 10.00")
+        for _ in range(5):
+            DeliveryOrderItem.objects.create(delivery_order=self.first_do, order_item=self.other_item, quantity_delivered=Decimal("0.10"))
+        with CaptureQueriesContext(connections['default']) as after:
+            client.get(url)
+        self.assertLessEqual(len(after), len(before))
+
+
+class DeliveryBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(username='batch', email='batch@example.com', password='password123')
+        db_client = Client.objects.create(name="Batch Client")
+        menu_item = MenuItem.objects.create(name="Batch Dish", unit_price=Decimal("10.00"))
+        cls.event_date = date.today() + timedelta(days=3)
+        cls.orders = []
+        for _ in range(4):
+            order = Order.objects.create(client=db_client, event_date=cls.event_date)
+            OrderItem.objects.create(order=order, menu_item=menu_item, quantity=Decimal("10.00"), unit_price=Decimal("10.00"))
+            OrderItem.objects.create(order=order, menu_item=menu_item, quantity=Decimal("2.00"), unit_price=Decimal("5.00"))
+            cls.orders.append(order)
+        # Partly delivered already
+        partial = DeliveryOrder.objects.create(order=cls.orders[0], delivery_date=date.today())
+        DeliveryOrderItem.objects.create(delivery_order=partial, order_item=cls.orders[0].items.first(), quantity_delivered=Decimal("4.00"))
+        cls.cancelled = Order.objects.create(client=db_client, event_date=cls.event_date, status=Order.OrderStatus.CANCELLED)
+        OrderItem.objects.create(order=cls.cancelled, menu_item=menu_item, quantity=Decimal("1.00"), unit_price=Decimal("1.00"))
+
+    def test_batch_creates_numbered_delivery_orders_in_fixed_queries(self):
+        """Test that all remaining quantities get delivery orders, numbered, in a fixed number of queries."""
+        from .fulfillment import create_delivery_orders, fulfillment_ledger
+        order_ids = [order.pk for order in self.orders] + [self.cancelled.pk]
+        # Five queries plus the savepoint pair of the atomic block inside the test transaction
+        with self.assertNumQueries(7):
+            created, skipped = create_delivery_orders(order_ids)
+        self.assertEqual(len(created), 4)
+        self.assertEqual(skipped, [self.cancelled.pk])
+        for delivery_order in created:
+            delivery_order.refresh_from_db()
+            self.assertEqual(delivery_order.do_number, f"DO-{delivery_order.created_at.year}-{delivery_order.pk}")
+            self.assertEqual(delivery_order.delivery_date, self.event_date)
+        first = DeliveryOrder.objects.get(pk=created[0].pk)
+        self.assertEqual([item.quantity_delivered for item in first.items.all()], [Decimal("6.00"), Decimal("2.00")])
+        ledger = fulfillment_ledger(order_ids)
+        self.assertTrue(all(line.is_complete for pk, line in ledger.items() if line.order_id != self.cancelled.pk))
+
+        # Nothing is left, so a second run creates nothing
+        created, skipped = create_delivery_orders(order_ids)
+        self.assertEqual((created, len(skipped)), ([], 5))
+
+    def test_admin_action_and_command(self):
+        """Test the OrderAdmin action and the create_delivery_orders command."""
+        from io import StringIO
+        from django.core.management import call_command
+        client = TestClient()
+        client.force_login(self.user)
+        response = client.post(reverse('admin:documents_order_changelist'), {
+            'action': 'create_delivery_orders_for_selected',
+            '_selected_action': [self.orders[0].pk, self.cancelled.pk],
+        }, follow=True)
+        self.assertContains(response, "Created 1 delivery order(s)")
+        self.assertContains(response, "Skipped 1 order(s)")
+
+        out = StringIO()
+        call_command('create_delivery_orders', '--date', self.event_date.isoformat(), stdout=out)
+        self.assertIn("Created 3 delivery order(s)", out.getvalue())
+        self.assertEqual(DeliveryOrder.objects.filter(order__in=self.orders).count(), 5)
+
+
+class PrepListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='kitchen', email='kitchen@example.com', password='password123')
+        Setting.get_solo()
+        db_client = Client.objects.create(name="Prep Client")
+        cls.rice = MenuItem.objects.create(name="Nasi Lemak", unit_price=Decimal("8.00"), unit=MenuItem.UnitType.PACK)
+        cls.tea = MenuItem.objects.create(name="Teh Tarik", unit_price=Decimal("3.00"), unit=MenuItem.UnitType.PERSON)
+        cls.day = date(2026, 11, 2)
+
+        def order(event_date, status=Order.OrderStatus.CONFIRMED, lines=()):
+            created = Order.objects.create(client=db_client, event_date=event_date, status=status)
+            for menu_item, quantity, label in lines:
+                OrderItem.objects.create(order=created, menu_item=menu_item, quantity=Decimal(quantity),
+                                         unit_price=menu_item.unit_price, grouping_label=label)
+            return created
+
+        cls.first = order(cls.day, lines=[(cls.rice, "50", "Lunch"), (cls.tea, "50", "Lunch"), (cls.tea, "20", "Tea")])
+        order(cls.day, status=Order.OrderStatus.IN_PROGRESS, lines=[(cls.rice, "30", "Lunch")])
+        order(cls.day + timedelta(days=1), lines=[(cls.rice, "10", "")])
+        order(cls.day, status=Order.OrderStatus.PENDING, lines=[(cls.rice, "999", "Lunch")])
+        order(cls.day + timedelta(days=30), lines=[(cls.rice, "999", "Lunch")])
+
+    def setUp(self):
+        from django.core.cache import caches
+        caches['prep_lists'].clear()
+
+    def test_quantities_grouped_by_date_and_label(self):
+        """Test that confirmed and in-progress orders in range are summed per date, label and menu item."""
+        from .production import prep_list
+        with self.assertNumQueries(1):
+            prep = prep_list(self.day, self.day + timedelta(days=6))
+        first_day, second_day = prep['days']
+        self.assertEqual([group['label'] for group in first_day['groups']], ['Lunch', 'Tea'])
+        lunch = {line['name']: (line['quantity'], line['orders']) for line in first_day['groups'][0]['lines']}
+        self.assertEqual(lunch, {"Nasi Lemak": (Decimal("80.00"), 2), "Teh Tarik": (Decimal("50.00"), 1)})
+        self.assertEqual(second_day['groups'][0]['lines'][0]['quantity'], Decimal("10.00"))
+        self.assertEqual(second_day['groups'][0]['lines'][0]['unit_label'], "Per Pack")
+        totals = {line['name']: line['quantity'] for line in prep['totals']}
+        self.assertEqual(totals, {"Nasi Lemak": Decimal("90.00"), "Teh Tarik": Decimal("70.00")})
+
+    def test_cached_until_an_order_changes(self):
+        """Test that a repeated prep list costs no queries and an item change invalidates it."""
+        from .production import prep_list
+        prep_list(self.day, self.day)
+        with self.assertNumQueries(0):
+            prep_list(self.day, self.day)
+
+        item = self.first.items.get(menu_item=self.rice)
+        item.quantity = Decimal("60.00")
+        item.save()
+        lunch = prep_list(self.day, self.day)['days'][0]['groups'][0]['lines']
+        self.assertEqual(lunch[0]['quantity'], Decimal("90.00"))
+
+        self.first.status = Order.OrderStatus.CANCELLED
+        self.first.save()
+        lunch = prep_list(self.day, self.day)['days'][0]['groups'][0]['lines']
+        self.assertEqual([(line['name'], line['quantity']) for line in lunch], [("Nasi Lemak", Decimal("30.00"))])
+
+    def test_page_and_csv(self):
+        """Test the prep list page, its CSV export and date validation."""
+        client = TestClient()
+        client.force_login(self.user)
+        params = {'start': self.day.isoformat(), 'end': self.day.isoformat()}
+        response = client.get(reverse('documents:prep_list'), {**params, 'refresh': '30'})
+        self.assertContains(response, "Nasi Lemak")
+        self.assertContains(response, '<meta http-equiv="refresh" content="30">')
+
+        response = client.get(reverse('documents:prep_list_csv'), params)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], "Event date,Group,Menu item,Unit,Quantity,Orders")
+        self.assertIn("2026-11-02,Lunch,Nasi Lemak,Per Pack,80.00,2", lines)
+        self.assertEqual(len(lines), 4)
+
+        response = client.get(reverse('documents:prep_list_csv'), {'start': '2026-11-05', 'end': '2026-11-01'})
+        self.assertEqual(response.status_code, 400)
+        response = client.get(reverse('documents:prep_list'), {'start': '2026-01-01', 'end': '2026-12-31'})
+        self.assertContains(response, "Choose a range of at most 62 days.")
+
+
+class PurchasingListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='password123')
+        Setting.get_solo()
+        db_client = Client.objects.create(name="Purchasing Client")
+        cls.rice = Ingredient.objects.create(name="Rice", unit="kg")
+        cls.eggs = Ingredient.objects.create(name="Eggs", unit="pcs")
+        cls.nasi_lemak = MenuItem.objects.create(name="Nasi Lemak", unit_price=Decimal("8.00"), unit=MenuItem.UnitType.PACK)
+        cls.fried_rice = MenuItem.objects.create(name="Fried Rice", unit_price=Decimal("7.00"), unit=MenuItem.UnitType.PACK)
+        cls.tea = MenuItem.objects.create(name="Teh Tarik", unit_price=Decimal("3.00"))
+        RecipeLine.objects.create(menu_item=cls.nasi_lemak, ingredient=cls.rice, quantity=Decimal("0.1500"))
+        RecipeLine.objects.create(menu_item=cls.nasi_lemak, ingredient=cls.eggs, quantity=Decimal("1"))
+        RecipeLine.objects.create(menu_item=cls.fried_rice, ingredient=cls.rice, quantity=Decimal("0.2000"))
+        RecipeLine.objects.create(menu_item=cls.fried_rice, ingredient=cls.eggs, quantity=Decimal("0.5000"))
+        cls.day = date(2026, 11, 2)
+
+        def order(event_date, lines, status=Order.OrderStatus.CONFIRMED):
+            created = Order.objects.create(client=db_client, event_date=event_date, status=status)
+            for menu_item, quantity in lines:
+                OrderItem.objects.create(order=created, menu_item=menu_item, quantity=Decimal(quantity),
+                                         unit_price=menu_item.unit_price)
+            return created
+
+        order(cls.day, [(cls.nasi_lemak, "100"), (cls.fried_rice, "40"), (cls.tea, "100")])
+        order(cls.day, [(cls.nasi_lemak, "20")], status=Order.OrderStatus.IN_PROGRESS)
+        order(cls.day + timedelta(days=1), [(cls.fried_rice, "10")])
+        order(cls.day, [(cls.nasi_lemak, "1000")], status=Order.OrderStatus.PENDING)
+        order(cls.day + timedelta(days=40), [(cls.nasi_lemak, "1000")])
+
+    def setUp(self):
+        from django.core.cache import caches
+        caches['prep_lists'].clear()
+
+    def test_orders_exploded_into_ingredients_per_day(self):
+        """Test that order quantities times recipe quantities are summed per day and ingredient."""
+        from .production import purchasing_list
+        with self.assertNumQueries(2):
+            purchasing = purchasing_list(self.day, self.day + timedelta(days=6))
+        first_day, second_day = purchasing['days']
+        self.assertEqual({line['name']: line['quantity'] for line in first_day['lines']},
+                         {"Rice": Decimal("26.000"), "Eggs": Decimal("140.000")})
+        self.assertEqual({line['name']: line['quantity'] for line in second_day['lines']},
+                         {"Rice": Decimal("2.000"), "Eggs": Decimal("5.000")})
+        self.assertEqual({line['name']: (line['quantity'], line['unit']) for line in purchasing['totals']},
+                         {"Rice": (Decimal("28.000"), "kg"), "Eggs": (Decimal("145.000"), "pcs")})
+        self.assertEqual(purchasing['missing_recipes'], ["Teh Tarik"])
+
+    def test_recipe_change_invalidates(self):
+        """Test that editing a recipe line shows on the next request."""
+        from .production import purchasing_list
+        purchasing_list(self.day, self.day)
+        with self.assertNumQueries(0):
+            purchasing_list(self.day, self.day)
+        line = RecipeLine.objects.get(menu_item=self.nasi_lemak, ingredient=self.rice)
+        line.quantity = Decimal("0.2000")
+        line.save()
+        rice = [line for line in purchasing_list(self.day, self.day)['totals'] if line['name'] == "Rice"][0]
+        self.assertEqual(rice['quantity'], Decimal("32.000"))
+
+    def test_page_and_csv(self):
+        """Test the purchasing list page and its CSV export."""
+        client = TestClient()
+        client.force_login(self.user)
+        params = {'start': self.day.isoformat(), 'end': (self.day + timedelta(days=1)).isoformat()}
+        response = client.get(reverse('documents:purchasing_list'), params)
+        self.assertContains(response, "No recipe for: Teh Tarik")
+        self.assertContains(response, "28.000")
+
+        response = client.get(reverse('documents:purchasing_list_csv'), params)
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], "Event date,Ingredient,Unit,Quantity")
+        self.assertIn("2026-11-02,Rice,kg,26.000", lines)
+        self.assertEqual(len(lines), 5)
+
+
+class CalendarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='planner', email='planner@example.com', password='password123')
+        Setting.get_solo()
+        db_client = Client.objects.create(name="Calendar Client")
+        buffet = MenuItem.objects.create(name="Buffet", unit_price=Decimal("20.00"), unit=MenuItem.UnitType.PERSON)
+        tray = MenuItem.objects.create(name="Kuih Tray", unit_price=Decimal("50.00"), unit=MenuItem.UnitType.TRAY)
+        cls.day = date(2026, 11, 11) # A Wednesday
+
+        def order(event_date, people, trays=0, status=Order.OrderStatus.CONFIRMED):
+            created = Order.objects.create(client=db_client, event_date=event_date, status=status, title="Event")
+            OrderItem.objects.create(order=created, menu_item=buffet, quantity=Decimal(people), unit_price=buffet.unit_price)
+            if trays:
+                OrderItem.objects.create(order=created, menu_item=tray, quantity=Decimal(trays), unit_price=tray.unit_price)
+            return created
+
+        cls.big = order(cls.day, 100, trays=2) # 2,100.00
+        order(cls.day, 50) # 1,000.00
+        order(cls.day, 500, status=Order.OrderStatus.CANCELLED)
+        order(cls.day + timedelta(days=1), 10) # 200.00
+        order(date(2026, 12, 25), 80)
+        DeliveryOrder.objects.create(order=cls.big, delivery_date=cls.day)
+
+    def test_window_summaries_are_summed_in_sql(self):
+        """Test per-day revenue and headcount, leaving out cancelled orders, in a fixed number of queries."""
+        from .schedule import calendar_window, week_window
+        settings = Setting.get_solo()
+        start, end = week_window(self.day)
+        self.assertEqual((start, end), (date(2026, 11, 9), date(2026, 11, 15)))
+        with self.assertNumQueries(3):
+            days = calendar_window(start, end, settings)
+        self.assertEqual(len(days), 7)
+        wednesday = days[2]
+        self.assertEqual(wednesday['summary'], {'orders': 2, 'revenue': Decimal("3100.00"), 'headcount': Decimal("150.00")})
+        self.assertEqual(len(wednesday['orders']), 3) # The cancelled order is still shown
+        self.assertEqual(len(wednesday['deliveries']), 1)
+        self.assertEqual(days[3]['summary']['revenue'], Decimal("200.00"))
+        self.assertIsNone(days[0]['summary'])
+
+    def test_month_page(self):
+        """Test the month and week calendar pages."""
+        client = TestClient()
+        client.force_login(self.user)
+        response = client.get(reverse('documents:calendar'), {'date': self.day.isoformat()})
+        self.assertContains(response, "November 2026")
+        self.assertEqual(response.context['period_orders'], 3)
+        self.assertEqual(response.context['period_revenue'], Decimal("3300.00"))
+        self.assertEqual(len(response.context['weeks']), 6) # 1 November 2026 is a Sunday
+        self.assertContains(response, self.big.order_number)
+
+        response = client.get(reverse('documents:calendar'), {'date': self.day.isoformat(), 'view': 'week'})
+        self.assertContains(response, "Week of 2026-11-09")
+        self.assertEqual(len(response.context['weeks']), 1)
+
+    def test_feed_pages_by_window(self):
+        """Test that the JSON feed serves one window and links to the neighbouring ones."""
+        client = TestClient()
+        client.force_login(self.user)
+        response = client.get(reverse('documents:calendar_feed'), {'start': '2026-11-11', 'end': '2026-11-12'})
+        data = response.json()
+        self.assertEqual([day['date'] for day in data['days']], ['2026-11-11', '2026-11-12'])
+        self.assertEqual(data['days'][0]['summary']['revenue'], '3100.00')
+        self.assertEqual(data['days'][0]['orders'][0]['number'], self.big.order_number)
+        self.assertEqual(data['next'], reverse('documents:calendar_feed') + "?start=2026-11-13&end=2026-11-14")
+        self.assertEqual(data['previous'], reverse('documents:calendar_feed') + "?start=2026-11-09&end=2026-11-10")
+
+        response = client.get(reverse('documents:calendar_feed'), {'start': '2026-01-01', 'end': '2026-12-31'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CreditNoteTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='credits', email='credits@example.com', password='password123')
+        settings = Setting.get_solo()
+        settings.tax_enabled = True
+        settings.tax_rate = Decimal("6.00")
+        settings.save()
+        cls.db_client = Client.objects.create(name="Credit Client")
+        cls.menu_item = MenuItem.objects.create(name="Credit Dish", unit_price=Decimal("10.00"))
+
+    def setUp(self):
+        self.invoice = Invoice.objects.create(client=self.db_client, status=Invoice.Status.SENT)
+        InvoiceItem.objects.create(invoice=self.invoice, menu_item=self.menu_item, quantity=10, unit_price=Decimal("10.00"))
+        # Grand total 106.00
+
+    def credit(self, amount, status=CreditNoteStatus.ISSUED):
+        credit_note = CreditNote.objects.create(client=self.db_client, related_invoice=self.invoice, status=status)
+        CreditNoteItem.objects.create(credit_note=credit_note, description="Refund", quantity=1, unit_price=Decimal(amount))
+        return credit_note
+
+    def test_credit_note_totals_match_in_python_and_sql(self):
+        """Test that credit note totals from the mixin and from annotate_totals agree."""
+        from .reports import annotate_totals
+        credit_note = self.credit("12.35")
+        CreditNoteItem.objects.create(credit_note=credit_note, description="Extra", quantity=3, unit_price=Decimal("0.55"))
+        credit_note = CreditNote.objects.get(pk=credit_note.pk)
+        self.assertEqual(credit_note.subtotal, Decimal("14.00"))
+        self.assertEqual(credit_note.tax_amount, Decimal("0.84"))
+        self.assertEqual(credit_note.grand_total, Decimal("14.84"))
+        annotated = annotate_totals(CreditNote.objects.filter(pk=credit_note.pk)).get()
+        self.assertEqual((annotated.db_subtotal, annotated.db_tax, annotated.db_grand_total),
+                         (Decimal("14.00"), Decimal("0.84"), Decimal("14.84")))
+
+    def test_issued_and_applied_credits_reduce_the_balance(self):
+        """Test that balances subtract ISSUED and APPLIED credits, in Python, SQL and the aging report."""
+        from .reports import aging_report, annotate_totals
+        Payment.objects.create(invoice=self.invoice, amount=Decimal("20.00"))
+        self.credit("10.00")
+        self.credit("5.00", status=CreditNoteStatus.APPLIED)
+        self.credit("40.00", status=CreditNoteStatus.DRAFT)
+        self.credit("40.00", status=CreditNoteStatus.CANCELLED)
+
+        invoice = Invoice.objects.get(pk=self.invoice.pk)
+        self.assertEqual(invoice.amount_credited, Decimal("15.90"))
+        self.assertEqual(invoice.balance_due, Decimal("70.10"))
+        annotated = annotate_totals(Invoice.objects.filter(pk=self.invoice.pk)).get()
+        self.assertEqual((annotated.db_credited, annotated.db_balance), (Decimal("15.90"), Decimal("70.10")))
+        with self.assertNumQueries(0):
+            self.assertEqual(annotated.amount_credited, Decimal("15.90"))
+        rows, totals = aging_report()
+        self.assertEqual(totals['total'], Decimal("70.10"))
+
+    def test_credits_settle_the_invoice(self):
+        """Test that issuing and cancelling credit notes moves the invoice status."""
+        credit_note = self.credit("50.00", status=CreditNoteStatus.DRAFT)
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.SENT)
+
+        credit_note.status = CreditNoteStatus.ISSUED
+        credit_note.save()
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.PARTIALLY_PAID)
+
+        Payment.objects.create(invoice=self.invoice, amount=Decimal("53.00")) # 53.00 paid + 53.00 credited
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.PAID)
+
+        credit_note.items.get().delete()
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.PARTIALLY_PAID)
+
+        credit_note.items.create(description="Larger refund", quantity=1, unit_price=Decimal("60.00"))
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.PAID)
+
+        credit_note.status = CreditNoteStatus.CANCELLED
+        credit_note.save()
+        Payment.objects.filter(invoice=self.invoice).get().delete()
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.Status.SENT)
+
+    def test_invoice_list_shows_balance_net_of_credits(self):
+        """Test that the invoice list and detail page show balances less credits."""
+        self.credit("10.00")
+        client = TestClient()
+        client.force_login(self.user)
+        self.assertContains(client.get(reverse('documents:invoice_list')), "95.40")
+        response = client.get(reverse('documents:invoice_detail', args=[self.invoice.pk]))
+        self.assertContains(response, "Credited:")
+        self.assertContains(response, "95.40")
+
+
+class InvoiceFixtureMixin:
+    """
+    Tax off, "<fixture_name> Client", "<fixture_name> Dish" and invoice(),
+    for the tests of payments, statements, sweeps and bulk actions.
+    """
+    fixture_name = "Fixture"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        settings = Setting.get_solo()
+        settings.tax_enabled = False
+        settings.save()
+        cls.db_client = Client.objects.create(name=f"{cls.fixture_name} Client")
+        cls.menu_item = MenuItem.objects.create(name=f"{cls.fixture_name} Dish", unit_price=Decimal("10.00"))
+
+    def invoice(self, total="100.00", due_date=None, client=None, status=Invoice.Status.SENT, paid=None, number=None):
+        """A one-line invoice for total, optionally part paid and with a given invoice number."""
+        invoice = Invoice.objects.create(client=client or self.db_client, status=status, due_date=due_date)
+        InvoiceItem.objects.create(invoice=invoice, menu_item=self.menu_item, quantity=1, unit_price=Decimal(total))
+        if paid:
+            Payment.objects.create(invoice=invoice, amount=Decimal(paid))
+        if number:
+            Invoice.objects.filter(pk=invoice.pk).update(invoice_number=number)
+        return Invoice.objects.get(pk=invoice.pk)
+
+
+class PaymentReceiptTests(InvoiceFixtureMixin, TestCase):
+    fixture_name = "Receipt"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_superuser(username='receipts', email='receipts@example.com', password='password123')
+        cls.other_client = Client.objects.create(name="Other Client")
+
+    def receipt(self, amount):
+        from .models import PaymentReceipt
+        return PaymentReceipt.objects.create(client=self.db_client, amount=Decimal(amount),
+                                             payment_method=PaymentMethod.BANK_TRANSFER, reference_number="TRX-1")
+
+    def test_allocates_oldest_due_first(self):
+        """Test that a receipt pays invoices oldest due date first and part-pays the last one."""
+        from .receipts import allocate_receipt
+        today = timezone.now().date()
+        newest = self.invoice("100.00", today + timedelta(days=10))
+        oldest = self.invoice("100.00", today - timedelta(days=20))
+        middle = self.invoice("100.00", today - timedelta(days=5))
+        Payment.objects.create(invoice=middle, amount=Decimal("30.00"))
+        self.invoice("500.00", today - timedelta(days=30), status=Invoice.Status.DRAFT)
+        self.invoice("500.00", today - timedelta(days=30), client=self.other_client)
+
+        payments = allocate_receipt(self.receipt("200.00"))
+        self.assertEqual([(payment.invoice_id, payment.amount) for payment in payments],
+                         [(oldest.pk, Decimal("100.00")), (middle.pk, Decimal("70.00")), (newest.pk, Decimal("30.00"))])
+        self.assertTrue(all(payment.reference_number == "TRX-1" for payment in payments))
+        statuses = dict(Invoice.objects.filter(pk__in=[oldest.pk, middle.pk, newest.pk]).values_list('pk', 'status'))
+        self.assertEqual(statuses, {oldest.pk: Invoice.Status.PAID, middle.pk: Invoice.Status.PAID,
+                                    newest.pk: Invoice.Status.PARTIALLY_PAID})
+        for invoice in Invoice.objects.filter(pk__in=statuses):
+            self.assertEqual(invoice.settlement_status(), invoice.status)
+
+    def test_overpayment_stays_unallocated(self):
+        """Test that what no open balance can take is left on the receipt and allocated later."""
+        from .receipts import allocate_receipt
+        today = timezone.now().date()
+        first = self.invoice("40.00", today)
+        receipt = self.receipt("100.00")
+        allocate_receipt(receipt)
+        self.assertEqual(receipt.unallocated, Decimal("60.00"))
+        self.assertEqual(allocate_receipt(receipt), [])
+
+        later = self.invoice("80.00", today + timedelta(days=30))
+        payments = allocate_receipt(receipt)
+        self.assertEqual([(payment.invoice_id, payment.amount) for payment in payments], [(later.pk, Decimal("60.00"))])
+        self.assertEqual(receipt.unallocated, Decimal("0.00"))
+        self.assertEqual(Invoice.objects.get(pk=first.pk).status, Invoice.Status.PAID)
+        self.assertEqual(Invoice.objects.get(pk=later.pk).status, Invoice.Status.PARTIALLY_PAID)
+
+    def test_query_count_does_not_grow_with_invoices(self):
+        """Test that allocating across many invoices takes a fixed number of queries."""
+        from .receipts import allocate_receipt
+        today = timezone.now().date()
+        for day in range(12):
+            self.invoice("10.00", today - timedelta(days=day))
+        receipt = self.receipt("115.00")
+        settings = Setting.get_solo()
+        # Savepoint pair, receipt lock, allocated sum, balances, payment insert, status update
+        with self.assertNumQueries(7):
+            payments = allocate_receipt(receipt, settings=settings)
+        self.assertEqual(len(payments), 12)
+        self.assertEqual(Invoice.objects.filter(client=self.db_client, status=Invoice.Status.PAID).count(), 11)
+
+    def test_admin_allocates_new_receipt(self):
+        """Test that adding a receipt in the admin allocates it."""
+        invoice = self.invoice("50.00", timezone.now().date())
+        client = TestClient()
+        client.force_login(self.user)
+        response = client.post(reverse('admin:documents_paymentreceipt_add'), {
+            'client': self.db_client.pk, 'receipt_date': timezone.now().date().isoformat(), 'amount': '75.00',
+            'payment_method': PaymentMethod.BANK_TRANSFER, 'reference_number': 'TRX-9', 'notes': '',
+            'allocations-TOTAL_FORMS': '0', 'allocations-INITIAL_FORMS': '0',
+            'allocations-MIN_NUM_FORMS': '0', 'allocations-MAX_NUM_FORMS': '1000',
+        }, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "allocated to 1 invoice(s)")
+        self.assertContains(response, "RM 25.00 of the receipt")
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, Invoice.Status.PAID)
+        self.assertEqual(invoice.payments.get().amount, Decimal("50.00"))
+
+
+class ReconciliationTests(InvoiceFixtureMixin, TestCase):
+    fixture_name = "Statement"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_superuser(username='reconcile', email='reconcile@example.com', password='password123')
+        cls.acme = Client.objects.create(name="Acme Catering Sdn. Bhd.")
+        cls.bistro = Client.objects.create(name="Bistro Co")
+
+    def statement(self, *rows):
+        header = "Transaction Date,Description,Reference,Payer,Credit\n"
+        return (header + "".join(",".join(row) + "\n" for row in rows)).encode()
+
+    def test_parse_statement(self):
+        """Test that statement columns are found by their usual names and bad rows are reported."""
+        from .reconciliation import parse_statement
+        lines = parse_statement(self.statement(("05/03/2026", "Transfer", "T1", "Acme", "\"1,250.50\""),
+                                               ("2026-03-06", "Fee", "", "", "")))
+        self.assertEqual([(line.row, line.date, line.amount, line.reference) for line in lines],
+                         [(2, date(2026, 3, 5), Decimal("1250.50"), "T1"), (3, date(2026, 3, 6), Decimal("0.00"), "")])
+        with self.assertRaisesMessage(ValueError, "Row 2: unrecognised date"):
+            parse_statement(self.statement(("yesterday", "Transfer", "", "", "10.00")))
+        with self.assertRaisesMessage(ValueError, "no amount column"):
+            parse_statement(b"date,description\n2026-03-05,x\n")
+
+    def test_match_rules(self):
+        """Test matching by reference, invoice number in the description, and payer and amount."""
+        from .reconciliation import AMBIGUOUS, DUPLICATE, IGNORED, MATCHED, UNMATCHED, parse_statement, reconcile
+        by_reference = self.invoice("100.00", client=self.acme, number="INV-2026-1")
+        by_memo = self.invoice("200.00", client=self.acme, number="INV-2026-2")
+        by_amount = self.invoice("300.00", client=self.bistro, number="INV-2026-3")
+        near = self.invoice("450.00", client=self.bistro, number="INV-2026-4")
+        twin_a = self.invoice("75.00", client=self.acme, number="INV-2026-5")
+        twin_b = self.invoice("75.00", client=self.acme, number="INV-2026-6")
+        Payment.objects.create(invoice=by_reference, amount=Decimal("10.00"), payment_date=date(2026, 3, 5),
+                               reference_number="T-OLD")
+        lines = reconcile(parse_statement(self.statement(
+            ("2026-03-05", "IBG transfer", "inv2026-1", "", "90.00"),
+            ("2026-03-05", "Payment for inv 2026-2 thanks", "T2", "", "200.00"),
+            ("2026-03-05", "Transfer", "T3", "BISTRO CO.", "300.00"),
+            ("2026-03-05", "Transfer", "T4", "Bistro Co", "449.50"),
+            ("2026-03-05", "Transfer", "T5", "Acme Catering Sdn Bhd", "75.00"),
+            ("2026-03-05", "Transfer", "T6", "Unknown Payer", "12.00"),
+            ("2026-03-05", "Transfer", "T-OLD", "", "10.00"),
+            ("2026-03-05", "Bank charges", "", "", "-5.00"),
+            ("2026-03-05", "Second payment", "T7", "Bistro Co", "300.00"),
+        )))
+        self.assertEqual([(line.status, line.rule) for line in lines], [
+            (MATCHED, 'reference'), (MATCHED, 'description'), (MATCHED, 'amount'), (MATCHED, 'near amount'),
+            (AMBIGUOUS, 'amount'), (UNMATCHED, ''), (DUPLICATE, ''), (IGNORED, ''),
+            (UNMATCHED, ''), # INV-2026-3 was paid by the third line
+        ])
+        self.assertEqual([line.invoice['pk'] for line in lines[:4]], [by_reference.pk, by_memo.pk, by_amount.pk, near.pk])
+        self.assertEqual([row['pk'] for row in lines[4].candidates], [twin_a.pk, twin_b.pk])
+
+    def test_large_statement_is_matched_and_settled_in_bulk(self):
+        """Test that thousands of lines are matched with two queries and settled with one UPDATE."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .reconciliation import MATCHED, StatementLine, reconcile, record_matches
+        invoices = [self.invoice("100.00", client=self.acme, number=f"INV-2026-{n}") for n in range(1, 21)]
+        lines = [StatementLine(n, date(2026, 3, 5), Decimal("1.00"), f"Part payment INV-2026-{n % 20 + 1}", f"T{n}")
+                 for n in range(2000)]
+        settings = Setting.get_solo()
+        with self.assertNumQueries(2):
+            reconcile(lines, settings=settings)
+        self.assertTrue(all(line.status == MATCHED for line in lines))
+        matches = [(line, line.invoice['pk']) for line in lines]
+        with CaptureQueriesContext(connection) as queries:
+            record_matches(matches, settings=settings)
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        # Inserts are batched only as far as the database's parameter limit requires
+        self.assertEqual(statements.count('UPDATE'), 1)
+        self.assertEqual(set(statements), {'SAVEPOINT', 'RELEASE', 'INSERT', 'UPDATE'})
+        self.assertEqual(Payment.objects.count(), 2000)
+        self.assertEqual(set(Invoice.objects.filter(pk__in=[invoice.pk for invoice in invoices])
+                             .values_list('status', flat=True)), {Invoice.Status.PAID})
+
+    def test_upload_and_review(self):
+        """Test that uploading records the matches and the review page records the chosen invoice."""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        matched = self.invoice("300.00", client=self.bistro, number="INV-2026-11")
+        twin_a = self.invoice("75.00", client=self.acme, number="INV-2026-12")
+        twin_b = self.invoice("75.00", client=self.acme, number="INV-2026-13")
+        client = TestClient()
+        client.force_login(self.user)
+        upload = SimpleUploadedFile("statement.csv", self.statement(
+            ("2026-03-05", "Transfer INV-2026-11", "T1", "", "300.00"),
+            ("2026-03-05", "Transfer", "T2", "Acme Catering Sdn Bhd", "75.00"),
+            ("2026-03-05", "Transfer", "T3", "Nobody", "5.00"),
+        ), content_type='text/csv')
+        response = client.post(reverse('documents:reconcile_statement'), {'statement': upload}, follow=True)
+        self.assertContains(response, "Recorded 1 payment(s) from the statement.")
+        self.assertContains(response, "INV-2026-12")
+        self.assertContains(response, "Nobody")
+        matched.refresh_from_db()
+        self.assertEqual(matched.status, Invoice.Status.PAID)
+
+        response = client.post(reverse('documents:reconcile_review'), {'line-3': str(twin_b.pk)}, follow=True)
+        self.assertContains(response, "Recorded 1 payment(s); 0 line(s) skipped.")
+        self.assertNotContains(response, "Record Chosen Payments")
+        self.assertEqual(Invoice.objects.get(pk=twin_b.pk).status, Invoice.Status.PAID)
+        self.assertEqual(Invoice.objects.get(pk=twin_a.pk).status, Invoice.Status.SENT)
+        self.assertEqual(twin_b.payments.get().reference_number, "T2")
+
+
+class StatusSweepTests(InvoiceFixtureMixin, TestCase):
+    fixture_name = "Sweep"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.today = date(2026, 6, 15)
+
+    def test_sweep_marks_overdue_and_expired_once(self):
+        """Test that the sweep marks overdue invoices and expired quotations, and changes nothing on a rerun."""
+        from .sweeps import sweep_statuses
+        past, future = self.today - timedelta(days=1), self.today + timedelta(days=1)
+        overdue = self.invoice(due_date=past)
+        part_paid = self.invoice(due_date=past, paid="40.00")
+        paid = self.invoice(due_date=past, paid="100.00")
+        not_due = self.invoice(due_date=self.today)
+        draft = self.invoice(due_date=past, status=Invoice.Status.DRAFT)
+        expired = Quotation.objects.create(client=self.db_client, status=Quotation.Status.SENT, valid_until=past)
+        valid = Quotation.objects.create(client=self.db_client, status=Quotation.Status.SENT, valid_until=future)
+        accepted = Quotation.objects.create(client=self.db_client, status=Quotation.Status.ACCEPTED, valid_until=past)
+        settings = Setting.get_solo()
+
+        self.assertEqual(sweep_statuses(today=self.today, settings=settings, dry_run=True),
+                         {'overdue': 2, 'reopened': 0, 'expired': 1})
+        with self.assertNumQueries(3):
+            counts = sweep_statuses(today=self.today, settings=settings)
+        self.assertEqual(counts, {'overdue': 2, 'reopened': 0, 'expired': 1})
+        statuses = dict(Invoice.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[invoice.pk] for invoice in (overdue, part_paid, paid, not_due, draft)],
+                         ['OVERDUE', 'OVERDUE', 'PAID', 'SENT', 'DRAFT'])
+        statuses = dict(Quotation.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[quote.pk] for quote in (expired, valid, accepted)], ['EXPIRED', 'SENT', 'ACCEPTED'])
+        self.assertGreater(Invoice.objects.get(pk=overdue.pk).updated_at, overdue.updated_at)
+
+        self.assertEqual(sweep_statuses(today=self.today, settings=settings), {'overdue': 0, 'reopened': 0, 'expired': 0})
+
+    def test_overdue_invoices_settle_and_reopen(self):
+        """Test that an overdue invoice stays overdue until paid, and is reopened when its due date moves."""
+        from .sweeps import sweep_statuses
+        invoice = self.invoice(due_date=self.today - timedelta(days=10))
+        other = self.invoice(due_date=self.today - timedelta(days=10), paid="30.00")
+        sweep_statuses(today=self.today)
+        invoice.refresh_from_db()
+
+        Payment.objects.create(invoice=invoice, amount=Decimal("60.00"))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, Invoice.Status.OVERDUE)
+        self.assertIn(invoice, Invoice.objects.open())
+        Payment.objects.create(invoice=invoice, amount=Decimal("40.00"))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, Invoice.Status.PAID)
+
+        Invoice.objects.filter(pk=other.pk).update(due_date=self.today + timedelta(days=30))
+        self.assertEqual(sweep_statuses(today=self.today)['reopened'], 1)
+        self.assertEqual(Invoice.objects.get(pk=other.pk).status, Invoice.Status.PARTIALLY_PAID)
+
+    def test_command_reports_counts(self):
+        """Test the sweep_statuses management command."""
+        from io import StringIO
+        from django.core.management import call_command
+        self.invoice(due_date=self.today - timedelta(days=1))
+        out = StringIO()
+        call_command('sweep_statuses', '--date', self.today.isoformat(), '--dry-run', stdout=out)
+        self.assertIn("Would mark 1 invoice(s) overdue", out.getvalue())
+        self.assertEqual(Invoice.objects.filter(status=Invoice.Status.OVERDUE).count(), 0)
+        call_command('sweep_statuses', '--date', self.today.isoformat(), stdout=out)
+        self.assertIn("Marked 1 invoice(s) overdue", out.getvalue())
+
+
+class BulkLifecycleTests(InvoiceFixtureMixin, TestCase):
+    fixture_name = "Bulk"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_superuser(username='bulk', email='bulk@example.com', password='password123')
+        settings = Setting.get_solo()
+        settings.default_payment_terms_days = 30
+        settings.default_validity_days = 14
+        settings.save()
+
+    def invoices(self, count, status=Invoice.Status.DRAFT):
+        return [self.invoice("20.00", status=status).pk for _ in range(count)]
+
+    def test_finalize_matches_single_finalize_in_fixed_queries(self):
+        """Test that bulk finalize sets dates and snapshots like finalize(), in the same queries for any count."""
+        from .bulk import finalize_documents
+        settings = Setting.get_solo()
+        sent = self.invoices(1, status=Invoice.Status.SENT)
+        few, many = self.invoices(2), self.invoices(6)
+        with self.assertNumQueries(7) as few_queries: # Savepoint pair, rows, items, menu items, payments, update
+            finalized, skipped = finalize_documents(Invoice, few + sent, settings=settings)
+        self.assertEqual((len(finalized), skipped), (2, 1))
+        with self.assertNumQueries(7):
+            finalize_documents(Invoice, many, settings=settings)
+
+        single = Invoice.objects.get(pk=self.invoices(1)[0])
+        single.finalize()
+        bulk = Invoice.objects.get(pk=few[0])
+        today = timezone.localdate()
+        self.assertEqual((bulk.status, bulk.issue_date, bulk.due_date),
+                         (Invoice.Status.SENT, today, today + timedelta(days=30)))
+        self.assertEqual(bulk.render_snapshot['totals'], single.render_snapshot['totals'])
+        self.assertEqual(bulk.render_snapshot['items'], single.render_snapshot['items'])
+        self.assertEqual(Invoice.objects.get(pk=sent[0]).issue_date, None)
+
+    def test_finalize_quotations(self):
+        """Test that bulk finalize defaults valid_until from the validity days."""
+        from .bulk import finalize_documents
+        quotation = Quotation.objects.create(client=self.db_client, issue_date=date(2026, 5, 1))
+        QuotationItem.objects.create(quotation=quotation, menu_item=self.menu_item, quantity=1, unit_price=Decimal("10.00"))
+        finalize_documents(Quotation, [quotation.pk])
+        quotation.refresh_from_db()
+        self.assertEqual((quotation.status, quotation.issue_date, quotation.valid_until),
+                         (Quotation.Status.SENT, date(2026, 5, 1), date(2026, 5, 15)))
+        self.assertEqual(quotation.render_snapshot['totals']['grand_total'], str(quotation.grand_total))
+
+    def test_revert_and_cancel_skip_ineligible(self):
+        """Test that revert and cancel change eligible documents with one UPDATE and count the rest."""
+        from .bulk import cancel_documents, finalize_documents, revert_documents
+        drafts = self.invoices(3)
+        finalize_documents(Invoice, drafts[:2])
+        Payment.objects.create(invoice_id=drafts[1], amount=Decimal("5.00"))
+        before = Invoice.objects.get(pk=drafts[0]).updated_at
+        with self.assertNumQueries(3):
+            self.assertEqual(revert_documents(Invoice, drafts), (1, 2))
+        reverted = Invoice.objects.get(pk=drafts[0])
+        self.assertEqual((reverted.status, reverted.issue_date, reverted.due_date, reverted.render_snapshot),
+                         (Invoice.Status.DRAFT, None, None, None))
+        self.assertGreater(reverted.updated_at, before)
+
+        self.assertEqual(cancel_documents(Invoice, drafts), (2, 1)) # The part-paid invoice is kept
+        self.assertEqual(Invoice.objects.get(pk=drafts[1]).status, Invoice.Status.PARTIALLY_PAID)
+        self.assertEqual(cancel_documents(Invoice, drafts), (0, 3))
+
+        quotation = Quotation.objects.create(client=self.db_client, status=Quotation.Status.ACCEPTED)
+        self.assertEqual(cancel_documents(Quotation, [quotation.pk]), (0, 1))
+
+    def test_queue_pdfs_submits_frozen_pages_after_commit(self):
+        """Test that the PDFs of finalized documents go to the PDF workers once the transaction commits."""
+        import tempfile
+        from unittest import mock
+        from .bulk import finalize_documents, queue_pdfs
+        drafts = self.invoices(2)
+        with tempfile.TemporaryDirectory() as directory, self.settings(DOCUMENTS_PDF_DIR=directory), \
+                mock.patch('documents.views.weasyprint', mock.Mock()), \
+                mock.patch('documents.bulk.submit_pdfs') as submit_pdfs:
+            with self.captureOnCommitCallbacks(execute=True):
+                finalized, _ = finalize_documents(Invoice, drafts)
+                self.assertEqual(queue_pdfs(Invoice, finalized), 2)
+                submit_pdfs.assert_not_called()
+            (jobs,), _ = submit_pdfs.call_args
+        self.assertEqual([job[2] for job in jobs],
+                         [f"{directory}/Invoice-{invoice.invoice_number}.pdf" for invoice in finalized])
+        self.assertIn("Bulk Dish", jobs[0][0])
+
+    def test_queued_pdf_failures_are_logged_and_counted(self):
+        """Test that a queued PDF that fails in its worker is logged and counted in PDF_FAILURES."""
+        import tempfile
+        from concurrent.futures import Future
+        from unittest import mock
+        from .bulk import finalize_documents, queue_pdfs
+        from .metrics import PDF_FAILURES
+        futures = [Future(), Future()]
+        before = PDF_FAILURES.values.get('document="invoice"', 0)
+        with tempfile.TemporaryDirectory() as directory, self.settings(DOCUMENTS_PDF_DIR=directory), \
+                mock.patch('documents.views.weasyprint', mock.Mock()), \
+                mock.patch('documents.bulk.submit_pdfs', return_value=futures):
+            with self.captureOnCommitCallbacks(execute=True):
+                finalized, _ = finalize_documents(Invoice, self.invoices(2))
+                queue_pdfs(Invoice, finalized)
+            futures[0].set_result(f"{directory}/ok.pdf")
+            with self.assertLogs('documents.bulk', 'ERROR') as logs:
+                futures[1].set_exception(OSError("Disk full"))
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn(f"Invoice-{finalized[1].invoice_number}.pdf", logs.output[0])
+        self.assertIn("Disk full", logs.output[0])
+        self.assertEqual(PDF_FAILURES.values.get('document="invoice"', 0), before + 1)
+
+    def test_admin_actions(self):
+        """Test the bulk actions on the invoice changelist and their summary messages."""
+        drafts = self.invoices(2)
+        sent = self.invoices(1, status=Invoice.Status.SENT)
+        client = TestClient()
+        client.force_login(self.user)
+        url = reverse('admin:documents_invoice_changelist')
+        response = client.post(url, {'action': 'finalize_selected_with_pdfs', '_selected_action': drafts + sent},
+                               follow=True)
+        self.assertContains(response, "Finalized 2 invoice(s).")
+        self.assertContains(response, "Skipped 1 invoice(s) not in Draft.")
+        self.assertContains(response, "PDFs not queued")
+        self.assertEqual(Invoice.objects.filter(pk__in=drafts, status=Invoice.Status.SENT).count(), 2)
+
+        response = client.post(url, {'action': 'cancel_selected', '_selected_action': drafts}, follow=True)
+        self.assertContains(response, "Cancelled 2 invoice(s).")
@@ -33,6 +33,16 @@ urlpatterns = [
     path('clients/new/', views.client_create_view, name='client_create'),
     path('client/<int:pk>/edit/', views.client_update_view, name='client_update'),
     path('delivery-orders/', views.delivery_order_list_view, name='delivery_order_list'),
+    path('payments/reconcile/', views.reconcile_statement_view, name='reconcile_statement'),
+    path('payments/reconcile/review/', views.reconcile_review_view, name='reconcile_review'),
+    path('reports/aging/', views.aging_report_view, name='aging_report'),
+    path('reports/prep-list/', views.prep_list_view, name='prep_list'),
+    path('reports/prep-list/csv/', views.prep_list_csv_view, name='prep_list_csv'),
+    path('reports/prep-list/pdf/', views.prep_list_pdf_view, name='prep_list_pdf'),
+    path('reports/purchasing/', views.purchasing_list_view, name='purchasing_list'),
+    path('reports/purchasing/csv/', views.purchasing_list_csv_view, name='purchasing_list_csv'),
+    path('calendar/', views.calendar_view, name='calendar'),
+    path('calendar/feed/', views.calendar_feed_view, name='calendar_feed'),
     path('delivery-order/<int:pk>/pdf/', views.generate_delivery_order_pdf, name='delivery_order_pdf'),
     path('delivery-order/<int:pk>/', views.delivery_order_detail_view, name='delivery_order_detail'),
     
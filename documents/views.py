@@ -1,3 +1,8 @@
+import csv
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings as django_settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import get_object_or_404, redirect, render # Helpful shortcut
 from django.http import JsonResponse, Http404, HttpResponse
@@ -7,6 +12,8 @@ from django.urls import reverse, reverse_lazy
 from django.core.paginator import Paginator
 from django.contrib import messages
 from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
 
 # Import WeasyPrint (will cause error if not installed)
 try:
@@ -29,8 +36,52 @@ from .forms import (
     QuotationForm, QuotationItemFormSet, 
     InvoiceForm, InvoiceItemFormSet,
     OrderForm, OrderItemFormSet,
-    ClientForm
+    ClientForm, DateRangeForm, StatementUploadForm
 )
+from .metrics import PDF_RENDER_SECONDS, PDF_TEMPLATE_SECONDS, PDF_BYTES, PDF_FAILURES
+from .routers import use_read_replica
+from .snapshots import frozen_render_context
+from .caching import conditional_document, row_cache_context
+from .fulfillment import fulfillment_ledger
+from .production import prep_list, purchasing_list
+from . import reconciliation
+from .reports import annotate_totals, credited_amount
+from . import schedule
+
+
+def _render_pdf(request, document, template_name, context):
+    """
+    Render a PDF template with WeasyPrint and return the PDF bytes,
+    recording render time (and the template's share of it), size and
+    failures per document type.
+    """
+    try:
+        with PDF_RENDER_SECONDS.time(document=document):
+            with PDF_TEMPLATE_SECONDS.time(document=document):
+                html_string = render_to_string(template_name, context)
+            html = weasyprint.HTML(string=html_string, base_url=request.build_absolute_uri('/'))
+            pdf_file = html.write_pdf()
+    except Exception:
+        PDF_FAILURES.inc(document=document)
+        raise
+    PDF_BYTES.observe(len(pdf_file), document=document)
+    return pdf_file
+
+
+def _document_for_render(model, pk, select_related, prefetch_related):
+    """
+    Load a quotation or invoice for its detail page or PDF in one query.
+    Finalized documents render from their frozen snapshot. Drafts have
+    their relations prefetched and use the live settings.
+    Returns (document, items, settings).
+    """
+    document = get_object_or_404(model.objects.select_related(*select_related), pk=pk)
+    if document.render_snapshot:
+        return frozen_render_context(document)
+    prefetch_related_objects([document], *prefetch_related)
+    settings = Setting.get_solo()
+    document.get_totals(settings)
+    return document, document.items.all(), settings # Items are served from the prefetch
 
 
 # Create your views here.
@@ -197,6 +248,8 @@ def create_invoice_from_order(request, pk):
 
 
 @login_required
+@use_read_replica
+@conditional_document(Quotation)
 def generate_quotation_pdf(request, pk):
     """
     View to generate and return a PDF representation of a Quotation.
@@ -204,11 +257,11 @@ def generate_quotation_pdf(request, pk):
     if not weasyprint:
         return HttpResponse("PDF generation library (WeasyPrint) is not installed correctly.", status=500)
 
-    quotation = get_object_or_404(Quotation, pk=pk) # Moved outside try for redirect
+    quotation, items, settings = _document_for_render( # Moved outside try for redirect
+        Quotation, pk, ['client', 'previous_version'], ['items__menu_item']
+    )
 
     try:
-        settings = Setting.get_solo()
-        items = quotation.items.all()
         is_draft = (quotation.status == Quotation.Status.DRAFT)
 
         context = {
@@ -217,9 +270,7 @@ def generate_quotation_pdf(request, pk):
             'settings': settings,
             'is_draft': is_draft,
         }
-        html_string = render_to_string('documents/pdf/quotation_pdf.html', context)
-        html = weasyprint.HTML(string=html_string, base_url=request.build_absolute_uri('/'))
-        pdf_file = html.write_pdf()
+        pdf_file = _render_pdf(request, 'quotation', 'documents/pdf/quotation_pdf.html', context)
 
         response = HttpResponse(pdf_file, content_type='application/pdf')
         filename = f"Quotation-{quotation.quotation_number or quotation.pk}.pdf"
@@ -237,6 +288,8 @@ def generate_quotation_pdf(request, pk):
         return redirect(reverse('documents:quotation_detail', args=[pk]))
 
 @login_required
+@use_read_replica
+@conditional_document(Invoice)
 def generate_invoice_pdf(request, pk):
     """
     View to generate and return a PDF representation of an Invoice.
@@ -244,11 +297,11 @@ def generate_invoice_pdf(request, pk):
     if not weasyprint:
         return HttpResponse("PDF generation library (WeasyPrint) is not installed correctly.", status=500)
 
-    invoice = get_object_or_404(Invoice, pk=pk) # Moved outside try for redirect
+    invoice, items, settings = _document_for_render( # Moved outside try for redirect
+        Invoice, pk, ['client', 'related_order', 'related_quotation'], ['items__menu_item', 'payments']
+    )
 
     try:
-        settings = Setting.get_solo()
-        items = invoice.items.all()
         is_draft = (invoice.status == Invoice.Status.DRAFT)
 
         context = {
@@ -257,9 +310,7 @@ def generate_invoice_pdf(request, pk):
             'settings': settings,
             'is_draft': is_draft,
         }
-        html_string = render_to_string('documents/pdf/invoice_pdf.html', context)
-        html = weasyprint.HTML(string=html_string, base_url=request.build_absolute_uri('/'))
-        pdf_file = html.write_pdf()
+        pdf_file = _render_pdf(request, 'invoice', 'documents/pdf/invoice_pdf.html', context)
 
         response = HttpResponse(pdf_file, content_type='application/pdf')
         filename = f"Invoice-{invoice.invoice_number or invoice.pk}.pdf"
@@ -278,50 +329,62 @@ def generate_invoice_pdf(request, pk):
 
 
 @login_required # Ensures only logged-in users can access this view
+@use_read_replica
 def quotation_list_view(request):
     """
     Display a list of all quotations.
     """
-    quotations = Quotation.objects.select_related('client').all() # Fetch all quotations, optimize client access
     settings = Setting.get_solo() # Get settings for currency symbol etc.
+    # Only the columns the list shows, with the client and totals in the same query
+    quotations = annotate_totals(Quotation.objects.for_list(), settings)
 
     context = {
         'quotations': quotations,
         'settings': settings, # Pass settings to template
+        **row_cache_context(),
     }
     # Render the template we just created
     return render(request, 'documents/quotation_list.html', context)
 
 
 @login_required
+@use_read_replica
 def invoice_list_view(request):
     """
     Display a list of all invoices.
     """
-    invoices = Invoice.objects.select_related('client').all() # Fetch all invoices
     settings = Setting.get_solo() # Get settings for currency symbol etc.
+    # List columns only, with totals, payments and credits summed in the same query
+    invoices = annotate_totals(Invoice.objects.for_list(), settings)
 
     context = {
         'invoices': invoices,
         'settings': settings,
+        **row_cache_context(),
     }
     # Point to the new template we will create
     return render(request, 'documents/invoice_list.html', context)
 
 
 @login_required
+@conditional_document(Quotation)
 def quotation_detail_view(request, pk):
     """
     Display the details of a single quotation.
     """
-    quotation = get_object_or_404(Quotation.objects.select_related('client', 'previous_version'), pk=pk)
-    items = quotation.items.select_related('menu_item').all()
-    settings = Setting.get_solo()
+    quotation, items, settings = _document_for_render(
+        Quotation, pk, ['client', 'previous_version'], ['items__menu_item']
+    )
 
     # --- Add this line to fetch linked orders ---
     # Uses the related_name 'orders' from Order.related_quotation
     # Limit to 5 most recent for now, can add pagination later
-    linked_orders = quotation.orders.all().order_by('-created_at')[:5]
+    linked_orders = list(quotation.orders.prefetch_related('items').order_by('-created_at')[:5])
+    if linked_orders:
+        # Orders are live documents, so they use the live settings even when the quotation is frozen
+        order_settings = Setting.get_solo() if quotation.render_snapshot else settings
+        for order in linked_orders:
+            order.get_totals(order_settings)
     # --- End Add ---
 
     context = {
@@ -334,13 +397,14 @@ def quotation_detail_view(request, pk):
 
 
 @login_required
+@conditional_document(Invoice)
 def invoice_detail_view(request, pk):
     """
     Display the details of a single invoice.
     """
-    invoice = get_object_or_404(Invoice.objects.select_related('client', 'related_order', 'related_quotation'), pk=pk)
-    items = invoice.items.select_related('menu_item').all()
-    settings = Setting.get_solo()
+    invoice, items, settings = _document_for_render(
+        Invoice, pk, ['client', 'related_order', 'related_quotation'], ['items__menu_item', 'payments']
+    )
 
     context = {
         'invoice': invoice,
@@ -376,31 +440,38 @@ def revert_invoice_to_draft(request, pk):
     return redirect(redirect_url)
 
 @login_required
+@use_read_replica
 def order_list_view(request):
     """
     Display a list of all orders.
     """
     # Order by event_date (most recent first), then by creation date
-    orders = Order.objects.select_related('client').all().order_by('-event_date', '-created_at')
     settings = Setting.get_solo()
+    orders = annotate_totals(Order.objects.for_list(), settings).order_by('-event_date', '-created_at')
 
     context = {
         'orders': orders,
         'settings': settings,
+        **row_cache_context(),
     }
     return render(request, 'documents/order_list.html', context)
 
 
 @login_required
+@conditional_document(Order)
 def order_detail_view(request, pk):
     """
     Display the details of a single order.
     """
     order = get_object_or_404(
-        Order.objects.select_related('client', 'related_quotation'), pk=pk
+        Order.objects.select_related('client', 'related_quotation').prefetch_related('items__menu_item'), pk=pk
     )
-    items = order.items.select_related('menu_item').all()
+    items = order.items.all() # Served from the prefetch, shared with the totals
     settings = Setting.get_solo()
+    order.get_totals(settings)
+    ledger = fulfillment_ledger([order.pk]) # Delivered/remaining for every line in one query
+    for item in items:
+        item.fulfillment = ledger.get(item.pk)
 
     context = {
         'order': order,
@@ -411,16 +482,18 @@ def order_detail_view(request, pk):
 
 
 @login_required
+@use_read_replica
 def client_list_view(request):
     """
     Display a list of all clients.
     """
-    clients = Client.objects.all().order_by('name') # Order by name
+    clients = Client.objects.for_list().order_by('name') # Order by name
     settings = Setting.get_solo() # For currency or other settings if needed in template later
 
     context = {
         'clients': clients,
         'settings': settings, # Though not strictly needed for client list yet
+        **row_cache_context(),
     }
     return render(request, 'documents/client_list.html', context)
 
@@ -436,9 +509,12 @@ def client_detail_view(request, pk):
     # Fetch related documents
     # Using prefetch_related for M2M or reverse FKs if needed,
     # but direct related manager access is fine for now given separate queries are likely
-    quotations = client.quotations.all().order_by('-issue_date', '-created_at')[:10] # Get latest 10
-    orders = client.orders.all().order_by('-event_date', '-created_at')[:10]
-    invoices = client.invoices.all().order_by('-issue_date', '-created_at')[:10]
+    quotations = client.quotations.for_list().prefetch_related('items').order_by('-issue_date', '-created_at')[:10] # Get latest 10
+    orders = client.orders.for_list().prefetch_related('items').order_by('-event_date', '-created_at')[:10]
+    invoices = (client.invoices.for_list().prefetch_related('items', 'payments')
+                .annotate(db_credited=credited_amount(settings)).order_by('-issue_date', '-created_at')[:10])
+    for document in (*quotations, *orders, *invoices):
+        document.get_totals(settings) # From the prefetched items, without reading the settings per row
 
     context = {
         'client': client,
@@ -774,6 +850,8 @@ def client_update_view(request, pk):
 
 
 @login_required
+@use_read_replica
+@conditional_document(DeliveryOrder)
 def generate_delivery_order_pdf(request, pk):
     """
     View to generate and return a PDF representation of a DeliveryOrder.
@@ -800,12 +878,8 @@ def generate_delivery_order_pdf(request, pk):
             # No 'is_draft' needed for DOs unless you introduce a draft status for them
         }
 
-        # Render the HTML template to a string
-        html_string = render_to_string('documents/pdf/delivery_order_pdf.html', context)
-
-        # Generate PDF using WeasyPrint
-        html = weasyprint.HTML(string=html_string, base_url=request.build_absolute_uri('/'))
-        pdf_file = html.write_pdf()
+        # Render the template and generate the PDF using WeasyPrint
+        pdf_file = _render_pdf(request, 'delivery_order', 'documents/pdf/delivery_order_pdf.html', context)
 
         # Create the HTTP response
         response = HttpResponse(pdf_file, content_type='application/pdf')
@@ -839,6 +913,8 @@ def generate_delivery_order_pdf(request, pk):
 
 
 @login_required # Changed from @staff_member_required for consistency with other frontend PDF views
+@use_read_replica
+@conditional_document(Order)
 def generate_order_pdf(request, pk):
     """
     View to generate and return a PDF representation of an Order.
@@ -848,14 +924,14 @@ def generate_order_pdf(request, pk):
 
     # Use select_related to optimize fetching related data
     order = get_object_or_404(
-        Order.objects.select_related('client', 'related_quotation'),
+        Order.objects.select_related('client', 'related_quotation').prefetch_related('items__menu_item'),
         pk=pk
     )
 
     try:
         settings = Setting.get_solo()
-        # Use select_related for OrderItem's MenuItem
-        items = order.items.select_related('menu_item').all()
+        items = order.items.all() # Served from the prefetch, shared with the totals
+        order.get_totals(settings)
 
         # Prepare context for the template
         context = {
@@ -864,12 +940,8 @@ def generate_order_pdf(request, pk):
             'settings': settings,
         }
 
-        # Render the HTML template to a string
-        html_string = render_to_string('documents/pdf/order_pdf.html', context)
-
-        # Generate PDF using WeasyPrint
-        html = weasyprint.HTML(string=html_string, base_url=request.build_absolute_uri('/'))
-        pdf_file = html.write_pdf()
+        # Render the template and generate the PDF using WeasyPrint
+        pdf_file = _render_pdf(request, 'order', 'documents/pdf/order_pdf.html', context)
 
         # Create the HTTP response
         response = HttpResponse(pdf_file, content_type='application/pdf')
@@ -924,13 +996,14 @@ def create_order_from_quotation(request, pk):
 
 
 @login_required
+@use_read_replica
 def delivery_order_list_view(request):
     """
     Display a list of all Delivery Orders with pagination.
     """
-    delivery_order_list = DeliveryOrder.objects.select_related(
-        'order', 'order__client'
-    ).all().order_by('-delivery_date', '-created_at') # Order by delivery date, then creation
+    delivery_order_list = DeliveryOrder.objects.for_list().order_by(
+        '-delivery_date', '-created_at'
+    ) # Order by delivery date, then creation
 
     paginator = Paginator(delivery_order_list, 10) # Show 10 delivery orders per page
     page_number = request.GET.get('page')
@@ -938,12 +1011,14 @@ def delivery_order_list_view(request):
 
     context = {
         'page_obj': page_obj,
-        'title': 'Delivery Orders'
+        'title': 'Delivery Orders',
+        **row_cache_context(),
     }
     return render(request, 'documents/delivery_order_list.html', context)
 
 
 @login_required
+@conditional_document(DeliveryOrder)
 def delivery_order_detail_view(request, pk):
     """
     Display the details of a single Delivery Order.
@@ -974,3 +1049,361 @@ def delivery_order_detail_view(request, pk):
 
     
 
+
+
+@staff_member_required
+def profile_list_view(request):
+    """
+    Admin page listing the most recent request profiles saved by
+    RequestProfilingMiddleware.
+    """
+    from django.contrib import admin
+    from .profiling import recent_profiles
+
+    context = {
+        **admin.site.each_context(request),
+        'profiles': recent_profiles(),
+        'title': 'Request profiles',
+    }
+    return render(request, 'documents/profile_list.html', context)
+
+
+@staff_member_required
+def profile_download_view(request, name, kind):
+    """
+    Download a saved profile: kind 'prof' is a pstats file (snakeviz,
+    python -m pstats), 'collapsed' is input for flamegraph.pl/speedscope.
+    """
+    from django.http import FileResponse
+    from .profiling import profile_dir, recent_profiles
+
+    if kind not in ('prof', 'collapsed') or name not in {profile['name'] for profile in recent_profiles()}:
+        raise Http404("Profile not found.")
+    path = profile_dir() / f"{name}.{kind}"
+    if not path.exists():
+        raise Http404("Profile not found.")
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of the documents metrics, merged across all
+    worker processes. Only answers clients in DOCUMENTS_METRICS_ALLOWED_IPS.
+    Behind a reverse proxy every request comes from the proxy's address, so
+    when DOCUMENTS_METRICS_TOKEN is set the request must also carry it as
+    "Authorization: Bearer <token>" or come from a staff user.
+    """
+    import hmac
+    from django.conf import settings as django_settings
+    from . import metrics
+
+    allowed = getattr(django_settings, 'DOCUMENTS_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404()
+    token = getattr(django_settings, 'DOCUMENTS_METRICS_TOKEN', None)
+    if token and not request.user.is_staff:
+        given = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            raise Http404()
+    return HttpResponse(metrics.render_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+@use_read_replica
+def aging_report_view(request):
+    """
+    Accounts receivable aging: open invoice balances per client, bucketed by
+    days overdue. Computed in one grouped query (see documents.reports).
+    """
+    from .reports import aging_report
+
+    settings = Setting.get_solo()
+    rows, totals = aging_report(settings=settings)
+    context = {
+        'rows': rows,
+        'totals': totals,
+        'settings': settings,
+        'as_of': timezone.now().date(),
+    }
+    return render(request, 'documents/aging_report.html', context)
+
+
+RECONCILIATION_SESSION_KEY = 'documents_reconciliation'
+
+
+@staff_member_required
+def reconcile_statement_view(request):
+    """
+    Upload a bank statement CSV. Lines matching exactly one open invoice
+    are recorded as payments straight away, in one bulk insert and one
+    status update (see documents.reconciliation); ambiguous and unmatched
+    lines are kept in the session for the review page.
+    """
+    if request.method == 'POST':
+        form = StatementUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            settings = Setting.get_solo()
+            lines = reconciliation.reconcile(form.cleaned_data['statement'], settings=settings)
+            matched = [(line, line.invoice['pk']) for line in lines if line.status == reconciliation.MATCHED]
+            reconciliation.record_matches(matched, settings=settings)
+            counts = {status: 0 for status in (reconciliation.MATCHED, reconciliation.AMBIGUOUS,
+                                               reconciliation.UNMATCHED, reconciliation.DUPLICATE,
+                                               reconciliation.IGNORED)}
+            for line in lines:
+                counts[line.status] += 1
+            request.session[RECONCILIATION_SESSION_KEY] = {
+                'counts': counts,
+                'ambiguous': [line.as_dict() for line in lines if line.status == reconciliation.AMBIGUOUS],
+                'unmatched': [line.as_dict() for line in lines if line.status == reconciliation.UNMATCHED],
+            }
+            messages.success(request, f"Recorded {counts[reconciliation.MATCHED]} payment(s) from the statement.")
+            return redirect('documents:reconcile_review')
+    else:
+        form = StatementUploadForm()
+    return render(request, 'documents/reconcile_upload.html', {'form': form})
+
+
+@staff_member_required
+def reconcile_review_view(request):
+    """
+    The ambiguous lines of the last uploaded statement, each with the
+    invoices it could pay; the ones chosen are recorded together, like the
+    statement's matches. Also lists the lines nothing matched.
+    """
+    result = request.session.get(RECONCILIATION_SESSION_KEY)
+    if result is None:
+        return redirect('documents:reconcile_statement')
+    ambiguous = [reconciliation.StatementLine.from_dict(data) for data in result['ambiguous']]
+
+    if request.method == 'POST':
+        chosen, skipped = [], []
+        for line in ambiguous:
+            allowed = {str(candidate['pk']) for candidate in line.candidates}
+            choice = request.POST.get(f'line-{line.row}')
+            if choice in allowed:
+                chosen.append((line, int(choice)))
+            else:
+                skipped.append(line)
+        reconciliation.record_matches(chosen)
+        result['ambiguous'] = []
+        result['unmatched'] += [line.as_dict() for line in skipped]
+        request.session[RECONCILIATION_SESSION_KEY] = result
+        messages.success(request, f"Recorded {len(chosen)} payment(s); {len(skipped)} line(s) skipped.")
+        return redirect('documents:reconcile_review')
+
+    context = {
+        'counts': result['counts'],
+        'ambiguous': ambiguous,
+        'unmatched': result['unmatched'],
+    }
+    return render(request, 'documents/reconcile_review.html', context)
+
+
+def _production_range(request):
+    """
+    The DateRangeForm for a prep or purchasing list request and its (start, end); the
+    coming week when no dates are given, (None, None) when they are invalid.
+    """
+    if 'start' in request.GET or 'end' in request.GET:
+        data = request.GET
+    else:
+        today = timezone.localdate()
+        data = {'start': today, 'end': today + timedelta(days=6)}
+    form = DateRangeForm(data, max_days=getattr(django_settings, 'DOCUMENTS_PREP_LIST_MAX_DAYS', 62))
+    if not form.is_valid():
+        return form, None, None
+    return form, form.cleaned_data['start'], form.cleaned_data['end']
+
+
+@login_required
+def prep_list_view(request):
+    """
+    Kitchen prep list: quantity of each menu item across the confirmed and
+    in-progress orders of a date range, per event date and grouping label.
+    One grouped query, cached until an order or item changes (see
+    documents.production). Not sent to a replica: a lagging read would be
+    cached as current. ?refresh=<seconds> reloads the page on a kitchen screen.
+    """
+    form, start, end = _production_range(request)
+    refresh = None
+    if request.GET.get('refresh'):
+        try:
+            refresh = min(max(int(request.GET['refresh']), 10), 3600)
+        except ValueError:
+            pass
+    context = {
+        'form': form,
+        'start': start,
+        'end': end,
+        'prep': prep_list(start, end) if start else None,
+        'refresh': refresh,
+    }
+    return render(request, 'documents/prep_list.html', context)
+
+
+@login_required
+def prep_list_csv_view(request):
+    """The prep list as CSV, one line per event date, grouping label and menu item."""
+    form, start, end = _production_range(request)
+    if start is None:
+        return HttpResponse("; ".join(form.non_field_errors() or ["Invalid dates."]), status=400)
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="prep-list-{start}-{end}.csv"'
+    writer = csv.writer(response)
+    writer.writerow(['Event date', 'Group', 'Menu item', 'Unit', 'Quantity', 'Orders'])
+    for day in prep_list(start, end)['days']:
+        for group in day['groups']:
+            for line in group['lines']:
+                writer.writerow([day['date'].isoformat(), group['label'], line['name'], line['unit_label'],
+                                 line['quantity'], line['orders']])
+    return response
+
+
+@login_required
+def prep_list_pdf_view(request):
+    """The prep list as a PDF to print for the kitchen."""
+    if not weasyprint:
+        return HttpResponse("PDF generation library (WeasyPrint) is not installed correctly.", status=500)
+    form, start, end = _production_range(request)
+    if start is None:
+        return HttpResponse("; ".join(form.non_field_errors() or ["Invalid dates."]), status=400)
+    context = {
+        'prep': prep_list(start, end),
+        'start': start,
+        'end': end,
+        'settings': Setting.get_solo(),
+        'generated_at': timezone.localtime(),
+    }
+    pdf_file = _render_pdf(request, 'prep_list', 'documents/pdf/prep_list_pdf.html', context)
+    response = HttpResponse(pdf_file, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="prep-list-{start}-{end}.pdf"'
+    return response
+
+
+@login_required
+def purchasing_list_view(request):
+    """
+    Purchasing list: the ingredients the production orders of a date range
+    need, per event date, exploded through the menu items' recipes in one
+    grouped query (see documents.production). Cached like the prep list.
+    """
+    form, start, end = _production_range(request)
+    context = {
+        'form': form,
+        'start': start,
+        'end': end,
+        'purchasing': purchasing_list(start, end) if start else None,
+    }
+    return render(request, 'documents/purchasing_list.html', context)
+
+
+@login_required
+def purchasing_list_csv_view(request):
+    """The purchasing list as CSV, one line per event date and ingredient."""
+    form, start, end = _production_range(request)
+    if start is None:
+        return HttpResponse("; ".join(form.non_field_errors() or ["Invalid dates."]), status=400)
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="purchasing-list-{start}-{end}.csv"'
+    writer = csv.writer(response)
+    writer.writerow(['Event date', 'Ingredient', 'Unit', 'Quantity'])
+    for day in purchasing_list(start, end)['days']:
+        for line in day['lines']:
+            writer.writerow([day['date'].isoformat(), line['name'], line['unit'], line['quantity']])
+    return response
+
+
+@login_required
+@use_read_replica
+def calendar_view(request):
+    """
+    Month (?view=month, the default) or week (?view=week) calendar of order
+    event dates and delivery dates around ?date=, with revenue and
+    headcount per day. Only the visible window is queried (see
+    documents.schedule).
+    """
+    try:
+        day = date.fromisoformat(request.GET.get('date', ''))
+    except ValueError:
+        day = timezone.localdate()
+    view = 'week' if request.GET.get('view') == 'week' else 'month'
+    if view == 'week':
+        start, end = schedule.week_window(day)
+        previous, following = day - timedelta(days=7), day + timedelta(days=7)
+    else:
+        start, end = schedule.month_window(day)
+        first = day.replace(day=1)
+        previous = (first - timedelta(days=1)).replace(day=1)
+        following = (first + timedelta(days=31)).replace(day=1)
+
+    settings = Setting.get_solo()
+    days = schedule.calendar_window(start, end, settings)
+    # Month totals leave out the neighbouring months' days that fill the grid
+    summaries = [entry['summary'] for entry in days
+                 if entry['summary'] and (view == 'week' or entry['date'].month == day.month)]
+    context = {
+        'view': view,
+        'day': day,
+        'start': start,
+        'end': end,
+        'weeks': [days[i:i + 7] for i in range(0, len(days), 7)],
+        'previous': previous,
+        'following': following,
+        'today': timezone.localdate(),
+        'settings': settings,
+        'period_revenue': sum((summary['revenue'] for summary in summaries), Decimal('0.00')),
+        'period_headcount': sum((summary['headcount'] for summary in summaries), Decimal('0.00')),
+        'period_orders': sum(summary['orders'] for summary in summaries),
+    }
+    return render(request, 'documents/calendar.html', context)
+
+
+@login_required
+@use_read_replica
+def calendar_feed_view(request):
+    """
+    JSON feed of calendar days for ?start=&end= (at most
+    schedule.MAX_WINDOW_DAYS days; default the current month's grid), with
+    links to the previous and next windows of the same length.
+    """
+    if 'start' in request.GET or 'end' in request.GET:
+        form = DateRangeForm(request.GET, max_days=schedule.MAX_WINDOW_DAYS)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        start, end = form.cleaned_data['start'], form.cleaned_data['end']
+    else:
+        start, end = schedule.month_window(timezone.localdate())
+
+    feed_url = reverse('documents:calendar_feed')
+    length = end - start + timedelta(days=1)
+    days = []
+    for entry in schedule.calendar_window(start, end):
+        days.append({
+            'date': entry['date'],
+            'summary': entry['summary'],
+            'orders': [{
+                'id': order['pk'],
+                'number': order['order_number'],
+                'title': order['title'],
+                'status': order['status'],
+                'client': order['client_name'],
+                'grand_total': order['grand_total'],
+                'headcount': order['headcount'],
+                'url': reverse('documents:order_detail', args=[order['pk']]),
+            } for order in entry['orders']],
+            'deliveries': [{
+                'id': delivery['pk'],
+                'number': delivery['do_number'],
+                'status': delivery['status'],
+                'order_number': delivery['order_number'],
+                'client': delivery['client_name'],
+                'url': reverse('documents:delivery_order_detail', args=[delivery['pk']]),
+            } for delivery in entry['deliveries']],
+        })
+    return JsonResponse({
+        'start': start,
+        'end': end,
+        'days': days,
+        'previous': f"{feed_url}?start={start - length}&end={start - timedelta(days=1)}",
+        'next': f"{feed_url}?start={end + timedelta(days=1)}&end={end + length}",
+    })